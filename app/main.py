@@ -1,15 +1,24 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Path
+from fastapi import FastAPI, HTTPException, Query, Path
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, HttpUrl
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Union, Literal, AsyncIterator
+from contextlib import asynccontextmanager
+import asyncio
 import os
+import json
+import math
 from dotenv import load_dotenv
 import logging
+from .services.assets import inline_images
 from .services.google_docs import GoogleDocsService
 from .services.ai_converter import AIConverter
 from .services.github_service import GitHubService
+from .services.job_queue import JobQueue, QueueFullError
+from .services.drive_watcher import DriveChangeWatcher
+from .services.health import CircuitOpenError, HealthMonitor
+from .services.pipeline import ConversionPipeline, CONVERT_STAGES, BATCH_STAGES, EXPORT_MODE, default_target_path
 
 # Configure logging
 logging.basicConfig(
@@ -22,11 +31,29 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 # Pydantic models for request/response validation
+ConversionMode = Literal["local", "llm", "hybrid", "export"]
+
 class DocumentRequest(BaseModel):
     doc_id: str
     target_path: Optional[str] = None
     branch_name: Optional[str] = None
     create_pr: bool = True
+    mode: Optional[ConversionMode] = None
+
+class BatchDocumentRequest(BaseModel):
+    doc_ids: List[str] = []
+    folder_id: Optional[str] = None
+    branch_name: Optional[str] = None
+    create_pr: bool = True
+    mode: Optional[ConversionMode] = None
+
+class FolderSyncRequest(BaseModel):
+    folder_id: str
+    nav_section: Optional[str] = None
+    target_dir: Optional[str] = None
+    branch_name: Optional[str] = None
+    create_pr: bool = True
+    mode: Optional[ConversionMode] = None
 
 class ConversionResponse(BaseModel):
     status: str
@@ -35,10 +62,90 @@ class ConversionResponse(BaseModel):
     pr_url: Optional[HttpUrl] = None
     message: str
 
+class BatchDocumentResult(BaseModel):
+    doc_id: str
+    status: str
+    title: Optional[str] = None
+    path: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchConversionResponse(BaseModel):
+    status: str
+    branch: Optional[str] = None
+    pr_url: Optional[HttpUrl] = None
+    documents: List[BatchDocumentResult]
+    message: str
+
+class ChangeSyncResult(BaseModel):
+    documents: List[str]
+    job_ids: List[str] = []
+
 class DocumentInfo(BaseModel):
     title: str
     last_modified: datetime
     url: HttpUrl
+    revision_id: Optional[str] = None
+    version: Optional[str] = None
+    size: Optional[int] = None
+
+class JobAccepted(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+
+class JobStatus(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    stages: Dict[str, str]
+    result: Optional[Union[ConversionResponse, BatchConversionResponse]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # When the job was first parked waiting for a dependency's circuit to close
+    parked_at: Optional[datetime] = None
+
+# Initialize services
+docs_service = GoogleDocsService()
+ai_converter = AIConverter()
+github_service = GitHubService()
+pipeline = ConversionPipeline(docs_service, ai_converter, github_service)
+job_queue = JobQueue(handlers={
+    "convert": pipeline.convert_document,
+    "convert_batch": pipeline.convert_batch,
+    "sync_folder": pipeline.convert_batch,
+})
+
+# Upper bound on explicitly listed documents per batch request
+BATCH_MAX_DOCUMENTS = int(os.getenv('BATCH_MAX_DOCUMENTS', '500'))
+drive_watcher = DriveChangeWatcher(docs_service, job_queue, batch_size=BATCH_MAX_DOCUMENTS)
+
+# Dependencies are probed in the background; /api/status only reads the results
+health_monitor = HealthMonitor()
+health_monitor.register("google_docs", docs_service.check_service, docs_service.breaker)
+health_monitor.register("github", github_service.check_service, github_service.breaker)
+health_monitor.register("ai_converter", ai_converter.check_service, ai_converter.backend.breaker)
+if ai_converter.bulk_backend is not ai_converter.backend:
+    health_monitor.register("ai_converter_bulk", lambda: ai_converter.check_service(bulk=True),
+                            ai_converter.bulk_backend.breaker)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start the conversion workers, the health monitor (and the Drive change
+    watcher, if enabled) with the app and stop them on shutdown
+    """
+    await job_queue.start()
+    await health_monitor.start()
+    watch_task = None
+    if os.getenv('DRIVE_WATCH_ENABLED', 'false').lower() == 'true':
+        watch_task = asyncio.create_task(drive_watcher.run())
+    yield
+    if watch_task:
+        watch_task.cancel()
+    await health_monitor.stop()
+    await job_queue.stop()
 
 # Initialize FastAPI app with metadata
 app = FastAPI(
@@ -53,7 +160,8 @@ app = FastAPI(
     """,
     version="1.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -65,10 +173,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-docs_service = GoogleDocsService()
-ai_converter = AIConverter()
-github_service = GitHubService()
+def _unavailable(error: CircuitOpenError) -> HTTPException:
+    """503 for a call refused by an open circuit, telling clients when to retry"""
+    return HTTPException(status_code=503, detail=str(error),
+                         headers={"Retry-After": str(max(1, math.ceil(error.retry_in)))})
 
 @app.get("/", tags=["Health"])
 async def root():
@@ -91,114 +199,212 @@ async def get_document_info(
     Get metadata about a Google Document without converting it
     """
     try:
-        doc_info = docs_service.get_document_info(doc_id)
+        doc_info = await docs_service.get_document_info(doc_id)
         return DocumentInfo(
             title=doc_info["title"],
             last_modified=doc_info["last_modified"],
-            url=f"https://docs.google.com/document/d/{doc_id}"
+            url=f"https://docs.google.com/document/d/{doc_id}",
+            revision_id=doc_info["revision_id"],
+            version=doc_info["version"],
+            size=doc_info["size"]
         )
+    except CircuitOpenError as e:
+        raise _unavailable(e)
     except Exception as e:
         logger.error(f"Error fetching document info: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/convert", 
-          response_model=ConversionResponse,
+          response_model=JobAccepted,
+          status_code=202,
           tags=["Conversion"])
-async def convert_document(
-    request: DocumentRequest,
-    background_tasks: BackgroundTasks
-):
+async def convert_document(request: DocumentRequest):
     """
-    Convert a Google Doc to Markdown and update MkDocs documentation
+    Queue a Google Doc for conversion to Markdown and MkDocs update.
+    Returns a job ID immediately; poll /api/jobs/{job_id} for progress.
     """
     try:
-        # Get document content
-        doc_content = docs_service.get_document_content(request.doc_id)
-        
-        # Generate branch name if not provided
-        branch_name = request.branch_name or f"doc_update_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        
-        # Determine target path
-        target_path = request.target_path
-        if not target_path:
-            clean_title = "".join(c if c.isalnum() or c in ('-', '_') else '_' 
-                                for c in doc_content["title"]).lower()
-            target_path = f"docs/{clean_title}.md"
-
-        # Convert to markdown
-        markdown_content = await ai_converter.convert_to_markdown(doc_content['raw_content'])
-
-        # Create new branch
-        await github_service.create_branch(branch_name)
-
-        # Commit changes
-        file_url = await github_service.commit_markdown_file(
-            file_path=target_path,
-            content=markdown_content,
-            commit_message=f"Update documentation: {doc_content['title']}",
-            branch=branch_name
-        )
-
-        # Update navigation
-        await github_service.update_mkdocs_nav(
-            new_file_path=target_path,
-            title=doc_content['title'],
-            branch=branch_name
+        job = job_queue.submit("convert", request.model_dump(), CONVERT_STAGES)
+    except QueueFullError as e:
+        logger.warning(f"Rejecting conversion of {request.doc_id}: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "error": str(e),
+                "doc_id": request.doc_id,
+                "timestamp": datetime.now().isoformat()
+            },
+            headers={"Retry-After": "30"}
         )
 
-        # Create PR if requested
-        pr_url = None
-        if request.create_pr:
-            pr_url = await github_service.create_pull_request(
-                branch_name=branch_name,
-                title=f"Documentation Update: {doc_content['title']}",
-                body=f"""
-## Automated Documentation Update
-
-This PR contains updates from Google Docs document: {doc_content['title']}
-
-### Changes:
-- Added/Updated: `{target_path}`
-- Updated MkDocs navigation
-- Source: Google Doc ID `{request.doc_id}`
+    return JobAccepted(
+        job_id=job.id,
+        status=job.status,
+        status_url=f"/api/jobs/{job.id}"
+    )
 
-Please review the changes and merge to update the documentation site.
-                """.strip()
-            )
+@app.post("/api/convert/batch",
+          response_model=JobAccepted,
+          status_code=202,
+          tags=["Conversion"])
+async def convert_batch(request: BatchDocumentRequest):
+    """
+    Queue many Google Docs (listed IDs and/or a Drive folder) for conversion.
+    All documents land on one branch as a single commit with one mkdocs.yml
+    update and one Pull Request.
+    """
+    if not request.doc_ids and not request.folder_id:
+        raise HTTPException(status_code=400, detail="Provide doc_ids or folder_id")
+    if len(request.doc_ids) > BATCH_MAX_DOCUMENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BATCH_MAX_DOCUMENTS} documents per batch"
+        )
 
-        return ConversionResponse(
-            status="success",
-            title=doc_content['title'],
-            github_url=file_url,
-            pr_url=pr_url,
-            message="Documentation update completed successfully"
+    try:
+        job = job_queue.submit("convert_batch", request.model_dump(), BATCH_STAGES)
+    except QueueFullError as e:
+        logger.warning(f"Rejecting batch conversion: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            },
+            headers={"Retry-After": "30"}
         )
 
-    except Exception as e:
-        logger.error(f"Error in conversion process: {str(e)}")
+    return JobAccepted(
+        job_id=job.id,
+        status=job.status,
+        status_url=f"/api/jobs/{job.id}"
+    )
+
+@app.post("/api/sync/folder",
+          response_model=JobAccepted,
+          status_code=202,
+          tags=["Conversion"])
+async def sync_folder(request: FolderSyncRequest):
+    """
+    Queue a sync of a whole Drive folder tree (or shared drive). Every Google Doc
+    below the folder is converted to docs/<target_dir>/<subfolders>/<title>.md and
+    the folder structure becomes nested sections under one mkdocs.yml nav section
+    (nav_section, default the folder name), all in one commit and Pull Request.
+    """
+    try:
+        job = job_queue.submit("sync_folder", {**request.model_dump(), "recursive": True}, BATCH_STAGES)
+    except QueueFullError as e:
+        logger.warning(f"Rejecting folder sync of {request.folder_id}: {str(e)}")
         raise HTTPException(
-            status_code=500,
+            status_code=503,
             detail={
                 "error": str(e),
-                "doc_id": request.doc_id,
+                "folder_id": request.folder_id,
                 "timestamp": datetime.now().isoformat()
-            }
+            },
+            headers={"Retry-After": "30"}
         )
 
+    return JobAccepted(
+        job_id=job.id,
+        status=job.status,
+        status_url=f"/api/jobs/{job.id}"
+    )
+
+@app.post("/api/sync/changes",
+          response_model=ChangeSyncResult,
+          tags=["Conversion"])
+async def sync_changes():
+    """
+    Poll the Google Drive change feed now and queue batch conversions, of at
+    most BATCH_MAX_DOCUMENTS documents each, for the documents changed since
+    the last checkpoint
+    """
+    try:
+        return ChangeSyncResult(**await drive_watcher.poll())
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except Exception as e:
+        logger.error(f"Error syncing Drive changes: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/api/convert/{doc_id}/stream", tags=["Conversion"])
+async def stream_conversion(
+    doc_id: str = Path(..., description="The Google Document ID"),
+    mode: Optional[ConversionMode] = Query(None, description="Conversion mode: local, llm, hybrid or export (optional)")
+):
+    """
+    Stream the Markdown conversion of a Google Doc as Server-Sent Events for previews.
+    Emits a "start" event with the title, "markdown" events with each piece of
+    output as the model produces it, then "done", or "error" if the conversion
+    fails or the model output is truncated, in which case the Markdown received
+    so far is incomplete. Nothing is committed to GitHub.
+    """
+    mode = pipeline.conversion_mode(mode)
+    try:
+        if mode == EXPORT_MODE:
+            doc_content = await pipeline.export_document(doc_id)
+        else:
+            doc_content = await docs_service.get_document_content(doc_id)
+    except CircuitOpenError as e:
+        raise _unavailable(e)
+    except Exception as e:
+        logger.error(f"Error fetching document for streaming: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events() -> AsyncIterator[str]:
+        yield _sse("start", {"doc_id": doc_id, "title": doc_content['title']})
+        try:
+            if mode == EXPORT_MODE:
+                # Exports convert in one local step, so the result is a single event
+                markdown_content, _ = pipeline.convert_export(doc_content)
+                yield _sse("markdown", {"text": markdown_content})
+            else:
+                async for text in ai_converter.stream_markdown(doc_content.pop('raw_content'), mode=mode):
+                    yield _sse("markdown", {"text": text})
+            yield _sse("done", {"doc_id": doc_id})
+        except Exception as e:
+            logger.error(f"Error streaming conversion of {doc_id}: {str(e)}")
+            yield _sse("error", {"error": str(e), "doc_id": doc_id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/jobs/{job_id}",
+         response_model=JobStatus,
+         tags=["Conversion"])
+async def get_job_status(
+    job_id: str = Path(..., description="The job ID returned by /api/convert")
+):
+    """
+    Get the status and per-stage progress of a conversion job
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JobStatus(**job.to_dict())
+
 @app.get("/api/status", tags=["Health"])
 async def get_service_status():
     """
-    Get the status of all connected services
+    Get the status of all connected services, as last probed by the health
+    monitor (every HEALTH_CHECK_INTERVAL seconds); nothing is called here
     """
     try:
-        status = {
-            "google_docs": await docs_service.check_service(),
-            "github": await github_service.check_service(),
-            "ai_converter": await ai_converter.check_service(),
-        }
+        checks = health_monitor.status()
+        status = {name: check["healthy"] for name, check in checks.items()}
         return {
             "status": "healthy" if all(status.values()) else "degraded",
             "services": status,
+            "checks": checks,
+            "google_transport": docs_service.transport_stats(),
+            "llm_backends": ai_converter.backend_stats(),
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
@@ -211,7 +417,8 @@ async def get_service_status():
 async def create_pull_request(
     doc_id: str = Query(..., description="The Google Document ID"),
     branch_name: Optional[str] = Query(None, description="Custom branch name (optional)"),
-    pr_title: Optional[str] = Query(None, description="Custom PR title (optional)")
+    pr_title: Optional[str] = Query(None, description="Custom PR title (optional)"),
+    mode: Optional[ConversionMode] = Query(None, description="Conversion mode: local, llm, hybrid or export (optional)")
 ):
     """
     Create a GitHub Pull Request for documentation updates.
@@ -223,37 +430,40 @@ async def create_pull_request(
     5. Creates a Pull Request
     """
     try:
-        # Get document content
-        doc_content = docs_service.get_document_content(doc_id)
-        
+        # Get document content and convert to markdown
+        mode = pipeline.conversion_mode(mode)
+        if mode == EXPORT_MODE:
+            title, markdown_content, images = await pipeline.export_markdown(doc_id)
+            doc_content = {"title": title}
+        else:
+            doc_content = await docs_service.get_document_content(doc_id)
+            images = inline_images(doc_content['raw_content'])
+            markdown_content = await ai_converter.convert_to_markdown(doc_content.pop('raw_content'), mode=mode)
+
         # Generate branch name if not provided
         branch_name = branch_name or f"doc_update_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        
-        # Convert to markdown
-        markdown_content = await ai_converter.convert_to_markdown(doc_content['raw_content'])
 
         # Create file path from document title
-        clean_title = "".join(c if c.isalnum() or c in ('-', '_') else '_' 
-                            for c in doc_content["title"]).lower()
-        file_path = f"docs/{clean_title}.md"
-
-        # Create new branch
-        await github_service.create_branch(branch_name)
-
-        # Commit changes
-        file_url = await github_service.commit_markdown_file(
-            file_path=file_path,
-            content=markdown_content,
-            commit_message=f"Update documentation: {doc_content['title']}",
-            branch=branch_name
-        )
+        file_path = default_target_path(doc_content["title"])
+
+        # Link images to copies committed with the page
+        stored = await pipeline.fetch_images(doc_id, images)
+        markdown_content, assets = await pipeline.localize_images(markdown_content, file_path, stored)
+
+        # Nothing to propose if main already has this exact content
+        if await github_service.is_unchanged(file_path, markdown_content):
+            return ConversionResponse(
+                status="unchanged",
+                title=doc_content['title'],
+                github_url=f"https://github.com/{github_service.repo_name}/blob/main/{file_path}",
+                message="Documentation is already up to date, no Pull Request created"
+            )
 
-        # Update navigation
-        await github_service.update_mkdocs_nav(
-            new_file_path=file_path,
-            title=doc_content['title'],
-            branch=branch_name
-        )
+        # Commit the page and navigation update as one commit on a new branch
+        builder = github_service.commit_builder(branch_name)
+        await pipeline.stage_document(builder, file_path, markdown_content, doc_content['title'], assets)
+        await builder.commit(f"Update documentation: {doc_content['title']}")
+        file_url = f"https://github.com/{github_service.repo_name}/blob/{branch_name}/{file_path}"
 
         # Create PR with custom or default title
         pr_title = pr_title or f"Documentation Update: {doc_content['title']}"
@@ -289,6 +499,8 @@ Once this PR is merged, the documentation will be automatically deployed.
             message=f"Pull Request created successfully: {pr_url}"
         )
 
+    except CircuitOpenError as e:
+        raise _unavailable(e)
     except Exception as e:
         logger.error(f"Error creating pull request: {str(e)}")
         raise HTTPException(
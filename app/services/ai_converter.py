@@ -1,9 +1,14 @@
-from typing import Dict, Optional
-from openai import OpenAI
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 import os
 import json
+import asyncio
 import logging
+from .conversion_cache import ConversionCache, cache_key
+from .assets import inline_images, resolve_image_refs
+from .docs_walker import walk_document
+from .local_converter import LocalMarkdownConverter, document_links, resolve_link_refs
+from .llm_backends import CONVERT_INSTRUCTION, LLMBackend, ResponseTruncatedError, create_backend
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,158 +17,365 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+SYSTEM_PROMPT = """
+You are a document converter that transforms Google Docs content into clean, well-formatted Markdown.
+Follow these rules:
+1. Maintain the document structure (headings, lists, etc.)
+2. Preserve all content and formatting
+3. Use proper Markdown syntax
+4. Handle special elements like code blocks, tables, and links correctly
+5. The input is compact Markdown generated from the document; <u>, <sup> and <sub> mark underlined, superscript and subscript text
+6. Keep image and link references such as ![](image:kix.abc123) and [text](link:1a2b3c4d) exactly as given
+7. Return only the converted Markdown without any explanations
+"""
+
+CHUNK_PROMPT = "This is part {index} of {total} of a longer document. Convert only this part and do not add a preamble or closing remarks."
+
+# local: deterministic converter only, llm: always the model,
+# hybrid: local unless the document is too messy for it
+CONVERSION_MODES = ("local", "llm", "hybrid")
+
 class AIConverter:
     def __init__(self):
-        """Initialize the AI converter with OpenAI credentials"""
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        
-        if not self.api_key:
-            raise ValueError("OpenAI API key not found in environment variables")
-        
-        self.client = OpenAI(
-            api_key=self.api_key
-        )
-
-    async def convert_to_markdown(self, doc_content: Dict) -> str:
         """
-        Convert Google Docs content to Markdown using OpenAI's GPT-4o-mini model
-        
+        Initialize the AI converter. LLM_BACKEND selects the endpoint
+        conversions go to and LLM_BULK_BACKEND the one batch and folder
+        jobs use, e.g. a cheaper deployment; see llm_backends.
+        """
+        self.backend = create_backend(os.getenv('LLM_BACKEND', 'openai'))
+        # An empty LLM_BULK_BACKEND= in .env means unset, like a missing one
+        bulk_backend = os.getenv('LLM_BULK_BACKEND') or self.backend.name
+        self.bulk_backend = self.backend if bulk_backend == self.backend.name else create_backend(bulk_backend)
+
+        self.temperature = 0.3  # Lower temperature for more consistent output
+        self.max_tokens = 4000
+
+        # Long documents are split at headings into chunks converted concurrently
+        self.chunk_chars = int(os.getenv('LLM_CHUNK_CHARS', '8000'))
+        self.chunk_concurrency = int(os.getenv('LLM_CHUNK_CONCURRENCY', '4'))
+
+        # Converted Markdown keyed on document revision and conversion settings
+        self.cache = ConversionCache() if os.getenv('CONVERSION_CACHE_ENABLED', 'true').lower() == 'true' else None
+
+        self.local_converter = LocalMarkdownConverter()
+        self.default_mode = os.getenv('CONVERSION_MODE', 'llm')
+
+    def _settings_hash(self, backend: LLMBackend) -> str:
+        """Hash of everything besides the document that affects the output"""
+        return cache_key(SYSTEM_PROMPT, CHUNK_PROMPT, backend.model, str(self.temperature),
+                         str(self.max_tokens), str(self.chunk_chars))
+
+    def _cache_key(self, doc_content, backend: LLMBackend) -> Optional[str]:
+        """Cache key for a Docs API document, or None if it has no revision"""
+        if self.cache is None or not isinstance(doc_content, dict):
+            return None
+        doc_id = doc_content.get('documentId')
+        revision_id = doc_content.get('revisionId')
+        if not doc_id or not revision_id:
+            return None
+        return cache_key(doc_id, revision_id, self._settings_hash(backend))
+
+    async def convert_to_markdown(self, doc_content: Dict, mode: Optional[str] = None, bulk: bool = False) -> str:
+        """
+        Convert Google Docs content to Markdown, locally or using the configured LLM backend
+
         Args:
             doc_content (Dict): The Google Doc content dictionary
-            
+            mode (str, optional): "local", "llm" or "hybrid"; defaults to CONVERSION_MODE
+            bulk (bool): Part of a batch or folder job; uses LLM_BULK_BACKEND
+
         Returns:
             str: Converted Markdown content
         """
+        markdown, blocks = self._walk(doc_content, mode)
+        if markdown is not None:
+            return markdown
+
+        backend = self.bulk_backend if bulk else self.backend
         try:
-            # Extract the text content
-            if isinstance(doc_content, dict):
-                content = self._extract_structured_content(doc_content)
-            else:
-                content = str(doc_content)
-
-            # Prepare the prompt for GPT
-            system_prompt = """
-            You are a document converter that transforms Google Docs content into clean, well-formatted Markdown.
-            Follow these rules:
-            1. Maintain the document structure (headings, lists, etc.)
-            2. Preserve all content and formatting
-            3. Use proper Markdown syntax
-            4. Handle special elements like code blocks, tables, and links correctly
-            5. Return only the converted Markdown without any explanations
-            """
-
-            user_prompt = f"Convert this Google Docs content to Markdown:\n\n{content}"
-
-            # Make API call to OpenAI
-            response = await self._call_openai(system_prompt, user_prompt)
-            
-            return response
+            # Unchanged revisions skip the model entirely
+            key = self._cache_key(doc_content, backend)
+            if key:
+                cached = await self.cache.get(key)
+                if cached is not None:
+                    logger.info(f"Conversion cache hit for {doc_content.get('documentId')}")
+                    return self._resolve_refs(cached, doc_content)
+
+            # Split the compact document representation along headings
+            chunks = self._split_sections(blocks)
+            # Sections that did not change since an earlier conversion are reused
+            cached = await self._cached_sections(chunks, backend)
+
+            # Convert chunks concurrently and stitch them back in order
+            semaphore = asyncio.Semaphore(self.chunk_concurrency)
+            parts = await asyncio.gather(*(
+                self._convert_section(chunk, index, len(chunks), semaphore, backend, cached[index - 1])
+                for index, chunk in enumerate(chunks, start=1)
+            ))
+            response = '\n\n'.join(part for part in parts if part)
+
+            if key:
+                await self.cache.put(key, response)
+
+            # Cached output keeps the stable image and link references; they
+            # are resolved per fetch as contentUris expire
+            return self._resolve_refs(response, doc_content)
 
         except Exception as e:
             logger.error(f"Error in convert_to_markdown: {str(e)}")
             raise
 
-    def _extract_structured_content(self, doc_content: Dict) -> str:
+    async def stream_markdown(self, doc_content: Dict, mode: Optional[str] = None) -> AsyncIterator[str]:
         """
-        Extract structured content from Google Docs JSON
-        
+        Convert Google Docs content to Markdown, yielding output as it is produced.
+        The first chunk is streamed token by token while the remaining chunks
+        convert concurrently in the background and are emitted in order.
+
         Args:
             doc_content (Dict): The Google Doc content dictionary
-            
-        Returns:
-            str: Extracted text content with basic structure
+            mode (str, optional): "local", "llm" or "hybrid"; defaults to CONVERSION_MODE
+
+        Yields:
+            str: Successive pieces of the converted Markdown
+
+        Raises:
+            ResponseTruncatedError: The streamed chunk hit max_tokens; the
+                pieces already yielded are incomplete and nothing is cached
         """
+        images = inline_images(doc_content) if isinstance(doc_content, dict) else {}
+        links = document_links(doc_content) if isinstance(doc_content, dict) else {}
+        if not images and not links:
+            async for piece in self._stream_markdown(doc_content, mode):
+                yield piece
+            return
+
+        # References are resolved a line at a time so none is cut in half
+        buffered = ''
+        async for piece in self._stream_markdown(doc_content, mode):
+            buffered += piece
+            cut = buffered.rfind('\n') + 1
+            if cut:
+                yield resolve_link_refs(resolve_image_refs(buffered[:cut], images), links)
+                buffered = buffered[cut:]
+        if buffered:
+            yield resolve_link_refs(resolve_image_refs(buffered, images), links)
+
+    async def _stream_markdown(self, doc_content: Dict, mode: Optional[str]) -> AsyncIterator[str]:
+        markdown, blocks = self._walk(doc_content, mode)
+        if markdown is not None:
+            yield markdown
+            return
+
+        key = self._cache_key(doc_content, self.backend)
+        if key:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        chunks = self._split_sections(blocks)
+        cached = await self._cached_sections(chunks, self.backend)
+        semaphore = asyncio.Semaphore(self.chunk_concurrency)
+        # Later chunks start converting right away so they are ready when reached
+        pending = [
+            asyncio.create_task(self._convert_section(chunk, index, len(chunks), semaphore, self.backend,
+                                                      cached[index - 1]))
+            for index, chunk in enumerate(chunks[1:], start=2)
+        ]
+        parts = []
         try:
-            content = []
-            body = doc_content.get('body', {})
-            
-            for element in body.get('content', []):
-                # Handle paragraphs
-                if 'paragraph' in element:
-                    paragraph = element['paragraph']
-                    
-                    # Check for heading level
-                    style = paragraph.get('paragraphStyle', {}).get('namedStyleType', '')
-                    heading_level = 0
-                    if 'HEADING' in style:
-                        try:
-                            heading_level = int(style.split('_')[1])
-                        except (IndexError, ValueError):
-                            heading_level = 0
-
-                    # Extract text
-                    text_elements = []
-                    for elem in paragraph.get('elements', []):
-                        if 'textRun' in elem:
-                            text = elem['textRun'].get('content', '')
-                            text_elements.append(text)
-                    
-                    text = ''.join(text_elements)
-                    
-                    # Add appropriate markdown syntax
-                    if heading_level > 0:
-                        content.append(f"{'#' * heading_level} {text}")
-                    else:
-                        content.append(text)
-
-                # Handle tables (simplified)
-                elif 'table' in element:
-                    content.append("\n[Table content here]\n")
-
-            return '\n'.join(content)
+            if cached[0] is not None:
+                parts.append(cached[0])
+                yield cached[0]
+            else:
+                streamed = []
+                async with semaphore:
+                    async for token in self.backend.stream(SYSTEM_PROMPT, self._chunk_prompt(chunks[0], 1, len(chunks)),
+                                                           self.temperature, self.max_tokens):
+                        streamed.append(token)
+                        yield token
+                parts.append(''.join(streamed).strip())
+                section_key = self._section_key(chunks[0], self.backend)
+                if section_key:
+                    await self.cache.put(section_key, parts[0])
 
-        except Exception as e:
-            logger.error(f"Error in _extract_structured_content: {str(e)}")
-            return str(doc_content)
+            for task in pending:
+                part = await task
+                parts.append(part)
+                yield '\n\n' + part
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if key:
+            await self.cache.put(key, '\n\n'.join(part for part in parts if part))
 
-    async def _call_openai(self, system_prompt: str, user_prompt: str) -> str:
+    @staticmethod
+    def _resolve_refs(markdown: str, doc_content: Dict) -> str:
+        """Replace the image and link references of model output with the document's URLs"""
+        if not isinstance(doc_content, dict):
+            return markdown
+        return resolve_link_refs(resolve_image_refs(markdown, inline_images(doc_content)), document_links(doc_content))
+
+    def _walk(self, doc_content: Dict, mode: Optional[str]) -> Tuple[Optional[str], Optional[List[Tuple[int, str]]]]:
+        """
+        One pass over the document feeding the local converter and the prompt
+        representation, whichever the mode needs
+
+        Args:
+            doc_content (Dict): The Google Doc content dictionary
+            mode (str, optional): "local", "llm" or "hybrid"; defaults to CONVERSION_MODE
+
+        Returns:
+            Tuple: (Markdown from the local converter, or None when the model
+                must be used; structured blocks for the model prompt)
+        """
+        mode = mode or self.default_mode
+        if mode not in CONVERSION_MODES:
+            raise ValueError(f"Unknown conversion mode: {mode}")
+        if not isinstance(doc_content, dict):
+            raise TypeError(f"Expected a Docs API document, got {type(doc_content).__name__}")
+
+        local = self.local_converter.visitor(doc_content) if mode != "llm" else None
+        prompt = self.local_converter.prompt_visitor(doc_content) if mode != "local" else None
+        walk_document(doc_content, [visitor for visitor in (local, prompt) if visitor])
+
+        if local:
+            conversion = local.result()
+            if mode == "local" or not self.local_converter.needs_llm(conversion):
+                return conversion.markdown, None
+            logger.info(f"Hybrid conversion of {doc_content.get('documentId')} falls back to the LLM "
+                        f"({len(conversion.issues)} issues)")
+        return None, prompt.prompt_blocks()
+
+    def _split_sections(self, blocks: List[Tuple[int, str]]) -> List[str]:
         """
-        Make an API call to OpenAI
-        
+        Split blocks into chunks of at most chunk_chars along the heading tree:
+        a section is kept whole, subsections included, when it fits and is
+        otherwise split at its highest-level subheadings, down to paragraph
+        boundaries for oversized sections without subheadings. Boundaries only
+        depend on the section itself, so an edit elsewhere in the document
+        leaves every other chunk, and its cached conversion, unchanged.
+
         Args:
-            system_prompt (str): The system instruction
-            user_prompt (str): The user content to convert
-            
+            blocks (List[Tuple[int, str]]): (heading level, text) per block as returned by
+                _walk, level 0 for body text
+
         Returns:
-            str: The converted markdown content
+            List[str]: Chunk texts in document order
         """
+        chunks: List[str] = []
+        self._split_section(blocks, chunks)
+        return chunks or ['']
+
+    def _split_section(self, blocks: List[Tuple[int, str]], chunks: List[str]):
+        if not blocks:
+            return
+        # Blocks are Markdown, so they stay separated by blank lines
+        if sum(len(text) + 2 for _, text in blocks) <= self.chunk_chars:
+            chunks.append('\n\n'.join(text for _, text in blocks))
+            return
+
+        levels = [level for level, _ in blocks[1:] if level > 0]
+        if levels:
+            top = min(levels)
+            groups: List[List[Tuple[int, str]]] = [[]]
+            for i, block in enumerate(blocks):
+                if i > 0 and block[0] == top:
+                    groups.append([])
+                groups[-1].append(block)
+            # A short lead-in (usually just the heading) rides along with the first subsection
+            if len(groups) > 1 and sum(len(text) + 2 for _, text in groups[0] + groups[1]) <= self.chunk_chars:
+                groups[:2] = [groups[0] + groups[1]]
+            for group in groups:
+                self._split_section(group, chunks)
+            return
+
+        current: List[str] = []
+        size = 0
+        for _, text in blocks:
+            if current and size + len(text) + 2 > self.chunk_chars:
+                chunks.append('\n\n'.join(current))
+                current, size = [], 0
+            current.append(text)
+            size += len(text) + 2
+        chunks.append('\n\n'.join(current))
+
+    def _chunk_prompt(self, chunk: str, index: int, total: int) -> str:
+        user_prompt = f"{CONVERT_INSTRUCTION}\n\n{chunk}"
+        if total > 1:
+            user_prompt = f"{CHUNK_PROMPT.format(index=index, total=total)}\n\n{user_prompt}"
+        return user_prompt
+
+    def _section_key(self, chunk: str, backend: LLMBackend) -> Optional[str]:
+        """Content address of a chunk's conversion, shared by every document and revision"""
+        if self.cache is None:
+            return None
+        return cache_key('section', chunk, self._settings_hash(backend))
+
+    async def _cached_sections(self, chunks: List[str], backend: LLMBackend) -> List[Optional[str]]:
+        """Previously converted Markdown per chunk, None where the chunk changed"""
+        if self.cache is None:
+            return [None] * len(chunks)
+        cached = await self.cache.get_many([self._section_key(chunk, backend) for chunk in chunks])
+        reused = sum(part is not None for part in cached)
+        if reused:
+            logger.info(f"Reusing {reused} of {len(chunks)} unchanged sections")
+        return cached
+
+    async def _convert_section(self, chunk: str, index: int, total: int, semaphore: asyncio.Semaphore,
+                               backend: LLMBackend, cached: Optional[str] = None) -> str:
+        """Convert a chunk unless it was converted before, storing new output per section"""
+        if cached is not None:
+            return cached
+        part = await self._convert_chunk(chunk, index, total, semaphore, backend)
+        key = self._section_key(chunk, backend)
+        if key:
+            await self.cache.put(key, part)
+        return part
+
+    async def _convert_chunk(self, chunk: str, index: int, total: int, semaphore: asyncio.Semaphore,
+                             backend: LLMBackend) -> str:
+        """
+        Convert one chunk. A chunk whose output is truncated is split in half
+        and each half converted separately.
+
+        Args:
+            chunk (str): Chunk text
+            index (int): 1-based position of the chunk
+            total (int): Number of chunks in the document
+            semaphore (asyncio.Semaphore): Bounds concurrent model calls
+            backend (LLMBackend): Endpoint doing the conversion
+
+        Returns:
+            str: Converted Markdown for the chunk
+        """
+        user_prompt = self._chunk_prompt(chunk, index, total)
+
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",  # Using gpt-4o-mini as requested
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,  # Lower temperature for more consistent output
-                max_tokens=4000
+            async with semaphore:
+                return await backend.complete(SYSTEM_PROMPT, user_prompt, self.temperature, self.max_tokens)
+        except ResponseTruncatedError as e:
+            lines = chunk.split('\n')
+            if len(lines) < 2:
+                logger.warning(f"Chunk {index}/{total} is truncated and cannot be split further")
+                return e.partial
+            middle = len(lines) // 2
+            logger.info(f"Chunk {index}/{total} was truncated, splitting it in two")
+            halves = await asyncio.gather(
+                self._convert_chunk('\n'.join(lines[:middle]), index, total, semaphore, backend),
+                self._convert_chunk('\n'.join(lines[middle:]), index, total, semaphore, backend)
             )
-            
-            return response.choices[0].message.content.strip()
+            return '\n\n'.join(halves)
 
-        except Exception as e:
-            logger.error(f"Error in OpenAI API call: {str(e)}")
-            raise
+    def backend_stats(self) -> Dict[str, Dict]:
+        """Rate limiter state per configured backend"""
+        return {backend.name: backend.stats() for backend in {self.backend, self.bulk_backend}}
 
-    async def check_service(self):
-        """Check if AI converter service is working"""
+    async def check_service(self, bulk: bool = False):
+        """Check if AI converter service (or its bulk backend) is working"""
         try:
-            # Test with a simple conversion to verify the service works
-            test_content = "Test content for service check"
-            system_prompt = "Convert this to markdown:"
-            user_prompt = test_content
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,
-                max_tokens=100
-            )
-            
-            # If we get a response, the service is working
-            return bool(response.choices[0].message.content)
+            return await (self.bulk_backend if bulk else self.backend).check()
         except Exception as e:
             logger.error(f"AI converter service check failed: {str(e)}")
             return False
@@ -0,0 +1,274 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import asyncio
+import functools
+import hashlib
+import html
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import sqlite3
+import threading
+import logging
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; images are committed as downloaded without it
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Model prompts reference images as ![alt](image:<inlineObjectId>): stable
+# across fetches, unlike the signed contentUri, and short
+_IMAGE_REF_RE = re.compile(r'!\[([^\]]*)\]\(image:([^)\s]+)\)')
+# The same reference inside HTML table cells
+_IMAGE_TAG_REF_RE = re.compile(r'<img src="image:([^"\s]+)" alt="([^"]*)">')
+
+_EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/svg+xml': '.svg',
+}
+
+
+def image_ref(object_id: str) -> str:
+    """Stable reference to an inline object used in prompts and cached Markdown"""
+    return f"image:{object_id}"
+
+
+def inline_images(document: Dict) -> Dict[str, Dict[str, str]]:
+    """
+    Images embedded in a Docs API document
+
+    Args:
+        document (Dict): documents.get response
+
+    Returns:
+        Dict: inlineObjectId -> {"uri": contentUri, "source": sourceUri or "", "alt": title or description,
+            "version": hash of the image properties}
+    """
+    images = {}
+    for object_id, inline_object in document.get('inlineObjects', {}).items():
+        embedded = inline_object.get('inlineObjectProperties', {}).get('embeddedObject', {})
+        properties = embedded.get('imageProperties', {})
+        if properties.get('contentUri'):
+            images[object_id] = {
+                "uri": properties['contentUri'],
+                "source": properties.get('sourceUri', ''),
+                "alt": embedded.get('title') or embedded.get('description') or '',
+                "version": _image_version(properties),
+            }
+    return images
+
+
+def _image_version(properties: Dict) -> str:
+    """
+    Hash of the image properties that change the rendered image (crop,
+    brightness, contrast...). The signed contentUri changes on every fetch
+    and is left out.
+    """
+    rendering = {key: value for key, value in properties.items() if key != 'contentUri'}
+    return hashlib.sha256(json.dumps(rendering, sort_keys=True).encode()).hexdigest()[:20]
+
+
+def resolve_image_refs(markdown: str, images: Dict[str, Dict[str, str]]) -> str:
+    """Replace image:<id> references with the images' contentUri; unknown references keep only their alt text"""
+    def replace(match):
+        image = images.get(match.group(2))
+        if image is None:
+            return match.group(1)
+        return f"![{match.group(1) or image['alt']}]({image['uri']})"
+
+    def replace_tag(match):
+        image = images.get(match.group(1))
+        if image is None:
+            return match.group(2)
+        alt = match.group(2) or html.escape(image['alt'], quote=True)
+        return f'<img src="{image["uri"]}" alt="{alt}">'
+    return _IMAGE_TAG_REF_RE.sub(replace_tag, _IMAGE_REF_RE.sub(replace, markdown))
+
+
+class AssetStore:
+    def __init__(self, path: Optional[str] = None):
+        """
+        Local content-addressed store for downloaded images. Files are named
+        after the hash of their content, and an index remembers which source
+        each file came from so a known image is never downloaded twice. The
+        directory and index are created on first use, and the index and file
+        operations run on a dedicated thread off the event loop.
+
+        Args:
+            path (str, optional): Directory holding the files and the index
+        """
+        self.path = path or os.getenv('ASSET_STORE_PATH', '.cache/assets')
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='asset-store')
+
+    @functools.cached_property
+    def _db(self) -> sqlite3.Connection:
+        os.makedirs(self.path, exist_ok=True)
+        db = sqlite3.connect(os.path.join(self.path, 'index.sqlite3'), check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS sources (source TEXT PRIMARY KEY, name TEXT NOT NULL)")
+        return db
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    def _lookup(self, source: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT name FROM sources WHERE source = ?", (source,)).fetchone()
+        if row and os.path.exists(os.path.join(self.path, row[0])):
+            return row[0]
+        return None
+
+    def _put(self, source: str, data: bytes, extension: str) -> str:
+        name = f"{hashlib.sha256(data).hexdigest()[:20]}{extension}"
+        with self._lock:
+            file_path = os.path.join(self.path, name)
+            if not os.path.exists(file_path):
+                os.makedirs(self.path, exist_ok=True)
+                tmp_path = f"{file_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, file_path)
+            self._db.execute("INSERT OR REPLACE INTO sources (source, name) VALUES (?, ?)", (source, name))
+        return name
+
+    def _read(self, name: str) -> bytes:
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read()
+
+    async def lookup(self, source: str) -> Optional[str]:
+        """Name of the stored file downloaded from source, if it is still present"""
+        return await self._run(self._lookup, source)
+
+    async def put(self, source: str, data: bytes, extension: str) -> str:
+        """Store data under its content hash and remember where it came from"""
+        return await self._run(self._put, source, data, extension)
+
+    async def read(self, name: str) -> bytes:
+        return await self._run(self._read, name)
+
+
+class ImageAssets:
+    def __init__(self, docs_service, store: Optional[AssetStore] = None):
+        """
+        Download the images of converted documents and turn them into
+        repository files under ASSET_DIR, deduplicated by content
+
+        Args:
+            docs_service (GoogleDocsService): Service whose authorized session downloads images
+            store (AssetStore, optional): Local store; defaults to ASSET_STORE_PATH
+        """
+        self.docs_service = docs_service
+        self.store = store or AssetStore()
+        self.directory = os.getenv('ASSET_DIR', 'docs/assets').strip('/')
+        self.max_width = int(os.getenv('ASSET_MAX_WIDTH', '0'))
+        self._semaphore = asyncio.Semaphore(int(os.getenv('ASSET_DOWNLOAD_CONCURRENCY', '8')))
+        # Downloads in progress, so documents sharing an image wait for one download
+        self._pending: Dict[str, asyncio.Future] = {}
+        if self.max_width and Image is None:
+            logger.warning("ASSET_MAX_WIDTH is set but Pillow is not installed; images are not resized")
+
+    async def fetch(self, doc_id: str, images: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+        """
+        Make sure every image of a document is in the local store
+
+        Args:
+            doc_id (str): Document the images belong to
+            images (Dict): Output of inline_images
+
+        Returns:
+            Dict[str, str]: contentUri -> stored file name, for the images that could be fetched
+        """
+        names = await asyncio.gather(*(
+            self._fetch_one(self._source_key(doc_id, object_id, image), image['uri'])
+            for object_id, image in images.items()
+        ), return_exceptions=True)
+
+        stored = {}
+        for image, name in zip(images.values(), names):
+            if isinstance(name, Exception):
+                # The page still links the original URL rather than failing the conversion
+                logger.error(f"Error downloading image for {doc_id}: {str(name)}")
+            else:
+                stored[image['uri']] = name
+        return stored
+
+    @staticmethod
+    def _source_key(doc_id: str, object_id: str, image: Dict[str, str]) -> str:
+        # Images inserted from a URL are keyed on it, so documents sharing an
+        # image download it once, plus the image properties, so a re-cropped
+        # or recolored copy is downloaded again. Images uploaded from a
+        # computer have no sourceUri and are keyed on the document and object
+        # ID. Exported images have no properties; their src is the key.
+        source = image['source'] or f"{doc_id}/{object_id}"
+        version = image.get('version')
+        return f"{source}#{version}" if version else source
+
+    async def _fetch_one(self, source: str, uri: str) -> str:
+        name = await self.store.lookup(source)
+        if name:
+            return name
+        if source in self._pending:
+            return await self._pending[source]
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[source] = future
+        try:
+            async with self._semaphore:
+                data, content_type = await self.docs_service.download(uri)
+            data, content_type = await asyncio.get_running_loop().run_in_executor(None, self._process, data, content_type)
+            extension = _EXTENSIONS.get(content_type) or mimetypes.guess_extension(content_type or '') or '.bin'
+            name = await self.store.put(source, data, extension)
+            future.set_result(name)
+            return name
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved in case no other document is waiting for it
+            future.exception()
+            raise
+        finally:
+            del self._pending[source]
+
+    def _process(self, data: bytes, content_type: str) -> Tuple[bytes, str]:
+        """Shrink images wider than ASSET_MAX_WIDTH, keeping their format"""
+        if not self.max_width or Image is None or content_type == 'image/svg+xml':
+            return data, content_type
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width <= self.max_width or getattr(image, 'is_animated', False):
+                return data, content_type
+            image_format = image.format
+            resized = image.resize((self.max_width, round(image.height * self.max_width / image.width)))
+            output = io.BytesIO()
+            resized.save(output, format=image_format, optimize=True)
+        return output.getvalue(), content_type
+
+    async def localize(self, markdown: str, target_path: str, stored: Dict[str, str]) -> Tuple[str, Dict[str, bytes]]:
+        """
+        Point image links at the committed copies
+
+        Args:
+            markdown (str): Converted Markdown linking images by contentUri
+            target_path (str): Repository path of the page
+            stored (Dict[str, str]): Output of fetch
+
+        Returns:
+            Tuple: (Markdown with relative image paths, repository path -> file content)
+        """
+        files = {}
+        page_directory = posixpath.dirname(target_path)
+        for uri, name in stored.items():
+            if uri not in markdown:
+                continue
+            asset_path = f"{self.directory}/{name}"
+            markdown = markdown.replace(uri, posixpath.relpath(asset_path, page_directory))
+            files[asset_path] = await self.store.read(name)
+        return markdown, files
@@ -0,0 +1,155 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import asyncio
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Entries deleted per eviction query
+EVICT_BATCH = 100
+
+
+def cache_key(*parts: str) -> str:
+    """Content address for a cache entry built from its identifying parts"""
+    return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+
+class ConversionCache:
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        """
+        Persistent Markdown cache stored in SQLite with least-recently-used
+        eviction once the stored values exceed max_bytes. The total size is
+        kept up to date by triggers, so writes never scan the table, and
+        every query runs on a dedicated thread off the event loop.
+
+        Args:
+            path (str, optional): SQLite database file
+            max_bytes (int, optional): Size budget for cached values
+        """
+        self.path = path or os.getenv('CONVERSION_CACHE_PATH', '.cache/conversions.sqlite3')
+        self.max_bytes = max_bytes or int(os.getenv('CONVERSION_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # One connection, one thread: queries are serialized anyway
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='conversion-cache')
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # WAL lets several uvicorn workers share the cache file
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversions ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS conversions_accessed ON conversions (accessed_at)")
+            # Running total of the stored sizes, shared by every process using the file;
+            # caches created before it existed are summed once
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversions_size ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0),"
+                " total INTEGER NOT NULL)"
+            )
+            self._db.execute(
+                "INSERT OR IGNORE INTO conversions_size (id, total)"
+                " SELECT 0, COALESCE(SUM(size), 0) FROM conversions"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS conversions_size_insert AFTER INSERT ON conversions"
+                " BEGIN UPDATE conversions_size SET total = total + NEW.size WHERE id = 0; END"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS conversions_size_delete AFTER DELETE ON conversions"
+                " BEGIN UPDATE conversions_size SET total = total - OLD.size WHERE id = 0; END"
+            )
+            self._db.execute(
+                "CREATE TRIGGER IF NOT EXISTS conversions_size_update AFTER UPDATE OF size ON conversions"
+                " BEGIN UPDATE conversions_size SET total = total + NEW.size - OLD.size WHERE id = 0; END"
+            )
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    def _get(self, keys: List[str]) -> List[Optional[str]]:
+        values = []
+        with self._lock:
+            now = time.time()
+            for key in keys:
+                row = self._db.execute("SELECT value FROM conversions WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    values.append(None)
+                    continue
+                self._db.execute("UPDATE conversions SET accessed_at = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                values.append(row[0])
+        return values
+
+    def _put(self, key: str, value: str):
+        size = len(value.encode())
+        with self._lock:
+            # An upsert rather than INSERT OR REPLACE: the implicit delete of a
+            # replace does not fire the size triggers
+            self._db.execute(
+                "INSERT INTO conversions (key, value, size, accessed_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,"
+                " accessed_at = excluded.accessed_at",
+                (key, value, size, time.time())
+            )
+            self._evict()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return the cached value for key, marking it as recently used"""
+        return (await self._run(self._get, [key]))[0]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """Cached values for several keys in one round trip to the cache thread, None where missing"""
+        return await self._run(self._get, keys)
+
+    async def put(self, key: str, value: str):
+        """Store value under key and evict least recently used entries over budget"""
+        await self._run(self._put, key, value)
+
+    def _total(self) -> int:
+        return self._db.execute("SELECT total FROM conversions_size WHERE id = 0").fetchone()[0]
+
+    def _evict(self):
+        if self._total() <= self.max_bytes:
+            return
+        evicted = 0
+        while self._total() > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT key FROM conversions ORDER BY accessed_at LIMIT ?", (EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            for (key,) in rows:
+                self._db.execute("DELETE FROM conversions WHERE key = ?", (key,))
+                evicted += 1
+                if self._total() <= self.max_bytes:
+                    break
+        logger.info(f"Evicted {evicted} conversion cache entries")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM conversions").fetchone()[0]
+            size = self._total()
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,121 @@
+from typing import Dict, Iterable, Iterator, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (event, node, depth) where depth is the number of tables enclosing a
+# paragraph, or the nesting level of a table for table/row/cell events
+DocumentEvent = Tuple[str, Dict, int]
+
+
+def iter_document(document: Dict) -> Iterator[DocumentEvent]:
+    """
+    Walk the body of a Docs API document once, in reading order, without
+    copying any of it
+
+    Events:
+        paragraph: a paragraph; list items are paragraphs with a bullet and
+            inline objects, footnote references etc. are among its elements
+        start_table / end_table, start_row / end_row, start_cell / end_cell:
+            table structure, with the cell content walked in between
+        table_of_contents, section_break: the corresponding elements
+        unsupported: any other structural element
+
+    Args:
+        document (Dict): documents.get response
+
+    Yields:
+        DocumentEvent: (event, node, depth) in document order
+    """
+    yield from _iter_content(document.get('body', {}).get('content', []), 0)
+
+
+def _iter_content(content: List[Dict], depth: int) -> Iterator[DocumentEvent]:
+    for element in content:
+        if 'paragraph' in element:
+            yield 'paragraph', element['paragraph'], depth
+        elif 'table' in element:
+            yield from iter_table(element['table'], depth)
+        elif 'tableOfContents' in element:
+            yield 'table_of_contents', element['tableOfContents'], depth
+        elif 'sectionBreak' in element:
+            yield 'section_break', element['sectionBreak'], depth
+        else:
+            yield 'unsupported', element, depth
+
+
+def iter_table(table: Dict, depth: int = 0) -> Iterator[DocumentEvent]:
+    """The events of one table and its content, as iter_document yields them"""
+    yield 'start_table', table, depth
+    for row in table.get('tableRows', []):
+        yield 'start_row', row, depth
+        for cell in row.get('tableCells', []):
+            yield 'start_cell', cell, depth
+            yield from _iter_content(cell.get('content', []), depth + 1)
+            yield 'end_cell', cell, depth
+        yield 'end_row', row, depth
+    yield 'end_table', table, depth
+
+
+class DocumentVisitor:
+    """
+    Receives the events of iter_document as method calls; subclasses
+    override the events they care about
+    """
+
+    def paragraph(self, paragraph: Dict, depth: int):
+        pass
+
+    def start_table(self, table: Dict, depth: int):
+        pass
+
+    def end_table(self, table: Dict, depth: int):
+        pass
+
+    def start_row(self, row: Dict, depth: int):
+        pass
+
+    def end_row(self, row: Dict, depth: int):
+        pass
+
+    def start_cell(self, cell: Dict, depth: int):
+        pass
+
+    def end_cell(self, cell: Dict, depth: int):
+        pass
+
+    def table_of_contents(self, toc: Dict, depth: int):
+        pass
+
+    def section_break(self, section_break: Dict, depth: int):
+        pass
+
+    def unsupported(self, element: Dict, depth: int):
+        pass
+
+
+def walk_document(document: Dict, visitors: Iterable[DocumentVisitor]):
+    """Feed a single pass over document to every visitor"""
+    visitors = list(visitors)
+    for event, node, depth in iter_document(document):
+        for visitor in visitors:
+            getattr(visitor, event)(node, depth)
+
+
+def paragraph_text(paragraph: Dict) -> str:
+    """Raw text of a paragraph's text runs"""
+    return ''.join(e['textRun'].get('content', '') for e in paragraph.get('elements', []) if 'textRun' in e)
+
+
+class TextVisitor(DocumentVisitor):
+    def __init__(self):
+        """Plain text of the top-level paragraphs"""
+        self.parts: List[str] = []
+
+    def paragraph(self, paragraph: Dict, depth: int):
+        if depth == 0:
+            self.parts.append(paragraph_text(paragraph))
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.parts)
@@ -0,0 +1,125 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import asyncio
+import json
+import os
+import logging
+from .google_docs import GOOGLE_DOC_MIME_TYPE
+from .job_queue import QueueFullError
+from .pipeline import BATCH_STAGES
+
+logger = logging.getLogger(__name__)
+
+
+class DriveChangeWatcher:
+    def __init__(self, docs_service, job_queue, checkpoint_path: Optional[str] = None,
+                 interval: Optional[float] = None, folder_id: Optional[str] = None,
+                 since: Optional[str] = None, batch_size: Optional[int] = None):
+        """
+        Follow the Drive change feed and queue conversions for changed Google Docs only
+
+        Args:
+            docs_service (GoogleDocsService): Service owning the Drive client
+            job_queue (JobQueue): Queue the conversion jobs are submitted to
+            checkpoint_path (str, optional): File the change feed page token is saved in
+            interval (float, optional): Seconds between polls
+            folder_id (str, optional): Only watch documents directly inside this folder
+            since (str, optional): RFC 3339 timestamp; on the first run documents
+                modified after it are synced as well
+            batch_size (int, optional): Maximum number of documents per queued batch job
+        """
+        self.docs_service = docs_service
+        self.job_queue = job_queue
+        self.checkpoint_path = checkpoint_path or os.getenv('DRIVE_WATCH_CHECKPOINT', '.cache/drive_changes.json')
+        self.interval = interval or float(os.getenv('DRIVE_WATCH_INTERVAL', '60'))
+        self.folder_id = folder_id or os.getenv('DRIVE_WATCH_FOLDER_ID')
+        self.since = since or os.getenv('DRIVE_WATCH_SINCE')
+        self.batch_size = batch_size or int(os.getenv('BATCH_MAX_DOCUMENTS', '500'))
+        # The background loop and POST /api/sync/changes both poll; without
+        # the lock they read the same checkpoint and queue the changes twice
+        self._lock = asyncio.Lock()
+
+    def _load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_checkpoint(self, page_token: str):
+        """Write the checkpoint atomically so a crash never leaves a partial file"""
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"page_token": page_token, "updated_at": datetime.now().isoformat()}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _changed_documents(self, changes: List[Dict]) -> List[str]:
+        """Google Docs touched by a batch of changes, in feed order and without duplicates"""
+        doc_ids = []
+        for change in changes:
+            file = change.get('file') or {}
+            if change.get('removed') or file.get('trashed'):
+                continue
+            if file.get('mimeType') != GOOGLE_DOC_MIME_TYPE:
+                continue
+            if self.folder_id and self.folder_id not in file.get('parents', []):
+                continue
+            if change['fileId'] not in doc_ids:
+                doc_ids.append(change['fileId'])
+        return doc_ids
+
+    async def poll(self) -> Dict[str, Any]:
+        """
+        Read changes since the last checkpoint and queue batch conversions for
+        them, at most batch_size documents per job. The checkpoint only
+        advances once every job has been queued, and no job is queued unless
+        all of them fit, so changes are never lost or queued twice when the
+        queue is full. Concurrent polls run one after the other.
+
+        Returns:
+            Dict: Changed document IDs and the IDs of the queued jobs
+        """
+        async with self._lock:
+            return await self._poll()
+
+    async def _poll(self) -> Dict[str, Any]:
+        checkpoint = self._load_checkpoint()
+        if checkpoint is None:
+            page_token = await self.docs_service.get_changes_start_token()
+            doc_ids = []
+            if self.since:
+                documents = await self.docs_service.list_documents_modified_since(self.since, self.folder_id)
+                doc_ids = [doc['id'] for doc in documents]
+            logger.info(f"Starting Drive change feed at token {page_token}")
+        else:
+            changes, page_token = await self.docs_service.list_changes(checkpoint['page_token'])
+            doc_ids = self._changed_documents(changes)
+
+        batches = [doc_ids[i:i + self.batch_size] for i in range(0, len(doc_ids), self.batch_size)]
+        free = self.job_queue.max_size - self.job_queue.pending()
+        if len(batches) > free:
+            raise QueueFullError(f"Job queue cannot take {len(batches)} batch jobs ({free} free)")
+
+        job_ids = []
+        for batch in batches:
+            job = self.job_queue.submit("convert_batch", {"doc_ids": batch, "create_pr": True}, BATCH_STAGES)
+            job_ids.append(job.id)
+        if job_ids:
+            logger.info(f"Queued {len(job_ids)} jobs for {len(doc_ids)} changed documents")
+
+        self._save_checkpoint(page_token)
+        return {"documents": doc_ids, "job_ids": job_ids}
+
+    async def run(self):
+        """Poll the change feed until cancelled"""
+        while True:
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Drive change poll failed: {str(e)}")
+            await asyncio.sleep(self.interval)
@@ -1,5 +1,12 @@
-from github import Github
+from github import Github, GithubException, GithubRetry, InputGitTreeElement
+from typing import Dict, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from .health import CircuitBreaker
+import asyncio
+import base64
+import functools
+import hashlib
 import os
 from dotenv import load_dotenv
 import logging
@@ -11,6 +18,147 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+def git_blob_sha(content: Union[str, bytes]) -> str:
+    """SHA git assigns to a blob with this content, computed locally"""
+    data = content.encode() if isinstance(content, str) else content
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def add_nav_entry(config: str, title: str, nav_path: str) -> str:
+    """
+    Add a page to the nav section of a mkdocs.yml document, avoiding duplicates
+
+    Args:
+        config (str): Current mkdocs.yml content
+        title (str): Navigation title
+        nav_path (str): Page path relative to docs/
+
+    Returns:
+        str: Updated mkdocs.yml content (unchanged if the entry already exists)
+    """
+    entry = f"- {_nav_label(title)}: {nav_path}"
+    if entry in config or f"- {title}: {nav_path}" in config:
+        return config
+
+    # Parse the current navigation structure
+    lines = config.split('\n')
+    new_lines = []
+    nav_section_found = False
+    nav_updated = False
+
+    for line in lines:
+        if line.strip() == 'nav:':
+            nav_section_found = True
+            new_lines.append(line)
+        elif nav_section_found and line.strip().startswith('-') and not nav_updated:
+            # Insert new navigation item at the beginning of nav section
+            new_lines.append(f"  {entry}")
+            new_lines.append(line)
+            nav_updated = True
+        elif nav_section_found and line.strip() == '' and not nav_updated:
+            # Handle empty lines in nav section
+            new_lines.append(f"  {entry}")
+            new_lines.append(line)
+            nav_updated = True
+        else:
+            new_lines.append(line)
+
+    # If nav section was found but no update was made, add at the end
+    if nav_section_found and not nav_updated:
+        # Find the end of nav section (next non-indented line)
+        for i, line in enumerate(new_lines):
+            if line.strip() == 'nav:':
+                # Find the last nav item
+                j = i + 1
+                while j < len(new_lines) and (new_lines[j].strip() == '' or new_lines[j].startswith('  ')):
+                    j += 1
+                # Insert before the first non-nav line
+                new_lines.insert(j, f"  {entry}")
+                break
+
+    return '\n'.join(new_lines)
+
+def _nav_label(text: str) -> str:
+    """YAML-safe navigation label"""
+    if any(c in text for c in ':#[]{}&*!|>\'"%@`,') or text != text.strip() or not text:
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return text
+
+
+def render_nav_tree(entries: List[Tuple[List[str], str, str]], indent: int = 2) -> List[str]:
+    """
+    Render pages grouped by folder as nested mkdocs.yml nav items
+
+    Args:
+        entries (List[Tuple[List[str], str, str]]): (folder names, title, page path relative to docs/)
+        indent (int): Indentation of the top-level items
+
+    Returns:
+        List[str]: nav lines; in each folder pages come first, then subfolders
+    """
+    tree: Dict = {"pages": [], "folders": {}}
+    for folders, title, nav_path in entries:
+        node = tree
+        for folder in folders:
+            node = node["folders"].setdefault(folder, {"pages": [], "folders": {}})
+        node["pages"].append((title, nav_path))
+
+    def render(node: Dict, depth: int) -> List[str]:
+        pad = ' ' * depth
+        lines = [f"{pad}- {_nav_label(title)}: {nav_path}" for title, nav_path in sorted(node["pages"])]
+        for folder in sorted(node["folders"]):
+            lines.append(f"{pad}- {_nav_label(folder)}:")
+            lines.extend(render(node["folders"][folder], depth + 2))
+        return lines
+
+    return render(tree, indent)
+
+
+def set_nav_section(config: str, section: str, entries: List[Tuple[List[str], str, str]]) -> str:
+    """
+    Replace (or add) one nav section of a mkdocs.yml document with a folder tree,
+    leaving the rest of the navigation untouched
+
+    Args:
+        config (str): Current mkdocs.yml content
+        section (str): Title of the nav section owned by the tree
+        entries (List[Tuple[List[str], str, str]]): Pages as accepted by render_nav_tree
+
+    Returns:
+        str: Updated mkdocs.yml content
+    """
+    lines = config.split('\n')
+    nav_index = next((i for i, line in enumerate(lines) if line.strip() == 'nav:'), None)
+    if nav_index is None:
+        if lines and lines[-1] == '':
+            lines.pop()
+        lines.append('nav:')
+        nav_index = len(lines) - 1
+        lines.append('')
+
+    # The nav block runs until the next non-indented line
+    end = nav_index + 1
+    while end < len(lines) and (lines[end].strip() == '' or lines[end].startswith(' ')):
+        end += 1
+    while end > nav_index + 1 and lines[end - 1].strip() == '':
+        end -= 1
+
+    items = [line for line in lines[nav_index + 1:end] if line.strip().startswith('- ')]
+    indent = min((len(line) - len(line.lstrip()) for line in items), default=2)
+    header = f"{' ' * indent}- {_nav_label(section)}:"
+    block = [header] + render_nav_tree(entries, indent + 2)
+
+    for start in range(nav_index + 1, end):
+        if lines[start].rstrip() in (header, f"{' ' * indent}- {section}:"):
+            stop = start + 1
+            while stop < end and (lines[stop].strip() == '' or len(lines[stop]) - len(lines[stop].lstrip()) > indent):
+                stop += 1
+            lines[start:stop] = block
+            return '\n'.join(lines)
+
+    lines[end:end] = block
+    return '\n'.join(lines)
+
+
 class GitHubService:
     def __init__(self):
         """Initialize GitHub service with credentials"""
@@ -20,8 +168,30 @@ class GitHubService:
         if not all([self.token, self.repo_name]):
             raise ValueError("GitHub credentials not found in environment variables")
         
-        self.github = Github(self.token)
-        self.repo = self.github.get_repo(self.repo_name)
+        # Explicit timeout and a short retry budget: the default retries 5xx
+        # responses ten times, holding a worker for minutes during an outage
+        self.github = Github(
+            self.token,
+            timeout=int(os.getenv('GITHUB_TIMEOUT', '15')),
+            retry=GithubRetry(total=int(os.getenv('GITHUB_MAX_RETRIES', '3')))
+        )
+        # lazy: no request is made until the repository is first used, which
+        # keeps service construction (and app startup) off the network
+        self.repo = self.github.get_repo(self.repo_name, lazy=True)
+
+        # PyGithub is synchronous; its calls run on a dedicated pool so a slow
+        # GitHub response never stalls the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('GITHUB_API_THREADS', '4')),
+            thread_name_prefix='github'
+        )
+        self.breaker = CircuitBreaker('github')
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking PyGithub call on the GitHub thread pool, through the circuit breaker"""
+        loop = asyncio.get_running_loop()
+        async with self.breaker.guard():
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
 
     async def commit_markdown_file(self, file_path: str, content: str, commit_message: str = None, branch: str = "main") -> str:
         """
@@ -48,8 +218,9 @@ class GitHubService:
 
             try:
                 # Try to get the file first to update it
-                file = self.repo.get_contents(file_path, ref=branch)
-                self.repo.update_file(
+                file = await self._run(self.repo.get_contents, file_path, ref=branch)
+                await self._run(
+                    self.repo.update_file,
                     file_path,
                     commit_message,
                     content,
@@ -59,7 +230,8 @@ class GitHubService:
                 logger.info(f"Updated file {file_path}")
             except Exception:
                 # File doesn't exist, create it
-                self.repo.create_file(
+                await self._run(
+                    self.repo.create_file,
                     file_path,
                     commit_message,
                     content,
@@ -87,7 +259,8 @@ class GitHubService:
             str: URL of the created pull request
         """
         try:
-            pr = self.repo.create_pull(
+            pr = await self._run(
+                self.repo.create_pull,
                 title=title,
                 body=body,
                 head=branch_name,
@@ -104,57 +277,21 @@ class GitHubService:
         """
         try:
             # Get current mkdocs.yml
-            config_file = self.repo.get_contents("mkdocs.yml", ref=branch)
+            config_file = await self._run(self.repo.get_contents, "mkdocs.yml", ref=branch)
             current_config = config_file.decoded_content.decode()
             
             # Remove 'docs/' from the file path for nav
-            nav_path = new_file_path.replace('docs/', '')
+            nav_path = new_file_path.removeprefix('docs/')
             
             # Check if the file is already in navigation
-            if f"- {title}: {nav_path}" in current_config:
+            new_config = add_nav_entry(current_config, title, nav_path)
+            if new_config == current_config:
                 logger.info(f"Navigation entry for {title} already exists, skipping update")
                 return f"https://github.com/{self.repo_name}/blob/{branch}/mkdocs.yml"
             
-            # Parse the current navigation structure
-            lines = current_config.split('\n')
-            new_lines = []
-            nav_section_found = False
-            nav_updated = False
-            
-            for line in lines:
-                if line.strip() == 'nav:':
-                    nav_section_found = True
-                    new_lines.append(line)
-                elif nav_section_found and line.strip().startswith('-') and not nav_updated:
-                    # Insert new navigation item at the beginning of nav section
-                    new_lines.append(f"  - {title}: {nav_path}")
-                    new_lines.append(line)
-                    nav_updated = True
-                elif nav_section_found and line.strip() == '' and not nav_updated:
-                    # Handle empty lines in nav section
-                    new_lines.append(f"  - {title}: {nav_path}")
-                    new_lines.append(line)
-                    nav_updated = True
-                else:
-                    new_lines.append(line)
-            
-            # If nav section was found but no update was made, add at the end
-            if nav_section_found and not nav_updated:
-                # Find the end of nav section (next non-indented line)
-                for i, line in enumerate(new_lines):
-                    if line.strip() == 'nav:':
-                        # Find the last nav item
-                        j = i + 1
-                        while j < len(new_lines) and (new_lines[j].strip() == '' or new_lines[j].startswith('  ')):
-                            j += 1
-                        # Insert before the first non-nav line
-                        new_lines.insert(j, f"  - {title}: {nav_path}")
-                        break
-            
-            new_config = '\n'.join(new_lines)
-            
             # Update mkdocs.yml
-            self.repo.update_file(
+            await self._run(
+                self.repo.update_file,
                 "mkdocs.yml",
                 f"Update navigation: add {title}",
                 new_config,
@@ -175,10 +312,11 @@ class GitHubService:
         """
         try:
             # Get main branch's HEAD
-            main_branch = self.repo.get_branch("main")
+            main_branch = await self._run(self.repo.get_branch, "main")
             
             # Create new branch
-            self.repo.create_git_ref(
+            await self._run(
+                self.repo.create_git_ref,
                 ref=f"refs/heads/{branch_name}",
                 sha=main_branch.commit.sha
             )
@@ -187,12 +325,100 @@ class GitHubService:
             logger.error(f"Error creating branch: {str(e)}")
             raise
 
+    async def render_mkdocs_nav(self, entries: List[Tuple[str, str]], ref: str = "main") -> str:
+        """
+        Render mkdocs.yml with several navigation entries added, without committing it
+
+        Args:
+            entries (List[Tuple[str, str]]): (title, file path) pairs to add
+            ref (str): Branch or commit to read mkdocs.yml from
+
+        Returns:
+            str: Updated mkdocs.yml content
+        """
+        try:
+            config_file = await self._run(self.repo.get_contents, "mkdocs.yml", ref=ref)
+            config = config_file.decoded_content.decode()
+            for title, file_path in entries:
+                config = add_nav_entry(config, title, file_path.removeprefix('docs/'))
+            return config
+        except Exception as e:
+            logger.error(f"Error rendering mkdocs.yml: {str(e)}")
+            raise
+
+    async def render_mkdocs_nav_section(self, section: str, entries: List[Tuple[List[str], str, str]],
+                                        ref: str = "main") -> str:
+        """
+        Render mkdocs.yml with one nav section replaced by a folder tree, without committing it
+
+        Args:
+            section (str): Nav section title
+            entries (List[Tuple[List[str], str, str]]): (folder names, title, file path) per page
+            ref (str): Branch or commit to read mkdocs.yml from
+
+        Returns:
+            str: Updated mkdocs.yml content
+        """
+        try:
+            config_file = await self._run(self.repo.get_contents, "mkdocs.yml", ref=ref)
+            config = config_file.decoded_content.decode()
+            return set_nav_section(config, section, [
+                (folders, title, file_path.removeprefix('docs/')) for folders, title, file_path in entries
+            ])
+        except Exception as e:
+            logger.error(f"Error rendering mkdocs.yml: {str(e)}")
+            raise
+
+    async def get_file_shas(self, paths: List[str], ref: str = "main") -> Dict[str, Optional[str]]:
+        """
+        Blob SHAs of files on a branch, None for files that do not exist.
+        Several paths are resolved with a single recursive tree read, falling
+        back to per-file reads if GitHub truncates the tree.
+
+        Args:
+            paths (List[str]): Repository paths
+            ref (str): Branch to read
+
+        Returns:
+            Dict[str, Optional[str]]: Path -> blob SHA
+        """
+        try:
+            if len(paths) > 1:
+                branch = await self._run(self.repo.get_branch, ref)
+                tree = await self._run(self.repo.get_git_tree, branch.commit.sha, recursive=True)
+                if not tree.raw_data.get("truncated"):
+                    blobs = {element.path: element.sha for element in tree.tree if element.type == "blob"}
+                    return {path: blobs.get(path) for path in paths}
+
+            shas = await asyncio.gather(*(self._file_sha(path, ref) for path in paths))
+            return dict(zip(paths, shas))
+        except Exception as e:
+            logger.error(f"Error reading file SHAs on {ref}: {str(e)}")
+            raise
+
+    async def _file_sha(self, path: str, ref: str) -> Optional[str]:
+        try:
+            return (await self._run(self.repo.get_contents, path, ref=ref)).sha
+        except GithubException as e:
+            if e.status != 404:
+                raise
+            return None
+
+    async def is_unchanged(self, file_path: str, content: str, ref: str = "main") -> bool:
+        """Whether file_path on ref already holds exactly this content"""
+        return await self._file_sha(file_path, ref) == git_blob_sha(content)
+
+    def commit_builder(self, branch: str, base_branch: str = "main") -> "CommitBuilder":
+        """Start staging file changes for a single atomic commit on branch"""
+        return CommitBuilder(self, branch, base_branch)
+
     async def check_service(self):
         """Check if GitHub service is working"""
         try:
-            # Try to get repository information to verify service is working
-            repo_info = self.repo.name
-            return bool(repo_info)
+            # The rate limit endpoint is authenticated but free of quota; the
+            # lazy repository caches its attributes after the first fetch
+            rate_limit = await self._run(self.github.get_rate_limit)
+            return rate_limit is not None
         except Exception as e:
             logger.error(f"GitHub service check failed: {str(e)}")
             return False
@@ -202,20 +428,22 @@ class GitHubService:
         Remove a page from mkdocs.yml navigation
         """
         try:
-            config_file = self.repo.get_contents("mkdocs.yml", ref=branch)
+            config_file = await self._run(self.repo.get_contents, "mkdocs.yml", ref=branch)
             current_config = config_file.decoded_content.decode()
             
             lines = current_config.split('\n')
             new_lines = []
+            prefixes = (f"- {title}:", f"- {_nav_label(title)}:")
             
             for line in lines:
-                if not line.strip().startswith(f"- {title}:"):
+                if not line.strip().startswith(prefixes):
                     new_lines.append(line)
             
             new_config = '\n'.join(new_lines)
             
             # Update mkdocs.yml
-            self.repo.update_file(
+            await self._run(
+                self.repo.update_file,
                 "mkdocs.yml",
                 f"Remove navigation: {title}",
                 new_config,
@@ -229,3 +457,87 @@ class GitHubService:
         except Exception as e:
             logger.error(f"Error removing from mkdocs.yml: {str(e)}")
             raise
+
+class CommitBuilder:
+    def __init__(self, service: GitHubService, branch: str, base_branch: str = "main"):
+        """
+        Stage file changes in memory and write them as one commit.
+        Blobs are created concurrently, then one tree, one commit and one ref
+        update are written. The branch ref only moves once everything else has
+        succeeded, so a failure never leaves a half-updated branch behind.
+
+        Args:
+            service (GitHubService): Service owning the repository and thread pool
+            branch (str): Branch to commit to, created if it does not exist
+            base_branch (str): Branch to start from when creating branch
+        """
+        self.service = service
+        self.branch = branch
+        self.base_branch = base_branch
+        self.files: Dict[str, Union[str, bytes]] = {}
+        self._ref = None
+        self._parent_sha: Optional[str] = None
+
+    def add_file(self, path: str, content: Union[str, bytes]):
+        """Stage a text or binary file"""
+        self.files[path] = content
+
+    async def parent_sha(self) -> str:
+        """
+        SHA the new commit will be based on: the branch head if the branch
+        exists, otherwise the head of base_branch
+        """
+        if self._parent_sha is None:
+            repo = self.service.repo
+            try:
+                self._ref = await self.service._run(repo.get_git_ref, f"heads/{self.branch}")
+                self._parent_sha = self._ref.object.sha
+            except GithubException as e:
+                if e.status != 404:
+                    raise
+                base_ref = await self.service._run(repo.get_git_ref, f"heads/{self.base_branch}")
+                self._parent_sha = base_ref.object.sha
+        return self._parent_sha
+
+    async def _create_blob(self, path: str, content: Union[str, bytes]) -> InputGitTreeElement:
+        if isinstance(content, bytes):
+            blob = await self.service._run(
+                self.service.repo.create_git_blob, base64.b64encode(content).decode(), "base64"
+            )
+        else:
+            blob = await self.service._run(self.service.repo.create_git_blob, content, "utf-8")
+        return InputGitTreeElement(path, '100644', 'blob', sha=blob.sha)
+
+    async def commit(self, commit_message: str) -> str:
+        """
+        Write the staged changes as a single commit and move the branch to it
+
+        Args:
+            commit_message (str): Commit message
+
+        Returns:
+            str: SHA of the new commit
+        """
+        if not self.files:
+            raise ValueError("No file changes staged")
+
+        try:
+            repo = self.service.repo
+            parent_sha, *elements = await asyncio.gather(
+                self.parent_sha(),
+                *(self._create_blob(path, content) for path, content in self.files.items())
+            )
+            parent = await self.service._run(repo.get_git_commit, parent_sha)
+            tree = await self.service._run(repo.create_git_tree, elements, parent.tree)
+            commit = await self.service._run(repo.create_git_commit, commit_message, tree, [parent])
+
+            if self._ref is not None:
+                await self.service._run(self._ref.edit, commit.sha)
+            else:
+                await self.service._run(repo.create_git_ref, ref=f"refs/heads/{self.branch}", sha=commit.sha)
+
+            logger.info(f"Committed {len(self.files)} files to {self.branch} in {commit.sha[:7]}")
+            return commit.sha
+        except Exception as e:
+            logger.error(f"Error committing to {self.branch}: {str(e)}")
+            raise
@@ -1,58 +1,497 @@
+from google.auth.exceptions import TransportError
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from googleapiclient.errors import HttpError
+from .docs_walker import TextVisitor, walk_document
+from .google_transport import PooledHttp, TokenCache
+from .health import CircuitBreaker, CircuitOpenError, is_outage
+import asyncio
+import functools
 import os
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+GOOGLE_DOC_MIME_TYPE = 'application/vnd.google-apps.document'
+GOOGLE_FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# Google allows up to 100 calls per batch request; smaller batches keep
+# single responses reasonably sized for large documents
+MAX_BATCH_SIZE = 100
+
+# Status codes worth retrying for individual calls inside a batch
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Read size for streamed files.export downloads
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# EXPORT_FORMAT value -> files.export MIME type for the "export" conversion mode
+EXPORT_MIME_TYPES = {
+    'html': 'text/html',
+    'markdown': 'text/markdown',
+}
+
+class QuotaLimiter:
+    def __init__(self, per_minute: int):
+        """
+        Token bucket allowing per_minute API calls per minute, refilled continuously
+
+        Args:
+            per_minute (int): Calls allowed per minute
+        """
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, calls: int = 1):
+        """Wait until calls can be made without exceeding the quota"""
+        calls = min(calls, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= calls:
+                    self.tokens -= calls
+                    return
+                await asyncio.sleep((calls - self.tokens) / self.rate)
+
 class GoogleDocsService:
     def __init__(self):
-        credentials = service_account.Credentials.from_service_account_file(
+        """
+        Google Docs/Drive access. Credentials, transport and API clients are
+        created on first use so constructing the service (and starting the app)
+        never touches the network or the credentials file.
+        """
+        # googleapiclient calls block, so they run on a dedicated pool sized
+        # independently of the other services
+        self.threads = int(os.getenv('GOOGLE_API_THREADS', '8'))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.threads,
+            thread_name_prefix='google-docs'
+        )
+
+        # Bulk fetches: calls per batch request, concurrent batches and read quota
+        self.batch_size = min(int(os.getenv('GOOGLE_BATCH_SIZE', '50')), MAX_BATCH_SIZE)
+        self.batch_concurrency = int(os.getenv('GOOGLE_BATCH_CONCURRENCY', '4'))
+        self.quota = QuotaLimiter(int(os.getenv('GOOGLE_DOCS_READS_PER_MINUTE', '300')))
+
+        # doc_id -> (expiry, metadata) for get_document_info, in expiry order
+        self.info_ttl = float(os.getenv('DOC_INFO_TTL', '30'))
+        self._info_cache: Dict[str, Tuple[float, Dict]] = {}
+
+        # Calls fail fast while Google is down instead of each waiting out the timeout
+        self.breaker = CircuitBreaker(
+            'google_docs',
+            is_failure=lambda e: isinstance(e, TransportError) or is_outage(e)
+        )
+
+    @functools.cached_property
+    def credentials(self):
+        return service_account.Credentials.from_service_account_file(
             os.getenv('GOOGLE_APPLICATION_CREDENTIALS'),
-            scopes=['https://www.googleapis.com/auth/documents.readonly']
+            scopes=[
+                'https://www.googleapis.com/auth/documents.readonly',
+                'https://www.googleapis.com/auth/drive.readonly'
+            ]
+        )
+
+    @functools.cached_property
+    def http(self) -> PooledHttp:
+        # One pooled keep-alive transport shared by all threads; httplib2 is
+        # not thread-safe and reconnects far more often. Access tokens are
+        # shared with other workers through the token cache file.
+        return PooledHttp(
+            self.credentials,
+            pool_size=self.threads,
+            timeout=float(os.getenv('GOOGLE_API_TIMEOUT', '30')),
+            token_cache=TokenCache(os.getenv('GOOGLE_TOKEN_CACHE', '.cache/google_token.json'))
         )
-        self.service = build('docs', 'v1', credentials=credentials)
+
+    @functools.cached_property
+    def service(self):
+        # The discovery document bundled with googleapiclient is used, so
+        # building the client does not fetch anything
+        return build('docs', 'v1', http=self.http, static_discovery=True, cache_discovery=False)
+
+    @functools.cached_property
+    def drive_service(self):
+        # DRIVE_API_ENDPOINT points the Drive client at another server, e.g. a local fake
+        drive_endpoint = os.getenv('DRIVE_API_ENDPOINT')
+        return build(
+            'drive', 'v3',
+            http=self.http,
+            static_discovery=True,
+            cache_discovery=False,
+            client_options={'api_endpoint': drive_endpoint} if drive_endpoint else None
+        )
+
+    # The request builders take the client and run on the Google thread pool
+    # through _run, so the first call, which reads the credentials and builds
+    # the client, never blocks the event loop
+    def _docs(self, request: Callable):
+        return request(self.service).execute(http=self.http)
+
+    def _drive(self, request: Callable):
+        return request(self.drive_service).execute(http=self.http)
+
+    def transport_stats(self) -> Dict[str, float]:
+        """Connection reuse metrics for the shared Google API transport"""
+        if 'http' not in self.__dict__:
+            # Nothing has been requested yet; don't create the transport just to report on it
+            return {"requests": 0, "connections_opened": 0, "connections_reused": 0, "reuse_ratio": 0.0}
+        return self.http.stats()
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking call on the Google API thread pool, through the circuit breaker"""
+        loop = asyncio.get_running_loop()
+        async with self.breaker.guard():
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
 
     def extract_text_content(self, document):
         """Extract plain text content from Google Doc"""
-        content = []
-        for element in document.get('body').get('content'):
-            if 'paragraph' in element:
-                paragraph = element.get('paragraph')
-                for elem in paragraph.get('elements'):
-                    if 'textRun' in elem:
-                        content.append(elem.get('textRun').get('content'))
-        return ''.join(content)
-
-    def get_document_content(self, doc_id: str):
-        """Get document content and metadata"""
-        document = self.service.documents().get(documentId=doc_id).execute()
+        text = TextVisitor()
+        walk_document(document, [text])
+        return text.text
+
+    def _document_content(self, document: Dict) -> Dict:
+        # No plain-text copy: the converters walk raw_content once themselves,
+        # and extract_text_content is there for callers that need the text
         return {
             "title": document.get('title', ''),
-            "content": self.extract_text_content(document),
             "raw_content": document
         }
 
-    def get_document_info(self, doc_id: str):
-        """Get document metadata without full content"""
+    async def get_document_content(self, doc_id: str):
+        """Get document title and raw Docs API content"""
+        await self.quota.acquire()
+        document = await self._run(self._docs, lambda docs: docs.documents().get(documentId=doc_id))
+        return self._document_content(document)
+
+    def _download(self, url: str) -> Tuple[bytes, str]:
+        response = self.http.session.get(url, timeout=self.http.timeout)
+        response.raise_for_status()
+        return response.content, response.headers.get('Content-Type', '').split(';')[0].strip()
+
+    async def download(self, url: str) -> Tuple[bytes, str]:
+        """
+        Download a file such as an image contentUri with the service credentials
+
+        Returns:
+            Tuple: (content, MIME type)
+        """
         try:
-            document = self.service.documents().get(documentId=doc_id).execute()
+            return await self._run(self._download, url)
+        except Exception as e:
+            logger.error(f"Error downloading {url}: {str(e)}")
+            raise
+
+    def _export(self, doc_id: str, mime_type: str) -> bytes:
+        # files.export answers with the whole file; it is streamed in chunks
+        # so large exports are never buffered twice by the HTTP client
+        uri = self.drive_service.files().export_media(fileId=doc_id, mimeType=mime_type).uri
+        with self.http.session.get(uri, stream=True, timeout=self.http.timeout) as response:
+            response.raise_for_status()
+            return b''.join(response.iter_content(chunk_size=EXPORT_CHUNK_SIZE))
+
+    async def export_document(self, doc_id: str, mime_type: str = 'text/html') -> Dict:
+        """
+        Export a document through Drive files.export instead of fetching the
+        Docs API structure. The export is rendered by Google and is usually a
+        fraction of the size of the documents.get JSON.
+
+        Args:
+            doc_id (str): Google Doc ID
+            mime_type (str): Export format, text/html or text/markdown
+
+        Returns:
+            Dict: {"title", "content" (decoded export), "bytes" (export size)}
+        """
+        try:
+            await self.quota.acquire()
+            data, metadata = await asyncio.gather(
+                self._run(self._export, doc_id, mime_type),
+                self._run(self._drive, lambda drive: drive.files().get(fileId=doc_id, fields='name'))
+            )
             return {
+                "title": metadata.get('name', ''),
+                "content": data.decode('utf-8'),
+                "bytes": len(data)
+            }
+        except Exception as e:
+            logger.error(f"Error exporting document {doc_id}: {str(e)}")
+            raise
+
+    def _execute_batch(self, doc_ids: List[str]) -> Dict[str, object]:
+        """Fetch documents in one batch HTTP request; returns doc_id -> document or exception"""
+        results = {}
+
+        def callback(request_id, response, exception):
+            results[request_id] = exception if exception is not None else response
+
+        batch = self.service.new_batch_http_request(callback=callback)
+        for doc_id in doc_ids:
+            batch.add(self.service.documents().get(documentId=doc_id), request_id=doc_id)
+        batch.execute(http=self.http)
+        return results
+
+    async def get_documents(self, doc_ids: List[str], retries: int = 2) -> AsyncIterator[Tuple[str, Optional[Dict], Optional[Exception]]]:
+        """
+        Fetch many documents packed into batch HTTP requests. Batches run
+        concurrently under the read quota and results are yielded as each
+        batch completes; calls rejected with 429/5xx are retried in later batches.
+
+        Args:
+            doc_ids (List[str]): Documents to fetch
+            retries (int): Retry rounds for throttled or failed calls
+
+        Yields:
+            Tuple: (doc_id, document content as returned by get_document_content, None)
+                or (doc_id, None, exception)
+        """
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def fetch(batch_ids: List[str]) -> Dict[str, object]:
+            async with semaphore:
+                await self.quota.acquire(len(batch_ids))
+                try:
+                    return await self._run(self._execute_batch, batch_ids)
+                except Exception as e:
+                    logger.error(f"Batch fetch of {len(batch_ids)} documents failed: {str(e)}")
+                    return {doc_id: e for doc_id in batch_ids}
+
+        pending = list(dict.fromkeys(doc_ids))
+        for attempt in range(retries + 1):
+            batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+            pending = []
+            for future in asyncio.as_completed([fetch(batch_ids) for batch_ids in batches]):
+                for doc_id, result in (await future).items():
+                    if not isinstance(result, Exception):
+                        yield doc_id, self._document_content(result), None
+                    elif attempt < retries and not isinstance(result, CircuitOpenError) and (
+                        not isinstance(result, HttpError) or result.resp.status in RETRYABLE_STATUSES
+                    ):
+                        pending.append(doc_id)
+                    else:
+                        yield doc_id, None, result
+            if not pending:
+                return
+            logger.warning(f"Retrying {len(pending)} documents after failed batch calls")
+            await asyncio.sleep(2 ** attempt)
+
+    async def get_document_info(self, doc_id: str):
+        """
+        Get document metadata without full content. Only the title/revision
+        and Drive file metadata are requested, and results are cached briefly.
+        """
+        cached = self._info_cache.get(doc_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        try:
+            document, file = await asyncio.gather(
+                self._run(self._docs, lambda docs: docs.documents().get(
+                    documentId=doc_id, fields='title,revisionId'
+                )),
+                self._run(self._drive, lambda drive: drive.files().get(
+                    fileId=doc_id, fields='modifiedTime,version,size', supportsAllDrives=True
+                ))
+            )
+            info = {
                 "title": document.get('title', ''),
-                "last_modified": datetime.now(),  # Google Docs API doesn't provide last modified
+                "revision_id": document.get('revisionId'),
+                "last_modified": datetime.fromisoformat(file['modifiedTime'].replace('Z', '+00:00')),
+                "version": file.get('version'),
+                "size": int(file['size']) if 'size' in file else None,
                 "url": f"https://docs.google.com/document/d/{doc_id}"
             }
+            self._cache_info(doc_id, info)
+            return info
         except Exception as e:
             logger.error(f"Error fetching document info: {str(e)}")
             raise
 
+    def _cache_info(self, doc_id: str, info: Dict):
+        """Cache document metadata for info_ttl seconds, dropping expired entries"""
+        now = time.monotonic()
+        # Re-inserting moves the entry to the end, so with a fixed TTL the
+        # dict stays ordered by expiry and expired entries are at the front
+        self._info_cache.pop(doc_id, None)
+        self._info_cache[doc_id] = (now + self.info_ttl, info)
+        while self._info_cache:
+            oldest = next(iter(self._info_cache))
+            if self._info_cache[oldest][0] > now:
+                break
+            del self._info_cache[oldest]
+
+    async def list_folder_documents(self, folder_id: str):
+        """List the Google Docs directly inside a Drive folder"""
+        try:
+            documents = []
+            page_token = None
+            while True:
+                response = await self._run(self._drive, lambda drive: drive.files().list(
+                    q=f"'{folder_id}' in parents and mimeType='{GOOGLE_DOC_MIME_TYPE}' and trashed=false",
+                    fields="nextPageToken, files(id, name)",
+                    pageSize=1000,
+                    pageToken=page_token,
+                    supportsAllDrives=True,
+                    includeItemsFromAllDrives=True
+                ))
+                documents.extend(response.get('files', []))
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    return documents
+        except Exception as e:
+            logger.error(f"Error listing folder {folder_id}: {str(e)}")
+            raise
+
+    async def _list_children(self, folder_id: str) -> List[Dict]:
+        """Google Docs and folders directly inside a folder, all pages"""
+        children = []
+        page_token = None
+        while True:
+            response = await self._run(self._drive, lambda drive: drive.files().list(
+                q=(f"'{folder_id}' in parents and trashed=false and "
+                   f"(mimeType='{GOOGLE_DOC_MIME_TYPE}' or mimeType='{GOOGLE_FOLDER_MIME_TYPE}')"),
+                fields="nextPageToken, files(id, name, mimeType)",
+                pageSize=1000,
+                pageToken=page_token,
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True
+            ))
+            children.extend(response.get('files', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return children
+
+    async def crawl_folder(self, folder_id: str) -> Tuple[str, List[Dict]]:
+        """
+        List every Google Doc below a folder, or the root of a shared drive.
+        The tree is walked level by level with all folders of a level listed
+        in parallel.
+
+        Args:
+            folder_id (str): Root folder ID
+
+        Returns:
+            Tuple: (root folder name, documents as {"id", "name", "folders"} where
+                folders are the names of the folders between the root and the document)
+        """
+        try:
+            root = await self._run(self._drive, lambda drive: drive.files().get(
+                fileId=folder_id, fields='name', supportsAllDrives=True
+            ))
+            documents = []
+            seen = {folder_id}
+            level = [(folder_id, [])]
+            while level:
+                listings = await asyncio.gather(*(self._list_children(fid) for fid, _ in level))
+                next_level = []
+                for (_, folders), children in zip(level, listings):
+                    for child in children:
+                        if child['mimeType'] != GOOGLE_FOLDER_MIME_TYPE:
+                            documents.append({"id": child['id'], "name": child['name'], "folders": folders})
+                        elif child['id'] not in seen:
+                            # A folder can have several parents; visit it once
+                            seen.add(child['id'])
+                            next_level.append((child['id'], folders + [child['name']]))
+                level = next_level
+
+            logger.info(f"Found {len(documents)} documents below folder {folder_id} ({len(seen)} folders)")
+            return root.get('name', folder_id), documents
+        except Exception as e:
+            logger.error(f"Error crawling folder {folder_id}: {str(e)}")
+            raise
+
+    async def get_changes_start_token(self) -> str:
+        """Page token marking the current position of the Drive change feed"""
+        try:
+            response = await self._run(self._drive, lambda drive: drive.changes().getStartPageToken(
+                supportsAllDrives=True
+            ))
+            return response['startPageToken']
+        except Exception as e:
+            logger.error(f"Error getting Drive start page token: {str(e)}")
+            raise
+
+    async def list_changes(self, page_token: str) -> Tuple[List[Dict], str]:
+        """
+        Read the Drive change feed from page_token to its current end
+
+        Args:
+            page_token (str): Token saved from a previous call
+
+        Returns:
+            Tuple[List[Dict], str]: Changes and the token to resume from next time
+        """
+        try:
+            changes = []
+            while True:
+                response = await self._run(self._drive, lambda drive: drive.changes().list(
+                    pageToken=page_token,
+                    fields="nextPageToken, newStartPageToken, "
+                           "changes(fileId, removed, time, file(id, name, mimeType, modifiedTime, trashed, parents))",
+                    pageSize=1000,
+                    spaces='drive',
+                    supportsAllDrives=True,
+                    includeItemsFromAllDrives=True
+                ))
+                changes.extend(response.get('changes', []))
+                if 'newStartPageToken' in response:
+                    return changes, response['newStartPageToken']
+                page_token = response['nextPageToken']
+        except Exception as e:
+            logger.error(f"Error listing Drive changes: {str(e)}")
+            raise
+
+    async def list_documents_modified_since(self, since: str, folder_id: Optional[str] = None) -> List[Dict]:
+        """
+        List Google Docs modified after an RFC 3339 timestamp
+
+        Args:
+            since (str): RFC 3339 timestamp, e.g. 2024-01-01T00:00:00Z
+            folder_id (str, optional): Only documents directly inside this folder
+
+        Returns:
+            List[Dict]: Files with id, name and modifiedTime
+        """
+        try:
+            query = f"mimeType='{GOOGLE_DOC_MIME_TYPE}' and trashed=false and modifiedTime > '{since}'"
+            if folder_id:
+                query += f" and '{folder_id}' in parents"
+            documents = []
+            page_token = None
+            while True:
+                response = await self._run(self._drive, lambda drive: drive.files().list(
+                    q=query,
+                    fields="nextPageToken, files(id, name, modifiedTime)",
+                    pageSize=1000,
+                    pageToken=page_token,
+                    supportsAllDrives=True,
+                    includeItemsFromAllDrives=True
+                ))
+                documents.extend(response.get('files', []))
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    return documents
+        except Exception as e:
+            logger.error(f"Error listing documents modified since {since}: {str(e)}")
+            raise
+
     async def check_service(self):
         """Check if Google Docs service is working"""
         try:
-            # Try to get a test document to verify service is working
-            # We'll use a simple test that doesn't require actual documents
-            return True  # If the service was initialized, it's working
+            # about.get is the cheapest authenticated call; it exercises the
+            # credentials, the token refresh and the shared transport
+            about = await self._run(self._drive, lambda drive: drive.about().get(fields='user(emailAddress)'))
+            return bool(about.get('user'))
         except Exception as e:
             logger.error(f"Google Docs service check failed: {str(e)}")
             return False
@@ -0,0 +1,164 @@
+from typing import Dict, Optional
+from datetime import datetime, timedelta, timezone
+from google.auth.transport.requests import AuthorizedSession, Request
+from requests.adapters import HTTPAdapter
+import json
+import os
+import threading
+import httplib2
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Cached tokens this close to expiry are refreshed instead of reused
+TOKEN_EXPIRY_MARGIN = timedelta(seconds=60)
+
+
+class TokenCache:
+    def __init__(self, path: str):
+        """
+        Access tokens persisted to a JSON file so restarts and other workers
+        reuse a still-valid token instead of each doing an OAuth round trip
+
+        Args:
+            path (str): JSON file the tokens are stored in
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(credentials) -> str:
+        account = getattr(credentials, 'service_account_email', None) or 'default'
+        scopes = ' '.join(sorted(getattr(credentials, 'scopes', None) or []))
+        return f"{account} {scopes}"
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def load(self, credentials) -> bool:
+        """
+        Put a cached token on credentials if one exists and is not about to expire
+
+        Returns:
+            bool: Whether a cached token was applied
+        """
+        entry = self._read().get(self._key(credentials))
+        if not entry:
+            return False
+        # google-auth compares expiry against naive UTC datetimes
+        expiry = datetime.fromisoformat(entry['expiry'])
+        if expiry - TOKEN_EXPIRY_MARGIN <= datetime.now(timezone.utc).replace(tzinfo=None):
+            return False
+        credentials.token = entry['token']
+        credentials.expiry = expiry
+        return True
+
+    def save(self, credentials):
+        """Store the current token of credentials, replacing the file atomically"""
+        if not credentials.token or not credentials.expiry:
+            return
+        with self._lock:
+            tokens = self._read()
+            tokens[self._key(credentials)] = {
+                "token": credentials.token,
+                "expiry": credentials.expiry.isoformat(),
+            }
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            # The file holds bearer tokens, so keep it private to this user
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(tokens, f)
+            os.replace(tmp_path, self.path)
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter counting the requests sent through its connection pools"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def send(self, request, *args, **kwargs):
+        with self._lock:
+            self.requests += 1
+        return super().send(request, *args, **kwargs)
+
+
+class PooledHttp:
+    def __init__(self, credentials, pool_size: int = 16, timeout: Optional[float] = None,
+                 token_cache: Optional[TokenCache] = None):
+        """
+        httplib2.Http-compatible transport for googleapiclient backed by one
+        requests session with a thread-safe urllib3 connection pool, so every
+        worker thread reuses the same keep-alive TLS connections
+
+        Args:
+            credentials: google-auth credentials used to authorize requests
+            pool_size (int): Maximum connections kept open per host
+            timeout (float, optional): Per-request timeout in seconds
+            token_cache (TokenCache, optional): Persistent store for access tokens
+        """
+        self.timeout = timeout
+        self.token_cache = token_cache
+        self.session = AuthorizedSession(credentials)
+        # Counts every request on the session, including downloads, exports
+        # and token refreshes, which share the pooled connections
+        self._adapter = _CountingAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+        self._refresh_lock = threading.Lock()
+
+    def _ensure_token(self):
+        """Refresh the access token once for all threads instead of once per thread"""
+        credentials = self.session.credentials
+        if credentials.valid:
+            return
+        with self._refresh_lock:
+            if credentials.valid:
+                return
+            try:
+                if self.token_cache and self.token_cache.load(credentials):
+                    return
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable token cache: {str(e)}")
+            credentials.refresh(Request(self.session))
+            if self.token_cache:
+                try:
+                    self.token_cache.save(credentials)
+                except OSError as e:
+                    logger.warning(f"Could not write token cache: {str(e)}")
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        """Same contract as httplib2.Http.request: returns (response, content)"""
+        self._ensure_token()
+        response = self.session.request(
+            method, uri, data=body, headers=headers, timeout=self.timeout,
+            allow_redirects=redirections > 0
+        )
+
+        info = {key.lower(): value for key, value in response.headers.items()}
+        # requests has already decoded the body
+        info.pop('content-encoding', None)
+        info['status'] = str(response.status_code)
+        return httplib2.Response(info), response.content
+
+    def stats(self) -> Dict[str, float]:
+        """Connection reuse across all pooled hosts"""
+        pools = self._adapter.poolmanager.pools
+        opened = sum(pools[key].num_connections for key in pools.keys())
+        requests = self._adapter.requests
+        return {
+            "requests": requests,
+            "connections_opened": opened,
+            "connections_reused": max(requests - opened, 0),
+            "reuse_ratio": round(1 - opened / requests, 3) if requests else 0.0,
+        }
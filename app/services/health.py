@@ -0,0 +1,249 @@
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is unavailable (circuit open, retrying in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def _status(error: BaseException) -> Optional[int]:
+    """HTTP status carried by an OpenAI, googleapiclient, PyGithub or requests error"""
+    for status in (
+        getattr(error, 'status_code', None),
+        getattr(error, 'status', None),
+        getattr(getattr(error, 'resp', None), 'status', None),
+        getattr(getattr(error, 'response', None), 'status_code', None),
+    ):
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_outage(error: BaseException) -> bool:
+    """
+    Whether an error means the dependency is unavailable (5xx, timeouts,
+    connection failures) rather than the request being rejected; only
+    outages count against a circuit breaker
+    """
+    status = _status(error)
+    if status is not None:
+        return status >= 500 or status == 408
+    # requests exceptions and socket timeouts are OSErrors
+    return isinstance(error, OSError)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None,
+                 is_failure: Callable[[BaseException], bool] = is_outage):
+        """
+        Tracks consecutive failures of one dependency. After failure_threshold
+        of them the circuit opens and calls fail fast with CircuitOpenError;
+        once reset_timeout has passed it is half open, a single trial call
+        goes through and its outcome closes the circuit or opens it again.
+
+        Args:
+            name (str): Dependency the breaker guards
+            failure_threshold (int): Consecutive failures that open the circuit (CIRCUIT_FAILURE_THRESHOLD)
+            reset_timeout (float): Seconds the circuit stays open (CIRCUIT_RESET_TIMEOUT)
+            is_failure: Whether an error raised by a guarded call counts as a failure
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+        self.reset_timeout = reset_timeout or float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))
+        self.is_failure = is_failure
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._open = False
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if not self._open:
+            return CLOSED
+        return HALF_OPEN if time.monotonic() - self.opened_at >= self.reset_timeout else OPEN
+
+    @property
+    def retry_in(self) -> float:
+        """Seconds until the circuit lets a trial call through"""
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic()) if self._open else 0.0
+
+    @asynccontextmanager
+    async def guard(self):
+        """
+        Run one call to the dependency, recording its outcome
+
+        Raises:
+            CircuitOpenError: The circuit is open, or half open with the trial call in flight
+        """
+        state = self.state
+        if state == OPEN or (state == HALF_OPEN and self._trial):
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.retry_in)
+        trial = state == HALF_OPEN
+        if trial:
+            self._trial = True
+        try:
+            yield
+        except Exception as e:
+            if self.is_failure(e):
+                self.record_failure()
+            else:
+                # The dependency answered, even if it rejected the call
+                self.record_success()
+            raise
+        else:
+            self.record_success()
+        finally:
+            if trial:
+                self._trial = False
+
+    def record_success(self):
+        if self._open:
+            logger.info(f"Circuit for {self.name} closed")
+        self.failures = 0
+        self._open = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or (not self._open and self.failures >= self.failure_threshold):
+            logger.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+            self._open = True
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        state = self.state
+        return {
+            "state": state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "retry_in": round(self.retry_in, 1) if state == OPEN else 0.0,
+        }
+
+
+class HealthMonitor:
+    def __init__(self, interval: Optional[float] = None, ttl: Optional[float] = None,
+                 timeout: Optional[float] = None):
+        """
+        Probes registered dependencies in the background and keeps the last
+        result of each in memory, so reporting health never waits on the network
+
+        Args:
+            interval (float): Seconds between probe rounds (HEALTH_CHECK_INTERVAL)
+            ttl (float): Age after which a result no longer counts as healthy
+                (HEALTH_CHECK_TTL, three intervals by default)
+            timeout (float): Seconds a single probe may take (HEALTH_CHECK_TIMEOUT)
+        """
+        self.interval = interval or float(os.getenv('HEALTH_CHECK_INTERVAL', '30'))
+        self.ttl = ttl or float(os.getenv('HEALTH_CHECK_TTL', str(3 * self.interval)))
+        self.timeout = timeout or float(os.getenv('HEALTH_CHECK_TIMEOUT', '5'))
+        self._probes: Dict[str, Callable[[], Awaitable[bool]]] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._results: Dict[str, Dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, probe: Callable[[], Awaitable[bool]], breaker: Optional[CircuitBreaker] = None):
+        """
+        Add a dependency to probe
+
+        Args:
+            name (str): Name the dependency is reported under
+            probe: Coroutine function returning whether the dependency answers
+            breaker (CircuitBreaker): Breaker of the dependency, reported
+                alongside the probe results. Probes should go through it, so a
+                probe is the trial call that closes a half-open circuit even
+                when no other traffic reaches the dependency.
+        """
+        self._probes[name] = probe
+        self.breakers[name] = breaker or CircuitBreaker(name)
+
+    async def _probe(self, name: str):
+        start = time.perf_counter()
+        error = None
+        try:
+            healthy = bool(await asyncio.wait_for(self._probes[name](), self.timeout))
+            if not healthy:
+                error = "check failed"
+        except asyncio.TimeoutError:
+            healthy, error = False, f"timed out after {self.timeout:g}s"
+        except Exception as e:
+            healthy, error = False, str(e)
+
+        if not healthy:
+            logger.warning(f"Health check for {name} failed: {error}")
+        self._results[name] = {
+            "healthy": healthy,
+            "checked": time.monotonic(),
+            "checked_at": datetime.now().isoformat(),
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "error": error,
+        }
+
+    async def check_all(self):
+        """Probe every dependency once, concurrently"""
+        await asyncio.gather(*(self._probe(name) for name in self._probes))
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.error(f"Error running health checks: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Dict]:
+        """
+        Last known health of every dependency, from memory
+
+        Returns:
+            Dict[str, Dict]: name -> healthy, stale, checked_at, latency_ms,
+                error and the circuit breaker state
+        """
+        now = time.monotonic()
+        status = {}
+        for name, breaker in self.breakers.items():
+            result = self._results.get(name)
+            circuit = breaker.stats()
+            if result is None:
+                status[name] = {"healthy": False, "stale": True, "checked_at": None,
+                                "latency_ms": None, "error": "not checked yet", "circuit": circuit}
+                continue
+            stale = now - result["checked"] > self.ttl
+            status[name] = {
+                "healthy": result["healthy"] and not stale and circuit["state"] != OPEN,
+                "stale": stale,
+                "checked_at": result["checked_at"],
+                "latency_ms": result["latency_ms"],
+                "error": result["error"],
+                "circuit": circuit,
+            }
+        return status
@@ -0,0 +1,390 @@
+from html import escape as escape_html
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import parse_qs, urlparse
+import re
+import logging
+from .local_converter import MONOSPACE_FONTS, escape_markdown, slugify
+from .table_converter import TableCell, gfm_table, html_table, render_cells
+
+logger = logging.getLogger(__name__)
+
+_VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+_BLOCK_TAGS = {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'table', 'hr', 'div'}
+_CSS_RULE_RE = re.compile(r'\.([\w-]+)\s*\{([^}]*)\}')
+# Google names list classes lst-kix_<list id>-<nesting level>
+_LIST_CLASS_RE = re.compile(r'lst-(.+)-(\d+)$')
+_FOOTNOTE_REF_RE = re.compile(r'#ftnt(\d+)$')
+
+
+class _Node:
+    def __init__(self, tag: str, attrs: Dict[str, str]):
+        self.tag = tag
+        self.attrs = attrs
+        self.children: List[Union['_Node', str]] = []
+
+    @property
+    def classes(self) -> List[str]:
+        return self.attrs.get('class', '').split()
+
+    def text(self) -> str:
+        return ''.join(child if isinstance(child, str) else child.text() for child in self.children)
+
+
+class _TreeBuilder(HTMLParser):
+    """Minimal DOM for the well-formed HTML Drive exports"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _Node('root', {})
+        self.stack = [self.root]
+        self.css: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        node = _Node(tag, {name: value or '' for name, value in attrs})
+        self.stack[-1].children.append(node)
+        if tag not in _VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.stack[-1].children.append(_Node(tag, {name: value or '' for name, value in attrs}))
+
+    def handle_endtag(self, tag):
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data):
+        if self.stack[-1].tag == 'style':
+            self.css.append(data)
+        else:
+            self.stack[-1].children.append(data)
+
+
+class ExportConversion:
+    def __init__(self, markdown: str, images: Dict[str, Dict[str, str]]):
+        """
+        Result of converting a Drive export
+
+        Args:
+            markdown (str): Converted Markdown
+            images (Dict): src -> {"uri", "source", "alt"}, the shape inline_images
+                returns, so exported images go through the same asset pipeline
+        """
+        self.markdown = markdown
+        self.images = images
+
+
+class HtmlMarkdownConverter:
+    def __init__(self):
+        """
+        Convert the HTML Drive exports for a Google Doc (files.export as
+        text/html) to the same Markdown dialect as the local converter, or
+        tidy Drive's own text/markdown export
+        """
+
+    def convert(self, html: str) -> ExportConversion:
+        """
+        Convert an exported Google Doc
+
+        Args:
+            html (str): files.export text/html output
+
+        Returns:
+            ExportConversion: Markdown and the images it links
+        """
+        builder = _TreeBuilder()
+        builder.feed(html)
+        builder.close()
+        state = _HtmlConversion(builder.css)
+        body = next((node for node in self._iter_nodes(builder.root) if node.tag == 'body'), builder.root)
+        state.collect_anchors(body)
+        for child in body.children:
+            state.convert_block(child)
+        return ExportConversion(state.render(), state.images)
+
+    @staticmethod
+    def _iter_nodes(node: _Node):
+        for child in node.children:
+            if isinstance(child, _Node):
+                yield child
+                yield from HtmlMarkdownConverter._iter_nodes(child)
+
+    def normalize_markdown(self, markdown: str) -> str:
+        """Line endings, trailing whitespace and blank-line runs of a text/markdown export"""
+        lines = [line.rstrip() for line in markdown.replace('\r\n', '\n').replace('\r', '\n').split('\n')]
+        text = re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip('\n')
+        return text + '\n'
+
+
+class _HtmlConversion:
+    def __init__(self, css: List[str]):
+        self.styles: Dict[str, Dict[str, str]] = {}
+        for name, declarations in _CSS_RULE_RE.findall(''.join(css)):
+            self.styles[name] = self._parse_style(declarations)
+        self.blocks: List[str] = []
+        self.footnote_defs: List[str] = []
+        self.anchors: Dict[str, str] = {}
+        self.images: Dict[str, Dict[str, str]] = {}
+        self._list_lines: List[str] = []
+        self._list_id: Optional[str] = None
+        self._code_lines: List[str] = []
+
+    @staticmethod
+    def _parse_style(declarations: str) -> Dict[str, str]:
+        style = {}
+        for declaration in declarations.split(';'):
+            name, _, value = declaration.partition(':')
+            if value:
+                style[name.strip().lower()] = value.strip().lower()
+        return style
+
+    def _style(self, node: _Node) -> Dict[str, str]:
+        style = {}
+        for name in node.classes:
+            style.update(self.styles.get(name, {}))
+        style.update(self._parse_style(node.attrs.get('style', '')))
+        return style
+
+    def collect_anchors(self, body: _Node):
+        """Heading id -> MkDocs anchor, so #h.xxx links survive conversion"""
+        for node in body.children:
+            if isinstance(node, _Node) and node.attrs.get('id') and (
+                    node.tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6') or {'title', 'subtitle'} & set(node.classes)):
+                self.anchors[node.attrs['id']] = slugify(node.text().replace('\xa0', ' ').strip())
+
+    # Blocks
+
+    def _flush(self):
+        if self._list_lines:
+            self.blocks.append('\n'.join(self._list_lines))
+            self._list_lines = []
+            self._list_id = None
+        if self._code_lines:
+            self.blocks.append('```\n' + '\n'.join(self._code_lines) + '\n```')
+            self._code_lines = []
+
+    def convert_block(self, node: Union[_Node, str]):
+        if isinstance(node, str):
+            return
+        if node.tag in ('ul', 'ol'):
+            self._convert_list(node)
+            return
+        if node.tag == 'div' and self._is_footnote(node):
+            self._flush()
+            self._convert_footnote(node)
+            return
+
+        if node.tag == 'p' and self._is_code_paragraph(node):
+            if self._list_lines:
+                self._flush()
+            self._code_lines.append(node.text().replace('\xa0', ' ').rstrip('\n'))
+            return
+        self._flush()
+
+        if node.tag == 'table':
+            self.blocks.append(self._convert_table(node))
+        elif node.tag == 'hr':
+            # Page breaks are exported as hidden rules
+            if 'display:none' not in node.attrs.get('style', '').replace(' ', ''):
+                self.blocks.append('---')
+        elif node.tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+            text = self._inline(node).strip()
+            if text:
+                self.blocks.append(f"{'#' * int(node.tag[1])} {text}")
+        elif node.tag in ('p', 'div'):
+            text = self._inline(node).strip()
+            if 'title' in node.classes and text:
+                self.blocks.append(f"# {text}")
+            elif 'subtitle' in node.classes and text:
+                self.blocks.append(f"## {text}")
+            elif text:
+                self.blocks.append(text)
+            elif any(isinstance(child, _Node) and child.tag == 'hr' for child in node.children):
+                self.blocks.append('---')
+
+    def _convert_list(self, node: _Node):
+        list_id, level = None, 0
+        for name in node.classes:
+            match = _LIST_CLASS_RE.match(name)
+            if match:
+                list_id, level = match.group(1), int(match.group(2))
+        if self._code_lines or (self._list_lines and list_id != self._list_id):
+            self._flush()
+        self._list_id = list_id
+
+        marker = '1.' if node.tag == 'ol' else '-'
+        for item in node.children:
+            if isinstance(item, _Node) and item.tag == 'li':
+                text = self._inline(item).strip()
+                if text:
+                    self._list_lines.append(f"{'    ' * level}{marker} {text}")
+
+    def _is_code_paragraph(self, node: _Node) -> bool:
+        spans = [child for child in node.children
+                 if isinstance(child, _Node) and child.tag == 'span' and child.text().strip()]
+        return bool(spans) and all(self._is_monospace(self._style(span)) for span in spans)
+
+    @staticmethod
+    def _is_monospace(style: Dict[str, str]) -> bool:
+        families = [family.strip(' "\'') for family in style.get('font-family', '').split(',')]
+        return any(family in {font.lower() for font in MONOSPACE_FONTS} for family in families)
+
+    @staticmethod
+    def _is_footnote(node: _Node) -> bool:
+        for child in node.children:
+            if isinstance(child, _Node):
+                anchor = next((n for n in HtmlMarkdownConverter._iter_nodes(child) if n.tag == 'a'), None)
+                return anchor is not None and anchor.attrs.get('id', '').startswith('ftnt') \
+                    and not anchor.attrs.get('id', '').startswith('ftnt_ref')
+        return False
+
+    def _convert_footnote(self, node: _Node):
+        anchor = next(n for n in HtmlMarkdownConverter._iter_nodes(node) if n.tag == 'a')
+        number = anchor.attrs['id'][len('ftnt'):]
+        anchor.children = []
+        text = ' '.join(self._inline(child).strip() for child in node.children if isinstance(child, _Node))
+        self.footnote_defs.append(f"[^{number}]: {text.strip()}")
+
+    # Tables
+
+    def _convert_table(self, node: _Node) -> str:
+        cells, width, complex_layout = self._table_cells(node)
+        if not cells:
+            return ''
+        if complex_layout:
+            return html_table(render_cells(cells, self._inline_html))
+        return gfm_table(render_cells(cells, lambda child: self._inline(child).strip()), width)
+
+    def _inline_html(self, node: _Node) -> str:
+        return self._inline(node, as_html=True).strip()
+
+    def _table_cells(self, node: _Node) -> Tuple[List[TableCell], int, bool]:
+        """Cells holding their content nodes, rendered by the caller; nested tables are rendered as HTML"""
+        rows = [n for n in HtmlMarkdownConverter._iter_nodes(node) if n.tag == 'tr' and self._owning_table(node, n)]
+        covered: Set[Tuple[int, int]] = set()
+        cells: List[TableCell] = []
+        complex_layout = False
+        for r, row in enumerate(rows):
+            c = 0
+            for cell in (child for child in row.children if isinstance(child, _Node) and child.tag in ('td', 'th')):
+                while (r, c) in covered:
+                    c += 1
+                row_span = max(int(cell.attrs.get('rowspan') or 1), 1)
+                column_span = max(int(cell.attrs.get('colspan') or 1), 1)
+                if row_span > 1 or column_span > 1:
+                    complex_layout = True
+                    covered.update((r + dr, c + dc) for dr in range(row_span) for dc in range(column_span) if dr or dc)
+                lines = []
+                for child in cell.children:
+                    if isinstance(child, _Node) and child.tag == 'table':
+                        complex_layout = True
+                        nested, _, _ = self._table_cells(child)
+                        if nested:
+                            lines.append(html_table(render_cells(nested, self._inline_html), inline=True))
+                    elif isinstance(child, _Node):
+                        lines.append(child)
+                cells.append(TableCell(r, c, row_span, column_span, lines))
+                c += column_span
+        width = max([cell.column + cell.column_span for cell in cells], default=0)
+        return cells, width, complex_layout
+
+    @staticmethod
+    def _owning_table(table: _Node, row: _Node) -> bool:
+        """Whether row belongs to table itself rather than to a table nested in one of its cells"""
+        def contains(node: _Node, depth: int) -> bool:
+            for child in node.children:
+                if isinstance(child, _Node):
+                    if child is row:
+                        return True
+                    if child.tag != 'table' and contains(child, depth + 1):
+                        return True
+            return False
+        return contains(table, 0)
+
+    # Inline content
+
+    def _inline(self, node: _Node, style: Optional[Dict[str, str]] = None, as_html: bool = False) -> str:
+        """Inline content of node as Markdown, or as HTML for cells of HTML tables"""
+        parts = []
+        for child in node.children:
+            if isinstance(child, str):
+                parts.append(self._styled_text(child, style or {}, as_html))
+            elif child.tag == 'br':
+                parts.append('<br>' if as_html else '  \n')
+            elif child.tag == 'img':
+                src = child.attrs.get('src', '')
+                alt = child.attrs.get('alt') or child.attrs.get('title') or ''
+                if src:
+                    # Export image URLs change with every export, so the source
+                    # is only a download key; stored names stay content addressed
+                    self.images.setdefault(src, {"uri": src, "source": src, "alt": alt})
+                if as_html:
+                    # The src is left unescaped so localize finds it
+                    quoted = src.replace('"', '%22')
+                    parts.append(f'<img src="{quoted}" alt="{escape_html(alt)}">')
+                else:
+                    parts.append(f"![{escape_markdown(alt)}]({src})")
+            elif child.tag == 'a':
+                parts.append(self._convert_link(child, style or {}, as_html))
+            elif child.tag == 'sup' and any(isinstance(n, _Node) and n.tag == 'a' and _FOOTNOTE_REF_RE.search(n.attrs.get('href', ''))
+                                            for n in child.children):
+                link = next(n for n in child.children if isinstance(n, _Node) and n.tag == 'a')
+                number = _FOOTNOTE_REF_RE.search(link.attrs['href']).group(1)
+                parts.append(f"<sup>{number}</sup>" if as_html else f"[^{number}]")
+            elif child.tag in _BLOCK_TAGS:
+                parts.append(self._inline(child, style, as_html))
+            else:
+                merged = dict(style or {})
+                merged.update(self._style(child))
+                parts.append(self._inline(child, merged, as_html))
+        return ''.join(parts)
+
+    def _convert_link(self, node: _Node, style: Dict[str, str], as_html: bool = False) -> str:
+        href = node.attrs.get('href', '')
+        text = self._inline(node, style, as_html)
+        if not href:
+            return text
+        if href.startswith('#'):
+            anchor = self.anchors.get(href[1:])
+            if anchor is None:
+                return text
+            href = f"#{anchor}"
+        else:
+            # Drive exports wrap external links in a google.com redirect
+            parsed = urlparse(href)
+            if parsed.netloc == 'www.google.com' and parsed.path == '/url':
+                href = parse_qs(parsed.query).get('q', [href])[0]
+        return f'<a href="{escape_html(href)}">{text}</a>' if as_html else f"[{text}]({href})"
+
+    def _styled_text(self, content: str, style: Dict[str, str], as_html: bool = False) -> str:
+        content = content.replace('\xa0', ' ')
+        if not content.strip():
+            return content
+        stripped = content.strip(' ')
+        leading = content[:len(content) - len(content.lstrip(' '))]
+        trailing = content[len(content.rstrip(' ')):]
+
+        if as_html:
+            text = escape_html(stripped, quote=False)
+            markup = ('<code>{}</code>', '<del>{}</del>', '<em>{}</em>', '<strong>{}</strong>')
+        else:
+            text = escape_markdown(stripped)
+            markup = ('`{}`', '~~{}~~', '*{}*', '**{}**')
+        code, strikethrough, italic, bold = markup
+        if self._is_monospace(style):
+            text = code.format(text if as_html else stripped)
+        else:
+            if 'line-through' in style.get('text-decoration', ''):
+                text = strikethrough.format(text)
+            if style.get('font-style') == 'italic':
+                text = italic.format(text)
+            if style.get('font-weight') in ('700', 'bold'):
+                text = bold.format(text)
+        return f"{leading}{text}{trailing}"
+
+    def render(self) -> str:
+        self._flush()
+        blocks = self.blocks + (['\n'.join(self.footnote_defs)] if self.footnote_defs else [])
+        return '\n\n'.join(blocks) + '\n'
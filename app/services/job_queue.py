@@ -0,0 +1,234 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from collections import OrderedDict
+from datetime import datetime
+from .health import CircuitOpenError
+import asyncio
+import os
+import random
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Stage states reported by GET /api/jobs/{id}
+STAGE_PENDING = "pending"
+STAGE_RUNNING = "running"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+STAGE_SKIPPED = "skipped"
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_PARKED = "parked"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class Job:
+    def __init__(self, kind: str, payload: Dict[str, Any], stages: List[str]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.status = JOB_QUEUED
+        self.stages: Dict[str, str] = OrderedDict((stage, STAGE_PENDING) for stage in stages)
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        # Set while the job waits for a dependency to recover
+        self.parked_at: Optional[datetime] = None
+
+    def start_stage(self, stage: str):
+        """Mark a stage as running"""
+        self.stages[stage] = STAGE_RUNNING
+
+    def finish_stage(self, stage: str):
+        """Mark a stage as completed"""
+        self.stages[stage] = STAGE_DONE
+
+    def skip_stage(self, stage: str):
+        """Mark a stage as not needed for this job"""
+        self.stages[stage] = STAGE_SKIPPED
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stages": dict(self.stages),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "parked_at": self.parked_at,
+        }
+
+
+class JobQueue:
+    def __init__(
+        self,
+        handlers: Dict[str, Callable[[Job], Awaitable[Dict[str, Any]]]],
+        workers: Optional[int] = None,
+        max_size: Optional[int] = None,
+        max_history: Optional[int] = None,
+        park_timeout: Optional[float] = None
+    ):
+        """
+        In-process job queue drained by a fixed pool of asyncio workers. A job
+        that hits an open circuit breaker is parked, off the workers, and
+        queued again once the circuit lets calls through.
+
+        Args:
+            handlers (Dict): Coroutine to run for each job kind
+            workers (int, optional): Number of concurrent workers
+            max_size (int, optional): Maximum number of jobs waiting in the queue
+            max_history (int, optional): Number of jobs kept for status polling
+            park_timeout (float, optional): Seconds a job may stay parked before it fails
+        """
+        self.handlers = handlers
+        self.workers = workers or int(os.getenv('CONVERSION_WORKERS', '4'))
+        self.max_size = max_size or int(os.getenv('CONVERSION_QUEUE_SIZE', '1000'))
+        self.max_history = max_history or int(os.getenv('CONVERSION_JOB_HISTORY', '10000'))
+        self.park_timeout = park_timeout or float(os.getenv('CONVERSION_PARK_TIMEOUT', '1800'))
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._parked: Set[asyncio.Task] = set()
+
+    async def start(self):
+        """Start the worker pool"""
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(n), name=f"job-worker-{n}")
+            for n in range(self.workers)
+        ]
+        logger.info(f"Started {self.workers} job workers (queue size {self.max_size})")
+
+    async def stop(self):
+        """Cancel the worker pool; queued and parked jobs are dropped"""
+        tasks = self._tasks + list(self._parked)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._parked = set()
+
+    def submit(self, kind: str, payload: Dict[str, Any], stages: List[str]) -> Job:
+        """
+        Enqueue a job without waiting for it to run
+
+        Args:
+            kind (str): Job kind, used to select the handler
+            payload (Dict): Handler input
+            stages (List[str]): Stage names reported while the job runs
+
+        Returns:
+            Job: The queued job
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self._queue is None:
+            raise RuntimeError("Job queue has not been started")
+
+        job = Job(kind, payload, stages)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.max_size} jobs waiting)")
+
+        self.jobs[job.id] = job
+        self._prune_history()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def parked(self) -> int:
+        return len(self._parked)
+
+    def _prune_history(self):
+        """Drop the oldest finished jobs once the history limit is exceeded"""
+        excess = len(self.jobs) - self.max_history
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished][:excess]:
+            del self.jobs[job_id]
+
+    async def _worker(self, n: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        job.status = JOB_RUNNING
+        job.started_at = datetime.now()
+        try:
+            job.result = await self.handlers[job.kind](job)
+            job.status = JOB_SUCCEEDED
+            job.error = None
+        except CircuitOpenError as e:
+            if not self._park(job, e):
+                self._fail(job, e)
+        except Exception as e:
+            self._fail(job, e)
+        finally:
+            if job.finished:
+                job.finished_at = datetime.now()
+
+    def _fail(self, job: Job, error: Exception):
+        logger.error(f"Job {job.id} ({job.kind}) failed: {str(error)}")
+        job.error = str(error)
+        job.status = JOB_FAILED
+        for stage, state in job.stages.items():
+            if state == STAGE_RUNNING:
+                job.stages[stage] = STAGE_FAILED
+
+    def _park(self, job: Job, error: CircuitOpenError) -> bool:
+        """
+        Set a job aside until the circuit that stopped it lets a trial call
+        through. It runs again from the start; handlers keep what must
+        survive a rerun, such as the branch already committed to, in the payload.
+
+        Returns:
+            bool: False if the job has been parked for longer than park_timeout
+        """
+        now = datetime.now()
+        job.parked_at = job.parked_at or now
+        remaining = self.park_timeout - (now - job.parked_at).total_seconds()
+        if remaining <= 0:
+            return False
+        job.status = JOB_PARKED
+        job.error = str(error)
+        for stage in job.stages:
+            job.stages[stage] = STAGE_PENDING
+
+        # Jittered so parked jobs don't all retry at the moment the circuit half
+        # opens, and never past the park timeout
+        delay = min(max(error.retry_in, 1.0) * random.uniform(1.0, 1.5), remaining)
+        logger.warning(f"Job {job.id} ({job.kind}) parked for {delay:.0f}s: {str(error)}")
+        task = asyncio.create_task(self._requeue(job, delay))
+        self._parked.add(task)
+        task.add_done_callback(self._parked.discard)
+        return True
+
+    async def _requeue(self, job: Job, delay: float):
+        await asyncio.sleep(delay)
+        job.status = JOB_QUEUED
+        await self._queue.put(job)
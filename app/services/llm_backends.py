@@ -0,0 +1,323 @@
+from typing import AsyncIterator, Dict, Optional
+import httpx
+from openai import APIConnectionError, APIStatusError, AsyncAzureOpenAI, AsyncOpenAI
+import asyncio
+import os
+import re
+import logging
+from .health import CircuitBreaker, is_outage
+from .rate_limiter import MESSAGE_OVERHEAD_TOKENS, OpenAIRateLimiter, estimate_tokens, parse_duration, retry_delay
+
+logger = logging.getLogger(__name__)
+
+# Instruction preceding the document content in every conversion prompt
+CONVERT_INSTRUCTION = "Convert this Google Docs content to Markdown:"
+
+# Status codes of model calls worth retrying
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# LLM_BACKEND values: OpenAI, Azure OpenAI, any OpenAI-compatible server, no network
+LLM_BACKENDS = ("openai", "azure", "local", "offline")
+
+# Backend -> prefix of its environment variables
+BACKEND_ENV_PREFIXES = {
+    "openai": "OPENAI",
+    "azure": "AZURE_OPENAI",
+    "local": "LOCAL_LLM",
+}
+
+
+class ResponseTruncatedError(Exception):
+    """Raised when the model stops because it ran out of output tokens"""
+
+    def __init__(self, partial: str):
+        super().__init__("Model output was truncated at max_tokens")
+        self.partial = partial
+
+
+class LLMBackend:
+    def __init__(self, name: str, model: str, timeout: float, max_concurrency: int):
+        """
+        A chat completion endpoint conversions can be sent to
+
+        Args:
+            name (str): LLM_BACKEND value selecting this backend
+            model (str): Model or deployment name; part of the conversion cache key
+            timeout (float): Seconds before a single call is abandoned
+            max_concurrency (int): Upper bound on calls in flight
+        """
+        self.name = name
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.breaker = CircuitBreaker(name, is_failure=lambda e: isinstance(e, APIConnectionError) or is_outage(e))
+
+    async def complete(self, system_prompt: str, user_prompt: str, temperature: float, max_tokens: int) -> str:
+        """
+        Run one conversion call
+
+        Returns:
+            str: The model output
+
+        Raises:
+            ResponseTruncatedError: The output hit max_tokens
+        """
+        raise NotImplementedError
+
+    async def stream(self, system_prompt: str, user_prompt: str, temperature: float,
+                     max_tokens: int) -> AsyncIterator[str]:
+        """
+        Run one conversion call, yielding the output as it is produced
+
+        Raises:
+            ResponseTruncatedError: The output hit max_tokens, after the
+                partial output has been yielded
+        """
+        raise NotImplementedError
+        yield
+
+    async def check(self) -> bool:
+        """Whether the backend answers, without spending tokens"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, "model": self.model}
+
+
+class OpenAIBackend(LLMBackend):
+    def __init__(self, name: str, client: AsyncOpenAI, model: str, timeout: float, max_concurrency: int,
+                 requests_per_minute: int, tokens_per_minute: int, max_retries: int):
+        """
+        OpenAI chat completions API, or anything speaking it. Calls are
+        scheduled by a rate limiter against the endpoint's RPM/TPM budgets and
+        429/5xx responses are retried with jittered backoff.
+
+        Args:
+            client (AsyncOpenAI): Configured client; its own retries must be disabled
+            requests_per_minute (int): Request budget, 0 to learn it from response headers
+            tokens_per_minute (int): Token budget, 0 to learn it from response headers
+            max_retries (int): Retries of a failed call
+        """
+        super().__init__(name, model, timeout, max_concurrency)
+        self.client = client
+        self.max_retries = max_retries
+        self.rate_limiter = OpenAIRateLimiter(
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            max_concurrency=max_concurrency
+        )
+
+    def _reservation(self, system_prompt: str, user_prompt: str, max_tokens: int) -> int:
+        """Tokens a call may consume: the estimated prompt plus the whole completion allowance"""
+        prompt_tokens = estimate_tokens(system_prompt, self.model) + estimate_tokens(user_prompt, self.model)
+        return prompt_tokens + 2 * MESSAGE_OVERHEAD_TOKENS + max_tokens
+
+    def _retry_after(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying a failed call, or None if it must not be retried"""
+        if isinstance(error, APIConnectionError):
+            return retry_delay(attempt)
+        if not isinstance(error, APIStatusError) or error.status_code not in RETRYABLE_STATUSES:
+            return None
+        if error.code == 'insufficient_quota':
+            # Billing problem rather than a rate limit; waiting does not help
+            return None
+
+        headers = error.response.headers
+        self.rate_limiter.observe(headers)
+        server_delay = None
+        if headers.get('retry-after-ms'):
+            server_delay = float(headers['retry-after-ms']) / 1000
+        elif headers.get('retry-after', '').isdigit():
+            server_delay = float(headers['retry-after'])
+        elif error.status_code == 429:
+            server_delay = max(parse_duration(headers.get('x-ratelimit-reset-requests')),
+                               parse_duration(headers.get('x-ratelimit-reset-tokens'))) or None
+        delay = retry_delay(attempt, server_delay)
+        if error.status_code == 429:
+            self.rate_limiter.rate_limited(delay)
+        return delay
+
+    async def complete(self, system_prompt: str, user_prompt: str, temperature: float, max_tokens: int) -> str:
+        reserved = self._reservation(system_prompt, user_prompt, max_tokens)
+        for attempt in range(self.max_retries + 1):
+            try:
+                # An open circuit fails the call at once rather than queueing it for a slot
+                async with self.breaker.guard(), self.rate_limiter.slot(reserved):
+                    raw = await self.client.chat.completions.with_raw_response.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        temperature=temperature,
+                        max_tokens=max_tokens
+                    )
+                    self.rate_limiter.observe(raw.headers)
+                response = raw.parse()
+                if response.usage:
+                    self.rate_limiter.refund(reserved - response.usage.total_tokens)
+
+                choice = response.choices[0]
+                content = choice.message.content.strip()
+                if choice.finish_reason == "length":
+                    raise ResponseTruncatedError(content)
+                return content
+
+            except ResponseTruncatedError:
+                raise
+            except Exception as e:
+                delay = self._retry_after(e, attempt)
+                if delay is None or attempt == self.max_retries:
+                    logger.error(f"Error in {self.name} API call: {str(e)}")
+                    raise
+                logger.warning(f"{self.name} API call failed ({str(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def stream(self, system_prompt: str, user_prompt: str, temperature: float,
+                     max_tokens: int) -> AsyncIterator[str]:
+        # Failures are retried like complete until the first token has been yielded
+        reserved = self._reservation(system_prompt, user_prompt, max_tokens)
+        started = False
+        streamed = []
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.breaker.guard(), self.rate_limiter.slot(reserved):
+                    raw = await self.client.chat.completions.with_raw_response.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+                    self.rate_limiter.observe(raw.headers)
+                    async for event in raw.parse():
+                        if event.usage:
+                            self.rate_limiter.refund(reserved - event.usage.total_tokens)
+                        if not event.choices:
+                            continue
+                        if event.choices[0].delta.content:
+                            started = True
+                            streamed.append(event.choices[0].delta.content)
+                            yield event.choices[0].delta.content
+                        if event.choices[0].finish_reason == "length":
+                            raise ResponseTruncatedError(''.join(streamed).strip())
+                return
+            except ResponseTruncatedError:
+                raise
+            except Exception as e:
+                delay = None if started else self._retry_after(e, attempt)
+                if delay is None or attempt == self.max_retries:
+                    logger.error(f"Error in {self.name} streaming call: {str(e)}")
+                    raise
+                logger.warning(f"{self.name} streaming call failed ({str(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def check(self) -> bool:
+        # Listing models needs no completion tokens and no rate limiter slot
+        async with self.breaker.guard():
+            await self.client.models.list()
+        return True
+
+    def stats(self) -> Dict:
+        return {**super().stats(), **self.rate_limiter.stats()}
+
+
+class OfflineBackend(LLMBackend):
+    def __init__(self, name: str = "offline"):
+        """
+        Deterministic backend without any network access, for tests and
+        air-gapped runs. The prompt already carries the document as compact
+        Markdown, so it returns that content with the prompt-only tags removed
+        and lists indented with spaces again.
+        """
+        super().__init__(name, "offline", timeout=0, max_concurrency=1)
+
+    @staticmethod
+    def _content(user_prompt: str) -> str:
+        _, found, content = user_prompt.partition(f"{CONVERT_INSTRUCTION}\n\n")
+        content = content if found else user_prompt
+        content = re.sub(r'(?m)^\t+', lambda match: '    ' * len(match.group(0)), content)
+        return re.sub(r'</?u>', '', content).strip()
+
+    async def complete(self, system_prompt: str, user_prompt: str, temperature: float, max_tokens: int) -> str:
+        return self._content(user_prompt)
+
+    async def stream(self, system_prompt: str, user_prompt: str, temperature: float,
+                     max_tokens: int) -> AsyncIterator[str]:
+        for line in self._content(user_prompt).splitlines(keepends=True):
+            yield line
+
+    async def check(self) -> bool:
+        return True
+
+
+def _settings(prefix: str, name: str, default: str) -> str:
+    return os.getenv(f"{prefix}_{name}", default)
+
+
+def create_backend(name: str) -> LLMBackend:
+    """
+    Build the backend selected by an LLM_BACKEND value from its environment
+    variables (<PREFIX>_MODEL, _TIMEOUT, _CONNECT_TIMEOUT, _MAX_CONCURRENCY,
+    _REQUESTS_PER_MINUTE, _TOKENS_PER_MINUTE, see BACKEND_ENV_PREFIXES)
+
+    Args:
+        name (str): "openai", "azure", "local" (any OpenAI-compatible server) or "offline"
+
+    Returns:
+        LLMBackend: The configured backend
+    """
+    if name not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {name}")
+    if name == "offline":
+        return OfflineBackend(name)
+
+    prefix = BACKEND_ENV_PREFIXES[name]
+    timeout = float(_settings(prefix, 'TIMEOUT', '120'))
+    # Unreachable endpoints fail within the connect timeout instead of the whole call timeout
+    client_timeout = httpx.Timeout(timeout, connect=float(_settings(prefix, 'CONNECT_TIMEOUT', '5')))
+    if name == "openai":
+        api_key = os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            raise ValueError("OpenAI API key not found in environment variables")
+        client = AsyncOpenAI(api_key=api_key, timeout=client_timeout, max_retries=0)
+        model = _settings(prefix, 'MODEL', 'gpt-4o-mini')
+        default_rpm, default_tpm = '500', '200000'
+    elif name == "azure":
+        api_key, endpoint = os.getenv('AZURE_OPENAI_KEY'), os.getenv('AZURE_OPENAI_ENDPOINT')
+        model = os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME')
+        if not api_key or not endpoint or not model:
+            raise ValueError("AZURE_OPENAI_KEY, AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_DEPLOYMENT_NAME must be set")
+        client = AsyncAzureOpenAI(
+            api_key=api_key,
+            azure_endpoint=endpoint,
+            api_version=_settings(prefix, 'API_VERSION', '2024-06-01'),
+            timeout=client_timeout,
+            max_retries=0
+        )
+        # Azure enforces limits per deployment; learn them from the response headers by default
+        default_rpm, default_tpm = '0', '0'
+    else:
+        base_url = _settings(prefix, 'BASE_URL', '')
+        if not base_url:
+            raise ValueError("LOCAL_LLM_BASE_URL must be set for the local backend")
+        # Local servers usually accept any key but the client requires one
+        client = AsyncOpenAI(base_url=base_url, api_key=_settings(prefix, 'API_KEY', 'local'),
+                             timeout=client_timeout, max_retries=0)
+        model = _settings(prefix, 'MODEL', 'default')
+        default_rpm, default_tpm = '0', '0'
+
+    return OpenAIBackend(
+        name,
+        client,
+        model,
+        timeout=timeout,
+        max_concurrency=int(_settings(prefix, 'MAX_CONCURRENCY', '16')),
+        requests_per_minute=int(_settings(prefix, 'REQUESTS_PER_MINUTE', default_rpm)),
+        tokens_per_minute=int(_settings(prefix, 'TOKENS_PER_MINUTE', default_tpm)),
+        max_retries=int(os.getenv('LLM_MAX_RETRIES', '6'))
+    )
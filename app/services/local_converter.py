@@ -0,0 +1,531 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+import hashlib
+import html
+import os
+import re
+import logging
+from .assets import image_ref
+from .docs_walker import DocumentVisitor, paragraph_text, walk_document
+from .table_converter import TableConverter
+
+logger = logging.getLogger(__name__)
+
+# Glyph types Google Docs uses for numbered list levels
+ORDERED_GLYPH_TYPES = {'DECIMAL', 'ZERO_DECIMAL', 'ALPHA', 'UPPER_ALPHA', 'ROMAN', 'UPPER_ROMAN'}
+
+# Fonts treated as code when a run or a whole paragraph uses them
+MONOSPACE_FONTS = {
+    'Courier New', 'Courier', 'Consolas', 'Roboto Mono', 'Source Code Pro',
+    'Inconsolata', 'Fira Code', 'Fira Mono', 'JetBrains Mono', 'Ubuntu Mono',
+    'Space Mono', 'IBM Plex Mono', 'Cousine', 'Menlo', 'Monaco'
+}
+
+HEADING_STYLES = {
+    'TITLE': 1,
+    'SUBTITLE': 2,
+    'HEADING_1': 1,
+    'HEADING_2': 2,
+    'HEADING_3': 3,
+    'HEADING_4': 4,
+    'HEADING_5': 5,
+    'HEADING_6': 6,
+}
+
+_ESCAPE_RE = re.compile(r'([\\`*_\[\]])')
+
+# Links to headings are emitted as placeholders and resolved once every
+# heading has been seen, so forward references need no second pass
+# \x01 separates Markdown links, \x02 HTML links (inside HTML tables)
+_HEADING_LINK_RE = re.compile('\x00([^\x00\x01\x02]*)([\x01\x02])([^\x00]*)\x00')
+
+_HEADING_BLOCK_RE = re.compile(r'(#{1,6}) ')
+
+# Model prompts reference link targets as [text](link:<hash of the URL>):
+# Docs URLs are long, and a hash stays the same wherever the link moves, so
+# unchanged sections keep hitting the section cache
+_LINK_REF_RE = re.compile(r'(\]\(|href=")link:([0-9a-f]{8})([)"])')
+
+# Inline markup per style, in Markdown and in HTML for HTML table cells
+_MARKDOWN_MARKUP = {'code': '`{}`', 'strikethrough': '~~{}~~', 'italic': '*{}*', 'bold': '**{}**'}
+_HTML_MARKUP = {'code': '<code>{}</code>', 'strikethrough': '<del>{}</del>', 'italic': '<em>{}</em>',
+                'bold': '<strong>{}</strong>'}
+
+# Text style attributes that change the Markdown of a run
+_RENDERED_STYLES = ('bold', 'italic', 'strikethrough', 'underline', 'baselineOffset', 'link')
+
+
+def escape_markdown(text: str) -> str:
+    """Escape characters that would otherwise be read as Markdown syntax"""
+    return _ESCAPE_RE.sub(r'\\\1', text)
+
+
+def link_ref(url: str) -> str:
+    """Short stable reference to a link target used in prompts and cached Markdown"""
+    return f"link:{hashlib.sha256(url.encode()).hexdigest()[:8]}"
+
+
+def document_links(document: Dict) -> Dict[str, str]:
+    """
+    Link targets of a Docs API document, including those in tables and footnotes
+
+    Returns:
+        Dict[str, str]: link_ref -> URL
+    """
+    links = {}
+    pending = [document]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, dict):
+            # textStyle.link of text runs, richLinkProperties of smart chips
+            link = node.get('link')
+            url = link.get('url') if isinstance(link, dict) else None
+            rich_link = node.get('richLinkProperties')
+            url = url or (rich_link.get('uri') if isinstance(rich_link, dict) else None)
+            if url:
+                links[link_ref(url)] = url
+            pending.extend(node.values())
+        elif isinstance(node, list):
+            pending.extend(node)
+    return links
+
+
+def resolve_link_refs(markdown: str, links: Dict[str, str]) -> str:
+    """Replace link:<hash> targets with their URLs; unknown references are left as they are"""
+    def replace(match):
+        url = links.get(f"link:{match.group(2)}")
+        if not url:
+            return match.group(0)
+        if match.group(3) == '"':
+            url = _html_attribute(url)
+        return f"{match.group(1)}{url}{match.group(3)}"
+    return _LINK_REF_RE.sub(replace, markdown)
+
+
+def _escape_html(text: str) -> str:
+    return html.escape(text, quote=False)
+
+
+def _html_attribute(value: str) -> str:
+    return html.escape(value, quote=True)
+
+
+def _link(text: str, target: str, as_html: bool) -> str:
+    if as_html:
+        return f'<a href="{_html_attribute(target)}">{text}</a>'
+    return f"[{text}]({target})"
+
+
+def _image(alt: str, uri: str, as_html: bool) -> str:
+    if as_html:
+        # The URI is left unescaped so localize finds it; only a quote could end the attribute
+        src = uri.replace('"', '%22')
+        return f'<img src="{src}" alt="{_html_attribute(alt)}">'
+    return f"![{escape_markdown(alt)}]({uri})"
+
+
+def slugify(text: str) -> str:
+    """Anchor MkDocs generates for a heading"""
+    slug = re.sub(r'[^\w\s-]', '', text.lower()).strip()
+    return re.sub(r'[\s]+', '-', slug)
+
+
+class LocalConversion:
+    def __init__(self, markdown: str, issues: List[str], blocks: int):
+        """
+        Result of a local conversion
+
+        Args:
+            markdown (str): Converted Markdown
+            issues (List[str]): Content the converter could not represent faithfully
+            blocks (int): Number of structural elements converted
+        """
+        self.markdown = markdown
+        self.issues = issues
+        self.blocks = blocks
+
+    @property
+    def issue_ratio(self) -> float:
+        return len(self.issues) / max(self.blocks, 1)
+
+
+class LocalMarkdownConverter:
+    def __init__(self, max_issue_ratio: Optional[float] = None):
+        """
+        Deterministic Google Docs JSON -> Markdown converter that runs on CPU
+        without calling a model
+
+        Args:
+            max_issue_ratio (float, optional): Share of problematic elements above
+                which hybrid mode hands the document to the LLM instead
+        """
+        if max_issue_ratio is None:
+            max_issue_ratio = float(os.getenv('HYBRID_MAX_ISSUE_RATIO', '0.05'))
+        self.max_issue_ratio = max_issue_ratio
+
+    def convert(self, document: Dict) -> LocalConversion:
+        """
+        Convert a Docs API document to Markdown
+
+        Args:
+            document (Dict): documents.get response
+
+        Returns:
+            LocalConversion: Markdown plus the issues found while converting
+        """
+        state = self.visitor(document)
+        walk_document(document, [state])
+        return state.result()
+
+    def visitor(self, document: Dict) -> '_ConversionState':
+        """
+        Visitor producing the conversion of document, for callers that walk
+        the document together with other visitors; call result() afterwards
+        """
+        return _ConversionState(document)
+
+    def prompt_visitor(self, document: Dict) -> 'PromptVisitor':
+        """
+        Visitor producing the compact representation of document sent to the
+        model; call prompt_blocks() afterwards
+        """
+        return PromptVisitor(document)
+
+    def needs_llm(self, conversion: LocalConversion) -> bool:
+        """Whether a document is too messy for the local converter alone"""
+        return conversion.issue_ratio > self.max_issue_ratio
+
+
+class _ConversionState(DocumentVisitor):
+    # Indentation per list nesting level; MkDocs needs four spaces
+    list_indent = '    '
+
+    def __init__(self, document: Dict):
+        self.lists = document.get('lists', {})
+        self.inline_objects = document.get('inlineObjects', {})
+        self.footnotes = document.get('footnotes', {})
+        self.blocks: List[str] = []
+        self.issues: List[str] = []
+        self.block_count = 0
+        self.footnote_defs: List[str] = []
+        self._list_lines: List[str] = []
+        self._list_id: Optional[str] = None
+        self._code_lines: List[str] = []
+        # headingId -> MkDocs anchor, so internal links survive conversion
+        self.heading_anchors: Dict[str, str] = {}
+        self.tables = TableConverter(
+            lambda paragraph: self._convert_elements(paragraph.get('elements', [])).strip(),
+            lambda paragraph: self._convert_elements(paragraph.get('elements', []), as_html=True).strip(),
+        )
+
+    # Block handling
+
+    def _flush(self):
+        if self._list_lines:
+            self.blocks.append('\n'.join(self._list_lines))
+            self._list_lines = []
+            self._list_id = None
+        if self._code_lines:
+            self.blocks.append('```\n' + '\n'.join(self._code_lines) + '\n```')
+            self._code_lines = []
+
+    # Document events
+
+    def paragraph(self, paragraph: Dict, depth: int):
+        # Table content is converted with its table, see end_table
+        if depth == 0:
+            self.block_count += 1
+            self._convert_paragraph(paragraph)
+        else:
+            self.tables.paragraph(paragraph, depth)
+
+    def start_table(self, table: Dict, depth: int):
+        if depth == 0:
+            self.block_count += 1
+            self._flush()
+        self.tables.start_table(table, depth)
+
+    def end_table(self, table: Dict, depth: int):
+        self.tables.end_table(table, depth)
+        if depth == 0 and self.tables.result:
+            self.blocks.append(self.tables.result)
+
+    def start_row(self, row: Dict, depth: int):
+        self.tables.start_row(row, depth)
+
+    def start_cell(self, cell: Dict, depth: int):
+        self.tables.start_cell(cell, depth)
+
+    def end_cell(self, cell: Dict, depth: int):
+        self.tables.end_cell(cell, depth)
+
+    def table_of_contents(self, toc: Dict, depth: int):
+        # MkDocs renders its own table of contents
+        if depth == 0:
+            self._flush()
+
+    def unsupported(self, element: Dict, depth: int):
+        if depth == 0:
+            self.block_count += 1
+            self.issues.append(f"unsupported element: {next(iter(element.keys() - {'startIndex', 'endIndex'}), '?')}")
+
+    def _convert_paragraph(self, paragraph: Dict):
+        style = paragraph.get('paragraphStyle', {})
+        elements = paragraph.get('elements', [])
+
+        if self._is_code_paragraph(elements):
+            if self._list_lines:
+                self._flush()
+            raw = ''.join(e['textRun'].get('content', '') for e in elements if 'textRun' in e)
+            self._code_lines.append(raw.rstrip('\n').replace('\x0b', '\n'))
+            return
+        if self._code_lines:
+            self._flush()
+
+        heading_id = style.get('headingId')
+        if heading_id:
+            self.heading_anchors[heading_id] = slugify(paragraph_text(paragraph).strip())
+
+        text = self._convert_elements(elements).strip()
+        bullet = paragraph.get('bullet')
+
+        if bullet and text:
+            # A different list directly after another one starts a new block
+            if bullet.get('listId') != self._list_id:
+                self._flush()
+                self._list_id = bullet.get('listId')
+            level = bullet.get('nestingLevel', 0)
+            marker = '1.' if self._is_ordered(bullet.get('listId'), level) else '-'
+            self._list_lines.append(f"{self.list_indent * level}{marker} {text}")
+            return
+
+        self._flush()
+        has_rule = any('horizontalRule' in e for e in elements)
+        if not text:
+            if has_rule:
+                self.blocks.append('---')
+            return
+
+        heading_level = HEADING_STYLES.get(style.get('namedStyleType', ''), 0)
+        if heading_level:
+            self.blocks.append(f"{'#' * heading_level} {text}")
+        elif has_rule:
+            self.blocks.append(text)
+            self.blocks.append('---')
+        else:
+            if self._looks_like_fake_heading(elements):
+                self.issues.append(f"styled paragraph used as heading: {text[:40]}")
+            self.blocks.append(text)
+
+    def _is_code_paragraph(self, elements: List[Dict]) -> bool:
+        runs = [e['textRun'] for e in elements if 'textRun' in e and e['textRun'].get('content', '').strip()]
+        return bool(runs) and all('textRun' in e for e in elements) and all(self._is_code_run(run) for run in runs)
+
+    @staticmethod
+    def _is_code_run(run: Dict) -> bool:
+        font = run.get('textStyle', {}).get('weightedFontFamily', {}).get('fontFamily')
+        return font in MONOSPACE_FONTS
+
+    @staticmethod
+    def _looks_like_fake_heading(elements: List[Dict]) -> bool:
+        """Bold, enlarged normal text is how many docs fake a heading"""
+        runs = [e['textRun'] for e in elements if 'textRun' in e and e['textRun'].get('content', '').strip()]
+        if not runs:
+            return False
+        return all(
+            run.get('textStyle', {}).get('bold')
+            and run.get('textStyle', {}).get('fontSize', {}).get('magnitude', 0) >= 14
+            for run in runs
+        )
+
+    def _is_ordered(self, list_id: Optional[str], level: int) -> bool:
+        levels = self.lists.get(list_id, {}).get('listProperties', {}).get('nestingLevels', [])
+        if level < len(levels):
+            return levels[level].get('glyphType') in ORDERED_GLYPH_TYPES
+        return False
+
+    # Inline handling
+
+    @classmethod
+    def _rendered_style(cls, run: Dict) -> Tuple:
+        """The parts of a run's style that show in Markdown"""
+        style = run.get('textStyle', {})
+        return tuple(style.get(key) for key in _RENDERED_STYLES) + (cls._is_code_run(run),)
+
+    @classmethod
+    def _merge_runs(cls, elements: List[Dict]) -> Iterator[Dict]:
+        """
+        Join consecutive text runs that render the same. The API splits runs at
+        edit and spell-check boundaries, and at font size or color changes
+        Markdown cannot show, which would otherwise give **a****b**.
+        """
+        pending = None
+        for elem in elements:
+            if 'textRun' in elem and pending is not None \
+                    and cls._rendered_style(elem['textRun']) == cls._rendered_style(pending['textRun']):
+                pending = {'textRun': {**pending['textRun'],
+                                       'content': pending['textRun'].get('content', '') + elem['textRun'].get('content', '')}}
+                continue
+            if pending is not None:
+                yield pending
+                pending = None
+            if 'textRun' in elem:
+                pending = elem
+            else:
+                yield elem
+        if pending is not None:
+            yield pending
+
+    def _convert_elements(self, elements: List[Dict], as_html: bool = False) -> str:
+        """
+        Inline content of a paragraph
+
+        Args:
+            elements (List[Dict]): Paragraph elements
+            as_html (bool): Render HTML instead of Markdown, for cells of HTML
+                tables where Markdown is not parsed
+
+        Returns:
+            str: Rendered content
+        """
+        escape = _escape_html if as_html else escape_markdown
+        parts = []
+        for elem in self._merge_runs(elements):
+            if 'textRun' in elem:
+                parts.append(self._convert_text_run(elem['textRun'], as_html))
+            elif 'inlineObjectElement' in elem:
+                parts.append(self._convert_inline_object(elem['inlineObjectElement'], as_html))
+            elif 'footnoteReference' in elem:
+                parts.append(self._convert_footnote(elem['footnoteReference'], as_html))
+            elif 'richLink' in elem:
+                props = elem['richLink'].get('richLinkProperties', {})
+                parts.append(_link(escape(props.get('title', props.get('uri', ''))),
+                                   self._link_target(props.get('uri', '')), as_html))
+            elif 'person' in elem:
+                props = elem['person'].get('personProperties', {})
+                parts.append(escape(props.get('name') or props.get('email', '')))
+            elif 'horizontalRule' in elem or 'pageBreak' in elem or 'columnBreak' in elem:
+                continue
+            else:
+                self.issues.append(f"unsupported inline element: {next(iter(elem.keys() - {'startIndex', 'endIndex'}), '?')}")
+        return ''.join(parts)
+
+    def _convert_text_run(self, run: Dict, as_html: bool = False) -> str:
+        line_break = '<br>' if as_html else '  \n'
+        content = run.get('content', '').replace('\n', '')
+        if not content.strip():
+            return content.replace('\x0b', line_break)
+
+        # Keep surrounding whitespace outside of the emphasis markers
+        stripped = content.strip(' ')
+        leading = content[:len(content) - len(content.lstrip(' '))]
+        trailing = content[len(content.rstrip(' ')):]
+        style = run.get('textStyle', {})
+
+        if as_html:
+            text = _escape_html(stripped)
+            markup = _HTML_MARKUP
+        else:
+            text = escape_markdown(stripped)
+            markup = _MARKDOWN_MARKUP
+        if self._is_code_run(run):
+            text = markup['code'].format(text if as_html else stripped)
+        else:
+            for key in ('strikethrough', 'italic', 'bold'):
+                if style.get(key):
+                    text = markup[key].format(text)
+            text = self._extra_styles(text, style)
+
+        link = style.get('link', {})
+        if link.get('url'):
+            text = _link(text, self._link_target(link['url']), as_html)
+        elif link.get('headingId'):
+            separator = '\x02' if as_html else '\x01'
+            text = f"\x00{link['headingId']}{separator}{text}\x00"
+
+        return f"{leading}{text}{trailing}".replace('\x0b', line_break)
+
+    def _extra_styles(self, text: str, style: Dict) -> str:
+        """Markup for styles beyond bold, italic and strikethrough; Markdown output drops them"""
+        return text
+
+    def _link_target(self, url: str) -> str:
+        return url
+
+    def _convert_inline_object(self, element: Dict, as_html: bool = False) -> str:
+        inline_object = self.inline_objects.get(element.get('inlineObjectId'), {})
+        embedded = inline_object.get('inlineObjectProperties', {}).get('embeddedObject', {})
+        uri = embedded.get('imageProperties', {}).get('contentUri')
+        if not uri:
+            self.issues.append("inline object without image")
+            return ''
+        alt = embedded.get('title') or embedded.get('description') or ''
+        return _image(alt, uri, as_html)
+
+    def _convert_footnote(self, reference: Dict, as_html: bool = False) -> str:
+        number = reference.get('footnoteNumber', str(len(self.footnote_defs) + 1))
+        footnote = self.footnotes.get(reference.get('footnoteId'), {})
+        text = ' '.join(
+            self._convert_elements(element['paragraph'].get('elements', [])).strip()
+            for element in footnote.get('content', []) if 'paragraph' in element
+        )
+        self.footnote_defs.append(f"[^{number}]: {text}")
+        # Footnote references are not parsed inside HTML tables
+        return f"<sup>{number}</sup>" if as_html else f"[^{number}]"
+
+    def _resolve_heading_link(self, match) -> str:
+        anchor = self.heading_anchors.get(match.group(1))
+        if anchor is None:
+            return match.group(3)
+        return _link(match.group(3), f"#{anchor}", match.group(2) == '\x02')
+
+    def render(self) -> str:
+        self._flush()
+        blocks = self.blocks + (['\n'.join(self.footnote_defs)] if self.footnote_defs else [])
+        return _HEADING_LINK_RE.sub(self._resolve_heading_link, '\n\n'.join(blocks) + '\n')
+
+    def result(self) -> LocalConversion:
+        return LocalConversion(self.render(), self.issues, self.block_count)
+
+
+class PromptVisitor(_ConversionState):
+    """
+    Compact, lossless rendering of a document for model prompts: the local
+    converter's Markdown, with images and link targets as short image: and
+    link: references, lists indented with tabs and the styles Markdown has
+    no syntax for as minimal HTML tags
+    """
+
+    list_indent = '\t'
+
+    def _link_target(self, url: str) -> str:
+        # Only references shorter than the URL are worth resolving afterwards
+        ref = link_ref(url)
+        return ref if len(ref) < len(url) else url
+
+    def _extra_styles(self, text: str, style: Dict) -> str:
+        # Links are underlined by Docs itself
+        if style.get('underline') and not style.get('link'):
+            text = f"<u>{text}</u>"
+        offset = style.get('baselineOffset')
+        if offset == 'SUPERSCRIPT':
+            text = f"<sup>{text}</sup>"
+        elif offset == 'SUBSCRIPT':
+            text = f"<sub>{text}</sub>"
+        return text
+
+    def _convert_inline_object(self, element: Dict, as_html: bool = False) -> str:
+        inline_object = self.inline_objects.get(element.get('inlineObjectId'), {})
+        embedded = inline_object.get('inlineObjectProperties', {}).get('embeddedObject', {})
+        alt = embedded.get('title') or embedded.get('description') or ''
+        return _image(alt, image_ref(element.get('inlineObjectId', '')), as_html)
+
+    def prompt_blocks(self) -> List[Tuple[int, str]]:
+        """(heading level, text) per block, level 0 for anything but headings"""
+        self._flush()
+        blocks = self.blocks + (['\n'.join(self.footnote_defs)] if self.footnote_defs else [])
+        result = []
+        for block in blocks:
+            block = _HEADING_LINK_RE.sub(self._resolve_heading_link, block)
+            match = _HEADING_BLOCK_RE.match(block)
+            result.append((len(match.group(1)) if match else 0, block))
+        return result
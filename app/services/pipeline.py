@@ -0,0 +1,473 @@
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import os
+import logging
+from .assets import ImageAssets, inline_images
+from .google_docs import EXPORT_MIME_TYPES
+from .health import CircuitOpenError
+from .html_converter import HtmlMarkdownConverter
+from .job_queue import Job
+from .github_service import git_blob_sha
+
+logger = logging.getLogger(__name__)
+
+# Stages reported for a single document conversion job
+CONVERT_STAGES = ["fetch", "convert", "assets", "compare", "nav", "commit", "pr"]
+
+# Conversion mode that skips the Docs API and converts Google's own export
+EXPORT_MODE = "export"
+
+# Stages reported for a batch conversion job
+BATCH_STAGES = ["resolve", "convert", "compare", "commit", "pr"]
+
+
+def _clean_name(name: str) -> str:
+    return "".join(c if c.isalnum() or c in ('-', '_') else '_' for c in name).lower()
+
+
+def default_target_path(title: str, folders: Optional[List[str]] = None) -> str:
+    """Derive the docs/ path for a document from its title and the folders it is in"""
+    directory = "/".join(["docs"] + [_clean_name(folder) for folder in folders or []])
+    return f"{directory}/{_clean_name(title)}.md"
+
+
+def default_branch_name() -> str:
+    return f"doc_update_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+
+def unique_path(path: str, taken: set) -> str:
+    """Suffix path so that documents with the same title do not overwrite each other"""
+    candidate, n = path, 1
+    while candidate in taken:
+        n += 1
+        candidate = f"{path[:-len('.md')]}_{n}.md"
+    taken.add(candidate)
+    return candidate
+
+
+class ConversionPipeline:
+    def __init__(self, docs_service, ai_converter, github_service):
+        """Google Docs fetch -> Markdown conversion -> GitHub PR chain run by job workers"""
+        self.docs_service = docs_service
+        self.ai_converter = ai_converter
+        self.github_service = github_service
+        # Images are committed next to the pages unless ASSET_PIPELINE_ENABLED is false,
+        # in which case pages keep linking the Google-hosted contentUri
+        self.assets = ImageAssets(docs_service) if os.getenv('ASSET_PIPELINE_ENABLED', 'true').lower() == 'true' else None
+        # Export mode: files.export format, html (converted locally) or markdown (used as exported)
+        self.export_format = os.getenv('EXPORT_FORMAT', 'html').lower()
+        if self.export_format not in EXPORT_MIME_TYPES:
+            raise ValueError(f"Unknown EXPORT_FORMAT: {self.export_format}")
+        self.html_converter = HtmlMarkdownConverter()
+
+    def conversion_mode(self, mode: Optional[str]) -> str:
+        """Requested mode, or CONVERSION_MODE when none was given"""
+        return mode or self.ai_converter.default_mode
+
+    async def export_document(self, doc_id: str) -> Dict[str, Any]:
+        """Fetch a document as a Drive export in EXPORT_FORMAT"""
+        return await self.docs_service.export_document(doc_id, EXPORT_MIME_TYPES[self.export_format])
+
+    def convert_export(self, doc_content: Dict[str, Any]) -> Tuple[str, Dict[str, Dict[str, str]]]:
+        """
+        Markdown for an exported document, without a model call
+
+        Returns:
+            Tuple: (Markdown, images in the shape inline_images returns)
+        """
+        if self.export_format == 'markdown':
+            # Drive embeds the images of Markdown exports as data URIs; they stay inline
+            return self.html_converter.normalize_markdown(doc_content['content']), {}
+        conversion = self.html_converter.convert(doc_content['content'])
+        return conversion.markdown, conversion.images
+
+    async def export_markdown(self, doc_id: str) -> Tuple[str, str, Dict[str, Dict[str, str]]]:
+        """Export and convert a document in one step; returns (title, Markdown, images)"""
+        doc_content = await self.export_document(doc_id)
+        markdown_content, images = self.convert_export(doc_content)
+        return doc_content['title'], markdown_content, images
+
+    async def fetch_images(self, doc_id: str, images: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+        """Download the images of a document into the asset store; contentUri -> stored file name"""
+        if self.assets is None or not images:
+            return {}
+        return await self.assets.fetch(doc_id, images)
+
+    async def localize_images(self, markdown_content: str, target_path: str,
+                        stored: Dict[str, str]) -> Tuple[str, Dict[str, bytes]]:
+        """Rewrite image links to the asset files; returns the Markdown and the files to commit"""
+        if self.assets is None or not stored:
+            return markdown_content, {}
+        return await self.assets.localize(markdown_content, target_path, stored)
+
+    async def stage_assets(self, builder, files: Dict[str, bytes]):
+        """
+        Stage asset files the base branch does not have yet. Asset paths are
+        content addressed, so an existing path already holds the same image.
+        """
+        if not files:
+            return
+        existing = await self.github_service.get_file_shas(list(files), ref=builder.base_branch)
+        for path, content in files.items():
+            if existing[path] is None:
+                builder.add_file(path, content)
+
+    async def stage_document(self, builder, target_path: str, markdown_content: str, title: str,
+                             assets: Dict[str, bytes] = None):
+        """
+        Stage a converted page, its images and its mkdocs.yml navigation entry on a commit builder
+
+        Args:
+            builder (CommitBuilder): Commit being prepared
+            target_path (str): Repository path of the page
+            markdown_content (str): Converted Markdown
+            title (str): Navigation title
+            assets (Dict[str, bytes], optional): Image files referenced by the page
+        """
+        builder.add_file(target_path, markdown_content)
+        await self.stage_assets(builder, assets or {})
+        nav_config = await self.github_service.render_mkdocs_nav(
+            [(title, target_path)], ref=await builder.parent_sha()
+        )
+        builder.add_file("mkdocs.yml", nav_config)
+
+    async def convert_document(self, job: Job) -> Dict[str, Any]:
+        """
+        Convert a Google Doc to Markdown and update MkDocs documentation
+
+        Args:
+            job (Job): Job whose payload holds the DocumentRequest fields
+
+        Returns:
+            Dict: ConversionResponse fields
+        """
+        request = job.payload
+        doc_id = request["doc_id"]
+        mode = self.conversion_mode(request.get("mode"))
+
+        # Get document content
+        job.start_stage("fetch")
+        if mode == EXPORT_MODE:
+            doc_content = await self.export_document(doc_id)
+        else:
+            doc_content = await self.docs_service.get_document_content(doc_id)
+        job.finish_stage("fetch")
+
+        # Generate branch name if not provided; it is kept in the payload so a
+        # parked job that reruns goes on with the branch it may have committed to
+        if not request.get("branch_name"):
+            request["branch_name"] = f"{default_branch_name()}_{job.id[:8]}"
+        branch_name = request["branch_name"]
+
+        # Determine target path
+        target_path = request.get("target_path") or default_target_path(doc_content["title"])
+
+        # Convert to markdown; the raw document is dropped with it rather than
+        # being held through the GitHub stages
+        job.start_stage("convert")
+        if mode == EXPORT_MODE:
+            markdown_content, images = self.convert_export(doc_content)
+        else:
+            images = inline_images(doc_content['raw_content'])
+            markdown_content = await self.ai_converter.convert_to_markdown(doc_content.pop('raw_content'), mode=mode)
+        job.finish_stage("convert")
+
+        # Download the images and link the copies committed with the page
+        assets = {}
+        if self.assets is not None and images:
+            job.start_stage("assets")
+            stored = await self.fetch_images(doc_id, images)
+            markdown_content, assets = await self.localize_images(markdown_content, target_path, stored)
+            job.finish_stage("assets")
+        else:
+            job.skip_stage("assets")
+
+        # Bail out before any GitHub write if main already has this exact content
+        job.start_stage("compare")
+        if await self.github_service.is_unchanged(target_path, markdown_content):
+            job.finish_stage("compare")
+            for stage in ("nav", "commit", "pr"):
+                job.skip_stage(stage)
+            logger.info(f"Document {doc_id} is unchanged at {target_path}, skipping GitHub update")
+            return {
+                "status": "unchanged",
+                "title": doc_content['title'],
+                "github_url": f"https://github.com/{self.github_service.repo_name}/blob/main/{target_path}",
+                "pr_url": None,
+                "message": "Documentation is already up to date"
+            }
+        job.finish_stage("compare")
+
+        # Commit the page and navigation update as one commit on a new branch,
+        # unless an earlier attempt of this job already did
+        if request.get("commit_sha") and await self.github_service.is_unchanged(
+                target_path, markdown_content, ref=branch_name):
+            job.skip_stage("nav")
+            job.skip_stage("commit")
+        else:
+            job.start_stage("nav")
+            builder = self.github_service.commit_builder(branch_name)
+            await self.stage_document(builder, target_path, markdown_content, doc_content['title'], assets)
+            job.finish_stage("nav")
+
+            job.start_stage("commit")
+            request["commit_sha"] = await builder.commit(f"Update documentation: {doc_content['title']}")
+            job.finish_stage("commit")
+        file_url = f"https://github.com/{self.github_service.repo_name}/blob/{branch_name}/{target_path}"
+
+        # Create PR if requested
+        pr_url = None
+        if request.get("create_pr", True):
+            job.start_stage("pr")
+            pr_url = await self.github_service.create_pull_request(
+                branch_name=branch_name,
+                title=f"Documentation Update: {doc_content['title']}",
+                body=f"""
+## Automated Documentation Update
+
+This PR contains updates from Google Docs document: {doc_content['title']}
+
+### Changes:
+- Added/Updated: `{target_path}`
+- Updated MkDocs navigation
+- Source: Google Doc ID `{doc_id}`
+
+Please review the changes and merge to update the documentation site.
+                """.strip()
+            )
+            job.finish_stage("pr")
+        else:
+            job.skip_stage("pr")
+
+        logger.info(f"Converted document {doc_id} to {target_path}")
+        return {
+            "status": "success",
+            "title": doc_content['title'],
+            "github_url": file_url,
+            "pr_url": pr_url,
+            "message": "Documentation update completed successfully"
+        }
+
+    async def convert_batch(self, job: Job) -> Dict[str, Any]:
+        """
+        Convert many Google Docs in parallel and land them as one commit and one PR.
+        With "recursive" set the whole tree below folder_id is mirrored: folders
+        become docs/ subdirectories and nested sections of one nav section.
+
+        Args:
+            job (Job): Job whose payload holds the BatchDocumentRequest or FolderSyncRequest fields
+
+        Returns:
+            Dict: BatchConversionResponse fields
+        """
+        request = job.payload
+
+        # Resolve the documents to convert
+        job.start_stage("resolve")
+        doc_ids: List[str] = list(dict.fromkeys(request.get("doc_ids") or []))
+        # doc_id -> folders below the synced root, for recursive folder syncs
+        doc_folders: Dict[str, List[str]] = {}
+        # doc_id -> Drive file name, the title of documents that fail to convert
+        doc_names: Dict[str, str] = {}
+        nav_section = None
+        if request.get("folder_id") and request.get("recursive"):
+            root_name, folder_docs = await self.docs_service.crawl_folder(request["folder_id"])
+            nav_section = request.get("nav_section") or root_name
+            root_folders = [request.get("target_dir") or root_name]
+            for doc in folder_docs:
+                if doc["id"] not in doc_folders:
+                    doc_folders[doc["id"]] = root_folders + doc["folders"]
+                    doc_names[doc["id"]] = doc["name"]
+            doc_ids.extend(doc_id for doc_id in doc_folders if doc_id not in doc_ids)
+        elif request.get("folder_id"):
+            folder_docs = await self.docs_service.list_folder_documents(request["folder_id"])
+            doc_ids.extend(doc["id"] for doc in folder_docs if doc["id"] not in doc_ids)
+        if not doc_ids:
+            raise ValueError("No documents to convert")
+        job.finish_stage("resolve")
+
+        # Fetch in batch HTTP requests and convert each document as soon as it arrives
+        job.start_stage("convert")
+        mode = self.conversion_mode(request.get("mode"))
+        semaphore = asyncio.Semaphore(int(os.getenv('BATCH_CONCURRENCY', '8')))
+
+        async def convert_one(doc_id: str, doc_content: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    images = inline_images(doc_content['raw_content'])
+                    markdown_content = await self.ai_converter.convert_to_markdown(
+                        doc_content.pop('raw_content'), mode=mode, bulk=True
+                    )
+                    # Shared images are downloaded once across the whole batch
+                    stored = await self.fetch_images(doc_id, images)
+                    return {"doc_id": doc_id, "title": doc_content['title'], "markdown": markdown_content,
+                            "images": stored}
+                except CircuitOpenError as e:
+                    return {"doc_id": doc_id, "error": str(e), "unavailable": e}
+                except Exception as e:
+                    logger.error(f"Batch conversion of {doc_id} failed: {str(e)}")
+                    return {"doc_id": doc_id, "error": str(e)}
+
+        async def export_one(doc_id: str) -> Dict[str, Any]:
+            # Exports cannot be batched, so each document is exported on its own
+            async with semaphore:
+                try:
+                    title, markdown_content, images = await self.export_markdown(doc_id)
+                    stored = await self.fetch_images(doc_id, images)
+                    return {"doc_id": doc_id, "title": title, "markdown": markdown_content, "images": stored}
+                except CircuitOpenError as e:
+                    return {"doc_id": doc_id, "error": str(e), "unavailable": e}
+                except Exception as e:
+                    logger.error(f"Batch export of {doc_id} failed: {str(e)}")
+                    return {"doc_id": doc_id, "error": str(e)}
+
+        tasks = []
+        converted = []
+        if mode == EXPORT_MODE:
+            tasks = [asyncio.create_task(export_one(doc_id)) for doc_id in doc_ids]
+        else:
+            async for doc_id, doc_content, error in self.docs_service.get_documents(doc_ids):
+                if isinstance(error, CircuitOpenError):
+                    converted.append({"doc_id": doc_id, "error": str(error), "unavailable": error})
+                elif error is not None:
+                    logger.error(f"Batch fetch of {doc_id} failed: {str(error)}")
+                    converted.append({"doc_id": doc_id, "error": str(error)})
+                else:
+                    tasks.append(asyncio.create_task(convert_one(doc_id, doc_content)))
+        converted.extend(await asyncio.gather(*tasks))
+        # A dependency went down mid-batch: park the whole job rather than open a
+        # PR missing documents; on the rerun converted documents come from the cache
+        unavailable = next((doc["unavailable"] for doc in converted if "unavailable" in doc), None)
+        if unavailable:
+            raise unavailable
+        order = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        converted.sort(key=lambda doc: order[doc["doc_id"]])
+        job.finish_stage("convert")
+
+        documents = []
+        taken = set()
+        # Synced documents that failed keep the page they already have, so their
+        # paths are reserved in the same order as when they convert
+        kept_pages: Dict[str, Tuple[List[str], str, str]] = {}
+        for doc in converted:
+            if "error" in doc:
+                documents.append({"doc_id": doc["doc_id"], "status": "failed", "error": doc["error"]})
+                if doc["doc_id"] in doc_folders:
+                    title = doc_names[doc["doc_id"]]
+                    path = unique_path(default_target_path(title, doc_folders[doc["doc_id"]]), taken)
+                    kept_pages[doc["doc_id"]] = (doc_folders[doc["doc_id"]][1:], title, path)
+                continue
+            path = unique_path(default_target_path(doc["title"], doc_folders.get(doc["doc_id"])), taken)
+            markdown_content, assets = await self.localize_images(doc["markdown"], path, doc["images"])
+            documents.append({"doc_id": doc["doc_id"], "status": "success", "title": doc["title"],
+                              "path": path, "markdown": markdown_content, "assets": assets})
+
+        converted_docs = [doc for doc in documents if doc["status"] == "success"]
+        if not converted_docs:
+            raise RuntimeError(f"All {len(doc_ids)} documents failed to convert")
+
+        # Drop documents whose content already matches main
+        job.start_stage("compare")
+        main_shas = await self.github_service.get_file_shas(
+            [doc["path"] for doc in converted_docs] + [path for _, _, path in kept_pages.values()]
+        )
+        files = {}
+        asset_files = {}
+        nav_entries = []
+        for doc in converted_docs:
+            markdown_content = doc.pop("markdown")
+            assets = doc.pop("assets")
+            if main_shas[doc["path"]] == git_blob_sha(markdown_content):
+                doc["status"] = "unchanged"
+                continue
+            files[doc["path"]] = markdown_content
+            asset_files.update(assets)
+            nav_entries.append((doc["title"], doc["path"]))
+        job.finish_stage("compare")
+
+        # A synced folder owns a nav section listing all of its pages, changed or
+        # not; pages of documents that failed this time stay listed if they exist
+        tree_entries = []
+        for doc in documents:
+            if doc["doc_id"] not in doc_folders:
+                continue
+            if "path" in doc:
+                tree_entries.append((doc_folders[doc["doc_id"]][1:], doc["title"], doc["path"]))
+            elif main_shas[kept_pages[doc["doc_id"]][2]]:
+                tree_entries.append(kept_pages[doc["doc_id"]])
+
+        unchanged = len(converted_docs) - len(nav_entries)
+        failed = len(documents) - len(converted_docs)
+        if not files:
+            job.skip_stage("commit")
+            job.skip_stage("pr")
+            return {
+                "status": "partial" if failed else "unchanged",
+                "branch": None,
+                "pr_url": None,
+                "documents": documents,
+                "message": f"{unchanged} documents already up to date, {failed} failed"
+            }
+
+        # One commit with every page plus a single mkdocs.yml rewrite; the branch
+        # name is kept in the payload so a parked job reruns onto the same branch
+        if not request.get("branch_name"):
+            request["branch_name"] = f"{default_branch_name()}_{job.id[:8]}"
+        branch_name = request["branch_name"]
+        committed = False
+        if request.get("commit_sha"):
+            # An earlier attempt of this job may already have committed these pages
+            branch_shas = await self.github_service.get_file_shas(list(files), ref=branch_name)
+            committed = all(branch_shas[path] == git_blob_sha(content) for path, content in files.items())
+        if committed:
+            job.skip_stage("commit")
+        else:
+            job.start_stage("commit")
+            builder = self.github_service.commit_builder(branch_name)
+            for path, markdown_content in files.items():
+                builder.add_file(path, markdown_content)
+            await self.stage_assets(builder, asset_files)
+            if nav_section is not None:
+                builder.add_file("mkdocs.yml", await self.github_service.render_mkdocs_nav_section(
+                    nav_section, tree_entries, ref=await builder.parent_sha()
+                ))
+            else:
+                builder.add_file("mkdocs.yml", await self.github_service.render_mkdocs_nav(
+                    nav_entries, ref=await builder.parent_sha()
+                ))
+            request["commit_sha"] = await builder.commit(f"Update documentation: {len(nav_entries)} documents")
+            job.finish_stage("commit")
+
+        pr_url = None
+        if request.get("create_pr", True):
+            job.start_stage("pr")
+            changes = "\n".join(f"- Added/Updated: `{doc['path']}` (Google Doc ID `{doc['doc_id']}`)"
+                                for doc in documents if doc["status"] == "success")
+            pr_url = await self.github_service.create_pull_request(
+                branch_name=branch_name,
+                title=f"Documentation Update: {len(nav_entries)} documents",
+                body=f"""
+## Automated Documentation Update
+
+This PR contains updates from {len(nav_entries)} Google Docs documents.
+
+### Changes:
+{changes}
+- Updated MkDocs navigation
+
+Please review the changes and merge to update the documentation site.
+                """.strip()
+            )
+            job.finish_stage("pr")
+        else:
+            job.skip_stage("pr")
+
+        logger.info(f"Batch job {job.id}: {len(nav_entries)} updated, {unchanged} unchanged, {failed} failed")
+        return {
+            "status": "partial" if failed else "success",
+            "branch": branch_name,
+            "pr_url": pr_url,
+            "documents": documents,
+            "message": f"Updated {len(nav_entries)} of {len(documents)} documents ({unchanged} unchanged)"
+        }
@@ -0,0 +1,192 @@
+from contextlib import asynccontextmanager
+from typing import Mapping, Optional
+import asyncio
+import functools
+import random
+import re
+import time
+import logging
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; token counts are estimated from the length without it
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Tokens the chat format adds per message on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Fraction of the server-side budget left below which concurrency stops growing
+LOW_HEADROOM = 0.1
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+
+
+def estimate_tokens(text: str, model: str) -> int:
+    """Prompt tokens of text for model; about four characters per token without tiktoken"""
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+def parse_duration(value: str) -> float:
+    """Seconds in an OpenAI reset header such as "1s", "6m0s" or "20ms" """
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in _DURATION_RE.findall(value or ''))
+
+
+def retry_delay(attempt: int, retry_after: Optional[float] = None, base: float = 1.0, cap: float = 60.0) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's retry-after"""
+    return max(retry_after or 0.0, random.uniform(0, min(cap, base * 2 ** attempt)))
+
+
+class _Budget:
+    def __init__(self, per_minute: int):
+        """
+        Token bucket holding per_minute units, refilled continuously; 0 means
+        no local limit until the server reports one
+
+        Args:
+            per_minute (int): Units allowed per minute
+        """
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        """Wait until amount can be spent without exceeding the budget"""
+        async with self._lock:
+            while self.capacity:
+                amount = min(amount, self.capacity)
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) * 60.0 / self.capacity)
+
+    def refund(self, amount: float):
+        """Give back units reserved but not used"""
+        if self.capacity:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+    def sync(self, remaining: Optional[float], limit: Optional[float]):
+        """Align with the server's view, which also counts other clients of the same key"""
+        if limit and not self.capacity:
+            self.capacity = self.level = float(limit)
+            self.updated = time.monotonic()
+        if remaining is not None and self.capacity:
+            self._refill()
+            self.level = min(self.level, remaining)
+
+
+class OpenAIRateLimiter:
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int,
+                 max_concurrency: int, min_concurrency: int = 1):
+        """
+        Schedules model calls against the account's request and token
+        budgets. Each call reserves its estimated tokens before it is sent;
+        the x-ratelimit-* headers of every response resync the budgets and
+        steer concurrency: it grows by one while there is headroom, halves on
+        a 429, and every call waits out the server's retry-after.
+
+        Args:
+            requests_per_minute (int): Request budget, 0 to take it from the response headers
+            tokens_per_minute (int): Token budget, 0 to take it from the response headers
+            max_concurrency (int): Upper bound on calls in flight
+            min_concurrency (int): Lower bound on calls in flight
+        """
+        self.requests = _Budget(requests_per_minute)
+        self.tokens = _Budget(tokens_per_minute)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.min_concurrency = max(min(min_concurrency, self.max_concurrency), 1)
+        self.concurrency = max(self.min_concurrency, min(4, self.max_concurrency))
+        self.active = 0
+        self.throttled = 0
+        self._slots = asyncio.Condition()
+        self._paused_until = 0.0
+
+    @asynccontextmanager
+    async def slot(self, tokens: int):
+        """
+        Hold a concurrency slot and the budget for one call
+
+        Args:
+            tokens (int): Tokens the call may consume, prompt plus max_tokens
+        """
+        async with self._slots:
+            await self._slots.wait_for(lambda: self.active < self.concurrency)
+            self.active += 1
+        try:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.requests.acquire(1)
+            await self.tokens.acquire(tokens)
+            yield
+        finally:
+            async with self._slots:
+                self.active -= 1
+                self._slots.notify_all()
+
+    def refund(self, tokens: int):
+        """Return the part of a reservation the call did not use"""
+        if tokens > 0:
+            self.tokens.refund(tokens)
+
+    def observe(self, headers: Mapping[str, str]):
+        """Resync the budgets from a response's x-ratelimit-* headers and adapt concurrency"""
+        def number(name: str) -> Optional[float]:
+            try:
+                return float(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        limit_requests, remaining_requests = number('x-ratelimit-limit-requests'), number('x-ratelimit-remaining-requests')
+        limit_tokens, remaining_tokens = number('x-ratelimit-limit-tokens'), number('x-ratelimit-remaining-tokens')
+        self.requests.sync(remaining_requests, limit_requests)
+        self.tokens.sync(remaining_tokens, limit_tokens)
+
+        headroom = [remaining / limit for remaining, limit in
+                    ((remaining_requests, limit_requests), (remaining_tokens, limit_tokens))
+                    if remaining is not None and limit]
+        # Near the limit the budgets do the pacing; concurrency only grows with
+        # headroom left and when it is what actually holds calls back
+        if headroom and min(headroom) >= LOW_HEADROOM and self.active >= self.concurrency:
+            self._resize(self.concurrency + 1)
+
+    def rate_limited(self, retry_after: float):
+        """A call got a 429: halve concurrency and hold every call for retry_after seconds"""
+        self.throttled += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        self._resize(self.concurrency // 2)
+
+    def _resize(self, concurrency: int):
+        concurrency = max(self.min_concurrency, min(self.max_concurrency, concurrency))
+        if concurrency != self.concurrency:
+            logger.info(f"OpenAI concurrency {self.concurrency} -> {concurrency}")
+            self.concurrency = concurrency
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "throttled": self.throttled,
+            "requests_available": round(self.requests.level),
+            "tokens_available": round(self.tokens.level),
+        }
@@ -0,0 +1,198 @@
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import html
+import logging
+from .docs_walker import DocumentVisitor, iter_table, paragraph_text
+
+logger = logging.getLogger(__name__)
+
+
+def _plain_paragraph(paragraph: Dict) -> str:
+    return paragraph_text(paragraph).strip()
+
+
+def _plain_html_paragraph(paragraph: Dict) -> str:
+    return html.escape(_plain_paragraph(paragraph), quote=False)
+
+
+class TableCell:
+    def __init__(self, row: int, column: int, row_span: int, column_span: int, lines: List):
+        """
+        A cell placed on the table grid
+
+        Args:
+            lines (List): Rendered lines of the cell; while a table is being
+                built, its content (paragraphs, or nested tables as HTML)
+        """
+        self.row = row
+        self.column = column
+        self.row_span = row_span
+        self.column_span = column_span
+        self.lines = lines
+
+
+def render_cells(cells: List[TableCell], render: Callable) -> List[TableCell]:
+    """
+    Render the content of every cell; items that are already strings (nested
+    tables) are kept as they are and empty lines are dropped
+    """
+    for cell in cells:
+        lines = (item if isinstance(item, str) else render(item) for item in cell.lines)
+        cell.lines = [line for line in lines if line]
+    return cells
+
+
+class _TableState:
+    def __init__(self, table: Dict):
+        rows = table.get('tableRows', [])
+        self.columns = table.get('columns') or max((len(row.get('tableCells', [])) for row in rows), default=0)
+        self.covered: Set[Tuple[int, int]] = set()
+        self.cells: List[TableCell] = []
+        self.complex_layout = False
+        self.row = -1
+        self.column = 0
+        self.index = 0
+        self.full_row = False
+        # Cell receiving content; None inside cells covered by a merge
+        self.cell: Optional[TableCell] = None
+
+
+class TableConverter(DocumentVisitor):
+    def __init__(self, render_paragraph: Optional[Callable[[Dict], str]] = None,
+                 render_html: Optional[Callable[[Dict], str]] = None):
+        """
+        Convert Docs API tables to Markdown without a model call, from the
+        table events of the document walker. Plain tables become GFM pipe
+        tables; tables with merged or nested cells, which pipe tables cannot
+        express, become HTML tables. Cells are rendered once their table is
+        complete, as Markdown or as HTML depending on its layout.
+
+        Args:
+            render_paragraph (Callable, optional): Renders a cell paragraph to
+                inline Markdown; defaults to its plain text
+            render_html (Callable, optional): Renders a cell paragraph to
+                inline HTML; defaults to its escaped plain text
+        """
+        self.render_paragraph = render_paragraph or _plain_paragraph
+        self.render_html = render_html or _plain_html_paragraph
+        # Tables being built, outermost first
+        self._tables: List[_TableState] = []
+        # Conversion of the last top-level table
+        self.result = ''
+
+    def convert(self, table: Dict) -> str:
+        """
+        Convert a table element on its own, outside a document walk
+
+        Args:
+            table (Dict): The "table" field of a structural element
+
+        Returns:
+            str: GFM or HTML table, empty for a table without rows
+        """
+        for event, node, depth in iter_table(table):
+            getattr(self, event)(node, depth)
+        return self.result
+
+    def start_table(self, table: Dict, depth: int):
+        self._tables.append(_TableState(table))
+
+    def start_row(self, row: Dict, depth: int):
+        state = self._tables[-1]
+        state.row += 1
+        state.column = 0
+        state.index = 0
+        state.full_row = len(row.get('tableCells', [])) >= state.columns
+
+    def start_cell(self, cell: Dict, depth: int):
+        """
+        Place the cell on the table grid. The API lists the cells covered by
+        a merge as well; they are skipped so each merged cell appears once.
+        """
+        state = self._tables[-1]
+        r = state.row
+        if state.full_row:
+            state.column = state.index
+            if (r, state.column) in state.covered:
+                return
+        else:
+            while (r, state.column) in state.covered:
+                state.column += 1
+
+        style = cell.get('tableCellStyle', {})
+        row_span = max(style.get('rowSpan', 1), 1)
+        column_span = max(style.get('columnSpan', 1), 1)
+        if row_span > 1 or column_span > 1:
+            state.complex_layout = True
+            state.covered.update(
+                (r + dr, state.column + dc) for dr in range(row_span) for dc in range(column_span)
+                if dr or dc
+            )
+        state.cell = TableCell(r, state.column, row_span, column_span, [])
+
+    def paragraph(self, paragraph: Dict, depth: int):
+        if self._tables and self._tables[-1].cell is not None:
+            self._tables[-1].cell.lines.append(paragraph)
+
+    def end_cell(self, cell: Dict, depth: int):
+        state = self._tables[-1]
+        if state.cell is not None:
+            state.cells.append(state.cell)
+            state.column += state.cell.column_span
+            state.cell = None
+        state.index += 1
+
+    def end_table(self, table: Dict, depth: int):
+        state = self._tables.pop()
+        cells = state.cells
+        if self._tables:
+            # Nested tables are always HTML, inside an HTML table
+            parent = self._tables[-1]
+            parent.complex_layout = True
+            if cells and parent.cell is not None:
+                parent.cell.lines.append(html_table(render_cells(cells, self.render_html), inline=True))
+            return
+        if not cells:
+            self.result = ''
+        elif state.complex_layout:
+            self.result = html_table(render_cells(cells, self.render_html))
+        else:
+            width = max([state.columns] + [cell.column + cell.column_span for cell in cells])
+            self.result = gfm_table(render_cells(cells, self.render_paragraph), width)
+
+
+def gfm_table(cells: List[TableCell], width: int) -> str:
+    """GFM pipe table from cells rendered as Markdown; the first row is the header row"""
+    rows: List[List[str]] = []
+    for cell in cells:
+        while len(rows) <= cell.row:
+            rows.append([''] * width)
+        rows[cell.row][cell.column] = '<br>'.join(cell.lines).replace('|', '\\|').replace('\n', ' ')
+    lines = [
+        '| ' + ' | '.join(rows[0]) + ' |',
+        '|' + '|'.join(['---'] * width) + '|',
+    ]
+    lines.extend('| ' + ' | '.join(row) + ' |' for row in rows[1:])
+    return '\n'.join(lines)
+
+
+def html_table(cells: List[TableCell], inline: bool = False) -> str:
+    """
+    HTML table for layouts pipe tables cannot express, from cells rendered
+    as HTML; the first row is the header row
+    """
+    rows: Dict[int, List[str]] = {}
+    for cell in cells:
+        tag = 'th' if cell.row == 0 else 'td'
+        attrs = ''
+        if cell.row_span > 1:
+            attrs += f' rowspan="{cell.row_span}"'
+        if cell.column_span > 1:
+            attrs += f' colspan="{cell.column_span}"'
+        content = '<br>'.join(line.replace('\n', '<br>') for line in cell.lines)
+        rows.setdefault(cell.row, []).append(f"<{tag}{attrs}>{content}</{tag}>")
+
+    separator = '' if inline else '\n'
+    parts = ['<table>']
+    parts.extend(f"<tr>{''.join(row)}</tr>" for _, row in sorted(rows.items()))
+    parts.append('</table>')
+    return separator.join(parts)
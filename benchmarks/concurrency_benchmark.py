@@ -0,0 +1,121 @@
+"""
+Concurrency benchmark for the conversion pipeline.
+
+Runs N document conversions concurrently against simulated Google Docs,
+OpenAI and GitHub backends that block for a fixed latency, exactly like the
+real synchronous clients do. With every external call kept off the event loop
+the wall-clock time should be close to the slowest single conversion rather
+than the sum of all of them.
+
+Usage:
+    python benchmarks/concurrency_benchmark.py [N]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.google_docs import GoogleDocsService, QuotaLimiter
+from app.services.ai_converter import AIConverter
+from app.services.github_service import GitHubService
+from app.services.health import CircuitBreaker
+from app.services.job_queue import Job
+from app.services.pipeline import ConversionPipeline, CONVERT_STAGES
+
+GOOGLE_LATENCY = 0.3
+OPENAI_LATENCY = 1.0
+GITHUB_LATENCY = 0.2
+
+DOCUMENT = {
+    "documentId": "bench",
+    "title": "Benchmark Doc",
+    "body": {"content": [{"paragraph": {"elements": [{"textRun": {"content": "Hello\n"}}]}}]}
+}
+
+
+class _BlockingRequest:
+    def execute(self, http=None):
+        time.sleep(GOOGLE_LATENCY)
+        return dict(DOCUMENT)
+
+
+class _FakeDocsResource:
+    def documents(self):
+        return self
+
+    def get(self, documentId):
+        return _BlockingRequest()
+
+
+class _FakeCompletions:
+    async def create(self, **kwargs):
+        await asyncio.sleep(OPENAI_LATENCY)
+        message = SimpleNamespace(content="# Hello\n")
+        response = SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=None)
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+
+class _FakeRepo:
+    name = "bench"
+
+    def _block(self, *args, **kwargs):
+        time.sleep(GITHUB_LATENCY)
+        return SimpleNamespace(
+            sha="0" * 40,
+            html_url="https://github.com/bench/bench/pull/1",
+            object=SimpleNamespace(sha="0" * 40),
+            tree=SimpleNamespace(sha="0" * 40),
+            edit=lambda sha: None,
+            decoded_content=b"nav:\n  - Home: index.md\n"
+        )
+
+    get_contents = create_pull = get_git_ref = get_git_commit = _block
+    create_git_blob = create_git_tree = create_git_commit = create_git_ref = _block
+
+
+def build_pipeline() -> ConversionPipeline:
+    docs_service = GoogleDocsService.__new__(GoogleDocsService)
+    docs_service.service = _FakeDocsResource()
+    docs_service.credentials = None
+    docs_service._executor = ThreadPoolExecutor(max_workers=int(os.getenv('GOOGLE_API_THREADS', '8')))
+    docs_service.http = None
+    docs_service.quota = QuotaLimiter(10 ** 6)
+    docs_service.breaker = CircuitBreaker('google_docs')
+
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    os.environ['CONVERSION_CACHE_ENABLED'] = 'false'
+    ai_converter = AIConverter()
+    ai_converter.backend.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(with_raw_response=_FakeCompletions())))
+
+    github_service = GitHubService.__new__(GitHubService)
+    github_service.repo = _FakeRepo()
+    github_service.repo_name = "bench/bench"
+    github_service._executor = ThreadPoolExecutor(max_workers=int(os.getenv('GITHUB_API_THREADS', '4')))
+    github_service.breaker = CircuitBreaker('github')
+
+    return ConversionPipeline(docs_service, ai_converter, github_service)
+
+
+async def run(n: int):
+    pipeline = build_pipeline()
+
+    start = time.perf_counter()
+    await pipeline.convert_document(Job("convert", {"doc_id": "single"}, CONVERT_STAGES))
+    single = time.perf_counter() - start
+
+    jobs = [Job("convert", {"doc_id": f"doc-{i}"}, CONVERT_STAGES) for i in range(n)]
+    start = time.perf_counter()
+    await asyncio.gather(*(pipeline.convert_document(job) for job in jobs))
+    concurrent = time.perf_counter() - start
+
+    print(f"single conversion:            {single:6.2f}s")
+    print(f"{n} conversions, sequential sum: {single * n:6.2f}s (estimated)")
+    print(f"{n} conversions, concurrent:     {concurrent:6.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 8))
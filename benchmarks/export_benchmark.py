@@ -0,0 +1,81 @@
+"""
+Export fast path benchmark.
+
+Fetches one real document both ways, documents.get JSON and Drive
+files.export HTML, and compares bytes transferred, fetch and conversion
+time, and how close the exported Markdown is to the local converter's
+(similarity ratio plus counts of headings, links, images and tables).
+
+Requires GOOGLE_APPLICATION_CREDENTIALS and a document shared with the
+service account.
+
+Usage:
+    DOCUMENT_ID=<doc id> python benchmarks/export_benchmark.py [RUNS]
+"""
+import asyncio
+import difflib
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dotenv import load_dotenv
+
+from app.services.google_docs import GoogleDocsService
+from app.services.html_converter import HtmlMarkdownConverter
+from app.services.local_converter import LocalMarkdownConverter
+
+FEATURES = {
+    "headings": re.compile(r'^#{1,6} ', re.MULTILINE),
+    "links": re.compile(r'(?<!!)\[[^\]]*\]\([^)]+\)'),
+    "images": re.compile(r'!\[[^\]]*\]\([^)]+\)'),
+    "tables": re.compile(r'^(\|---|<table>)', re.MULTILINE),
+}
+
+
+async def _timed(coroutine):
+    start = time.perf_counter()
+    result = await coroutine
+    return result, time.perf_counter() - start
+
+
+async def run(doc_id: str, runs: int):
+    service = GoogleDocsService()
+    local_converter = LocalMarkdownConverter()
+    html_converter = HtmlMarkdownConverter()
+
+    api_fetch = export_fetch = api_convert = export_convert = 0.0
+    for _ in range(runs):
+        doc_content, elapsed = await _timed(service.get_document_content(doc_id))
+        api_fetch += elapsed
+        exported, elapsed = await _timed(service.export_document(doc_id, 'text/html'))
+        export_fetch += elapsed
+
+        start = time.perf_counter()
+        local = local_converter.convert(doc_content['raw_content']).markdown
+        api_convert += time.perf_counter() - start
+
+        start = time.perf_counter()
+        export = html_converter.convert(exported['content']).markdown
+        export_convert += time.perf_counter() - start
+
+    api_bytes = len(json.dumps(doc_content['raw_content']).encode('utf-8'))
+    print(f"{doc_content['title']} ({runs} runs)")
+    print(f"{'':18}{'documents.get':>16}{'files.export':>16}")
+    print(f"{'bytes':18}{api_bytes:16d}{exported['bytes']:16d}")
+    print(f"{'fetch ms':18}{api_fetch / runs * 1000:16.1f}{export_fetch / runs * 1000:16.1f}")
+    print(f"{'convert ms':18}{api_convert / runs * 1000:16.1f}{export_convert / runs * 1000:16.1f}")
+    for name, pattern in FEATURES.items():
+        print(f"{name:18}{len(pattern.findall(local)):16d}{len(pattern.findall(export)):16d}")
+    ratio = difflib.SequenceMatcher(None, local, export, autojunk=False).ratio()
+    print(f"similarity of the two Markdown outputs: {ratio:.3f}")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    if not os.getenv('DOCUMENT_ID'):
+        sys.exit("Set DOCUMENT_ID to the document to benchmark")
+    asyncio.run(run(os.environ['DOCUMENT_ID'], int(sys.argv[1]) if len(sys.argv) > 1 else 3))
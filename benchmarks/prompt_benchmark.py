@@ -0,0 +1,186 @@
+"""
+Prompt size benchmark.
+
+Reports the prompt tokens each document costs with the structure extractor
+the converter used before (plain text per paragraph, headings and tables
+kept, inline styles, links and list structure dropped) and with the compact
+representation it sends now, plus the time to build the latter. The change
+column compares the two. The compact representation keeps links, list
+structure and inline styles the previous extractor dropped (link targets as
+short link: references, lists indented with tabs), so it can still be larger
+than the previous extractor's output. The raw documents.get
+JSON repr, what the model received only when extraction failed, is listed
+for reference. With --live, the previous and current prompts are also sent
+to the model once per document to compare latency.
+
+The corpus is read from documents.get JSON files (or directories of them)
+given on the command line, or fetched from DOCUMENT_IDS (comma separated);
+without either, a synthetic corpus is generated.
+
+Usage:
+    python benchmarks/prompt_benchmark.py [--live] [PATH ...]
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dotenv import load_dotenv
+
+from table_benchmark import build_document
+from app.services.ai_converter import SYSTEM_PROMPT
+from app.services.assets import image_ref
+from app.services.docs_walker import DocumentVisitor, walk_document
+from app.services.llm_backends import CONVERT_INSTRUCTION
+from app.services.local_converter import LocalMarkdownConverter
+from app.services.rate_limiter import estimate_tokens
+from app.services.table_converter import TableConverter
+
+MODEL = "gpt-4o-mini"
+
+
+def _run(text: str, **style) -> dict:
+    return {"textRun": {"content": text, "textStyle": style}}
+
+
+def synthetic_corpus() -> list:
+    """Documents mixing styled prose, split runs, lists, links and tables"""
+    documents = []
+    for n, tables in enumerate((0, 2, 10)):
+        document = build_document(tables, 6, 4)
+        content = document["body"]["content"]
+        for i in range(40 * (n + 1)):
+            content.append({"paragraph": {"paragraphStyle": {"namedStyleType": "NORMAL_TEXT"}, "elements": [
+                _run("Some ", fontSize={"magnitude": 11, "unit": "PT"}),
+                _run("text split ", fontSize={"magnitude": 11, "unit": "PT"}),
+                _run("into runs", bold=True),
+                _run(" with a "),
+                _run("link", link={"url": f"https://example.com/{i}"}, underline=True),
+                _run(".\n"),
+            ]}})
+            content.append({"paragraph": {"bullet": {"listId": "l", "nestingLevel": i % 3},
+                                          "elements": [_run(f"List item {i}\n")]}})
+        document.update(documentId=f"synthetic-{n}", title=f"Synthetic {n}",
+                        lists={"l": {"listProperties": {"nestingLevels": [{"glyphType": "DECIMAL"}] * 3}}})
+        documents.append(document)
+    return documents
+
+
+def load_corpus(paths: list) -> list:
+    documents = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, '*.json'))) if os.path.isdir(path) else [path]
+        for file in files:
+            with open(file) as f:
+                documents.append(json.load(f))
+    return documents
+
+
+async def fetch_corpus(doc_ids: list) -> list:
+    from app.services.google_docs import GoogleDocsService
+    service = GoogleDocsService()
+    return [(await service.get_document_content(doc_id))['raw_content'] for doc_id in doc_ids]
+
+
+class PreviousStructureVisitor(DocumentVisitor):
+    """The structure extractor the converter used before the compact representation"""
+
+    def __init__(self):
+        self.tables = TableConverter()
+        self.blocks = []
+
+    def paragraph(self, paragraph: dict, depth: int):
+        if depth:
+            return
+        style = paragraph.get('paragraphStyle', {}).get('namedStyleType', '')
+        heading_level = 0
+        if 'HEADING' in style:
+            try:
+                heading_level = int(style.split('_')[1])
+            except (IndexError, ValueError):
+                heading_level = 0
+        text = ''.join(
+            elem['textRun'].get('content', '') if 'textRun' in elem
+            else f"![]({image_ref(elem['inlineObjectElement'].get('inlineObjectId', ''))})"
+            for elem in paragraph.get('elements', [])
+            if 'textRun' in elem or 'inlineObjectElement' in elem
+        )
+        self.blocks.append((heading_level, f"{'#' * heading_level} {text}" if heading_level else text))
+
+    def start_table(self, table: dict, depth: int):
+        if depth == 0:
+            self.blocks.append((0, f"\n{self.tables.convert(table)}\n"))
+
+
+def previous_prompt(document: dict) -> str:
+    structure = PreviousStructureVisitor()
+    walk_document(document, [structure])
+    return '\n'.join(text for _, text in structure.blocks)
+
+
+def compact_prompt(document: dict) -> tuple:
+    start = time.perf_counter()
+    prompt = LocalMarkdownConverter().prompt_visitor(document)
+    walk_document(document, [prompt])
+    text = '\n\n'.join(block for _, block in prompt.prompt_blocks())
+    return text, time.perf_counter() - start
+
+
+async def model_latency(converter, prompt: str) -> float:
+    start = time.perf_counter()
+    try:
+        await converter.backend.complete(SYSTEM_PROMPT, f"{CONVERT_INSTRUCTION}\n\n{prompt}",
+                                         converter.temperature, converter.max_tokens)
+    except Exception as e:
+        # A truncated or rejected call still measures the prompt's cost
+        print(f"  model call failed: {str(e)[:80]}")
+    return time.perf_counter() - start
+
+
+async def run(documents: list, live: bool):
+    converter = None
+    if live:
+        from app.services.ai_converter import AIConverter
+        os.environ['CONVERSION_CACHE_ENABLED'] = 'false'
+        converter = AIConverter()
+
+    print(f"{'document':32}{'raw JSON':>10}{'previous':>10}{'compact':>10}{'change':>8}{'build ms':>10}"
+          + (f"{'previous s':>12}{'compact s':>11}" if live else ''))
+    total_raw = total_previous = total_compact = 0
+    for document in documents:
+        raw_tokens = estimate_tokens(str(document), MODEL)
+        previous = previous_prompt(document)
+        compact, build = compact_prompt(document)
+        previous_tokens, compact_tokens = estimate_tokens(previous, MODEL), estimate_tokens(compact, MODEL)
+        total_raw += raw_tokens
+        total_previous += previous_tokens
+        total_compact += compact_tokens
+        name = (document.get('title') or document.get('documentId') or '?')[:30]
+        line = (f"{name:32}{raw_tokens:10d}{previous_tokens:10d}{compact_tokens:10d}"
+                f"{compact_tokens / max(previous_tokens, 1) - 1:+8.0%}{build * 1000:10.1f}")
+        if live:
+            line += f"{await model_latency(converter, previous):12.1f}{await model_latency(converter, compact):11.1f}"
+        print(line)
+    print(f"{'total':32}{total_raw:10d}{total_previous:10d}{total_compact:10d}"
+          f"{total_compact / max(total_previous, 1) - 1:+8.0%}")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='*')
+    parser.add_argument('--live', action='store_true', help="also time one model call per prompt")
+    args = parser.parse_args()
+
+    if args.paths:
+        corpus = load_corpus(args.paths)
+    elif os.getenv('DOCUMENT_IDS'):
+        corpus = asyncio.run(fetch_corpus([d.strip() for d in os.environ['DOCUMENT_IDS'].split(',') if d.strip()]))
+    else:
+        corpus = synthetic_corpus()
+    asyncio.run(run(corpus, args.live))
@@ -0,0 +1,85 @@
+"""
+Table conversion benchmark.
+
+Builds a synthetic Google Docs document with N tables (every fifth one with
+merged cells, every seventh one with a nested table) and times the local
+conversion paths that handle them: the deterministic Markdown converter and
+the compact representation used to build model prompts. Neither makes a
+network call, so the numbers are pure CPU time.
+
+Usage:
+    python benchmarks/table_benchmark.py [N] [ROWS] [COLUMNS]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.docs_walker import walk_document
+from app.services.local_converter import LocalMarkdownConverter
+
+
+def _paragraph(text: str, style: str = "NORMAL_TEXT") -> dict:
+    return {"paragraph": {
+        "paragraphStyle": {"namedStyleType": style},
+        "elements": [{"textRun": {"content": f"{text}\n", "textStyle": {}}}]
+    }}
+
+
+def _cell(text: str, row_span: int = 1, column_span: int = 1) -> dict:
+    return {
+        "content": [_paragraph(text)],
+        "tableCellStyle": {"rowSpan": row_span, "columnSpan": column_span}
+    }
+
+
+def _table(index: int, rows: int, columns: int) -> dict:
+    table_rows = []
+    for r in range(rows):
+        cells = [_cell(f"t{index} r{r} c{c} | value") for c in range(columns)]
+        table_rows.append({"tableCells": cells})
+
+    if index % 5 == 0 and rows > 1 and columns > 1:
+        # Merge the first two columns of the header row
+        table_rows[0]["tableCells"][0]["tableCellStyle"]["columnSpan"] = 2
+    if index % 7 == 0:
+        inner = {"tableRows": [{"tableCells": [_cell("inner a"), _cell("inner b")]}]}
+        table_rows[-1]["tableCells"][-1]["content"].append({"table": inner})
+
+    return {"table": {"rows": rows, "columns": columns, "tableRows": table_rows}}
+
+
+def build_document(n: int, rows: int, columns: int) -> dict:
+    content = []
+    for i in range(n):
+        content.append(_paragraph(f"Table {i}", "HEADING_2"))
+        content.append(_paragraph(f"Description of table {i}."))
+        content.append(_table(i, rows, columns))
+    return {"documentId": "bench", "title": "Table Benchmark", "body": {"content": content}}
+
+
+def run(n: int, rows: int, columns: int):
+    document = build_document(n, rows, columns)
+    converter = LocalMarkdownConverter()
+
+    start = time.perf_counter()
+    conversion = converter.convert(document)
+    local = time.perf_counter() - start
+
+    start = time.perf_counter()
+    structure = converter.prompt_visitor(document)
+    walk_document(document, [structure])
+    structure.prompt_blocks()
+    prompt = time.perf_counter() - start
+
+    html_tables = conversion.markdown.count('\n<table>')
+    print(f"{n} tables of {rows}x{columns} cells ({html_tables} rendered as HTML)")
+    print(f"local Markdown conversion: {local * 1000:8.1f} ms ({n / local:8.0f} tables/s)")
+    print(f"prompt representation:     {prompt * 1000:8.1f} ms ({n / prompt:8.0f} tables/s)")
+    print(f"Markdown size:             {len(conversion.markdown):8d} chars, {len(conversion.issues)} issues")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    run(*(args + [500, 10, 6][len(args):]))
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import tempfile
+import logging
+from app.services.assets import AssetStore, ImageAssets, inline_images
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LOGO_URL = "https://example.com/logo.png"
+
+
+def document(doc_id: str, images: dict) -> dict:
+    """Docs API document with one inline image per object ID -> imageProperties"""
+    return {
+        "documentId": doc_id,
+        "inlineObjects": {
+            object_id: {"inlineObjectProperties": {"embeddedObject": {"imageProperties": properties}}}
+            for object_id, properties in images.items()
+        },
+    }
+
+
+class FakeDocsService:
+    """Serves image downloads from memory and records them"""
+
+    def __init__(self):
+        self.downloads = []
+
+    async def download(self, uri: str):
+        self.downloads.append(uri)
+        await asyncio.sleep(0.01)
+        return f"image behind {uri.split('/')[-1]}".encode(), "image/png"
+
+
+async def test_assets():
+    """
+    Images inserted from the same URL are downloaded once across documents,
+    re-cropped copies and uploaded images are downloaded separately, and the
+    store touches the disk only when it is first used
+    """
+    store_path = os.path.join(tempfile.mkdtemp(), "assets")
+    docs_service = FakeDocsService()
+    assets = ImageAssets(docs_service, AssetStore(store_path))
+    assert not os.path.exists(store_path)
+    print("✅ Creating the asset store does not touch the disk")
+
+    # Each fetch of a document signs a different contentUri for the same image
+    first = document("doc-1", {"kix.a1": {"contentUri": "https://lh/1/logo", "sourceUri": LOGO_URL},
+                               "kix.a2": {"contentUri": "https://lh/1/upload"}})
+    second = document("doc-2", {"kix.b1": {"contentUri": "https://lh/2/logo", "sourceUri": LOGO_URL}})
+    stored = await asyncio.gather(assets.fetch("doc-1", inline_images(first)),
+                                  assets.fetch("doc-2", inline_images(second)))
+    logo_downloads = [uri for uri in docs_service.downloads if uri.endswith("logo")]
+    assert len(logo_downloads) == 1, docs_service.downloads
+    assert stored[0]["https://lh/1/logo"] == stored[1]["https://lh/2/logo"], stored
+    print("✅ An image shared by two documents was downloaded once")
+
+    docs_service.downloads.clear()
+    third = document("doc-3", {"kix.c1": {"contentUri": "https://lh/3/logo", "sourceUri": LOGO_URL},
+                               "kix.c2": {"contentUri": "https://lh/3/cropped", "sourceUri": LOGO_URL,
+                                          "cropProperties": {"offsetLeft": 0.1}}})
+    await assets.fetch("doc-3", inline_images(third))
+    assert docs_service.downloads == ["https://lh/3/cropped"], docs_service.downloads
+    print("✅ Stored images were reused and a re-cropped copy was downloaded")
+
+    docs_service.downloads.clear()
+    other = document("doc-4", {"kix.a2": {"contentUri": "https://lh/4/upload"}})
+    await assets.fetch("doc-4", inline_images(other))
+    assert docs_service.downloads == ["https://lh/4/upload"], docs_service.downloads
+    print("✅ Uploaded images without a sourceUri are kept per document")
+
+    markdown, files = await assets.localize("![Logo](https://lh/2/logo)", "docs/guide/page.md", stored[1])
+    assert markdown == f"![Logo](../assets/{stored[1]['https://lh/2/logo']})", markdown
+    assert list(files.values()) == [b"image behind logo"], files
+    print("✅ Image links point at the committed copies")
+    return True
+
+
+if __name__ == "__main__":
+    asyncio.run(test_assets())
@@ -0,0 +1,193 @@
+from typing import Optional
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from google.auth.credentials import AnonymousCredentials
+from app.services.drive_watcher import DriveChangeWatcher
+from app.services.google_docs import GOOGLE_DOC_MIME_TYPE, GoogleDocsService
+from app.services.job_queue import JobQueue
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Changes per changes.list page, small so the watcher has to follow nextPageToken
+CHANGES_PAGE_SIZE = 2
+
+
+class FakeDrive:
+    """
+    In-memory Drive with a change feed, serving the subset of Drive v3 the
+    watcher uses: changes.getStartPageToken, changes.list and files.list
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.changes = []
+        self.clock = 0
+        self._lock = threading.Lock()
+
+    def touch(self, file_id: str, name: Optional[str] = None, mime_type: str = GOOGLE_DOC_MIME_TYPE,
+              parents=None, trashed: bool = False):
+        """Create or modify a file, appending it to the change feed"""
+        with self._lock:
+            self.clock += 1
+            file = self.files.setdefault(file_id, {"id": file_id, "name": name or file_id,
+                                                   "mimeType": mime_type, "parents": parents or ["root"]})
+            file["modifiedTime"] = f"2024-06-01T00:{self.clock // 60:02d}:{self.clock % 60:02d}Z"
+            file["trashed"] = trashed
+            self.changes.append({"fileId": file_id, "removed": False, "time": file["modifiedTime"],
+                                 "file": dict(file)})
+
+    def start_page_token(self):
+        with self._lock:
+            return {"startPageToken": str(len(self.changes) + 1)}
+
+    def list_changes(self, page_token: str):
+        with self._lock:
+            start = int(page_token) - 1
+            page = self.changes[start:start + CHANGES_PAGE_SIZE]
+            response = {"changes": page}
+            if start + CHANGES_PAGE_SIZE < len(self.changes):
+                response["nextPageToken"] = str(start + CHANGES_PAGE_SIZE + 1)
+            else:
+                response["newStartPageToken"] = str(len(self.changes) + 1)
+            return response
+
+    def list_files(self, query: str):
+        since = re.search(r"modifiedTime > '([^']+)'", query)
+        parent = re.search(r"'([^']+)' in parents", query)
+        with self._lock:
+            files = [
+                {"id": f["id"], "name": f["name"], "modifiedTime": f["modifiedTime"]}
+                for f in self.files.values()
+                if f["mimeType"] == GOOGLE_DOC_MIME_TYPE and not f["trashed"]
+                and (not since or f["modifiedTime"] > since.group(1))
+                and (not parent or parent.group(1) in f["parents"])
+            ]
+        return {"files": files}
+
+
+def serve(drive: FakeDrive) -> ThreadingHTTPServer:
+    """Serve drive on a free local port under /drive/v3/"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            if url.path == "/drive/v3/changes/startPageToken":
+                body = drive.start_page_token()
+            elif url.path == "/drive/v3/changes":
+                body = drive.list_changes(params["pageToken"])
+            elif url.path == "/drive/v3/files":
+                body = drive.list_files(params.get("q", ""))
+            else:
+                self.send_error(404)
+                return
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def test_drive_watcher():
+    """
+    Run the Drive change watcher against a local fake Drive server: the first
+    poll syncs documents modified since DRIVE_WATCH_SINCE, later polls queue
+    only the Google Docs changed since the checkpoint, large change bursts
+    are split into capped batches, and concurrent polls never queue the same
+    changes twice
+    """
+    drive = FakeDrive()
+    server = serve(drive)
+    workdir = tempfile.mkdtemp()
+    os.environ["DRIVE_API_ENDPOINT"] = f"http://127.0.0.1:{server.server_port}/drive/v3/"
+    os.environ["GOOGLE_TOKEN_CACHE"] = os.path.join(workdir, "token.json")
+
+    docs_service = GoogleDocsService()
+    # The fake server does not check authorization
+    docs_service.credentials = AnonymousCredentials()
+
+    queued = []
+
+    async def convert_batch(job):
+        queued.append(job.payload["doc_ids"])
+        return {}
+
+    job_queue = JobQueue({"convert_batch": convert_batch}, workers=1)
+    await job_queue.start()
+    watcher = DriveChangeWatcher(docs_service, job_queue,
+                                 checkpoint_path=os.path.join(workdir, "drive_changes.json"),
+                                 since="2024-01-01T00:00:00Z", batch_size=2)
+
+    async def poll(pollers: int = 1):
+        """Poll, possibly concurrently, and wait for the queued jobs to run"""
+        results = await asyncio.gather(*(watcher.poll() for _ in range(pollers)))
+        for result in results:
+            for job_id in result["job_ids"]:
+                while not job_queue.get(job_id).finished:
+                    await asyncio.sleep(0.01)
+        return results
+
+    try:
+        drive.touch("doc-a")
+        drive.touch("sheet-a", mime_type="application/vnd.google-apps.spreadsheet")
+
+        # First run: no checkpoint, documents modified since DRIVE_WATCH_SINCE
+        results = await poll()
+        assert results[0]["documents"] == ["doc-a"], results
+        assert os.path.exists(watcher.checkpoint_path)
+        print("✅ First poll synced documents modified since DRIVE_WATCH_SINCE")
+
+        results = await poll()
+        assert results[0] == {"documents": [], "job_ids": []}, results
+        print("✅ Poll without changes queued nothing")
+
+        # Repeated edits, a spreadsheet and a trashed document across several feed pages
+        drive.touch("doc-b")
+        drive.touch("doc-a")
+        drive.touch("sheet-a", mime_type="application/vnd.google-apps.spreadsheet")
+        drive.touch("doc-c", trashed=True)
+        drive.touch("doc-b")
+        results = await poll()
+        assert results[0]["documents"] == ["doc-b", "doc-a"], results
+        print("✅ Changed Google Docs queued once each, across change feed pages")
+
+        drive.touch("doc-d")
+        results = await poll(2)
+        assert sorted(len(result["documents"]) for result in results) == [0, 1], results
+        assert queued == [["doc-a"], ["doc-b", "doc-a"], ["doc-d"]], queued
+        print("✅ Concurrent polls queued the changes once")
+
+        queued.clear()
+        for doc_id in ("doc-e", "doc-f", "doc-g", "doc-h", "doc-i"):
+            drive.touch(doc_id)
+        results = await poll()
+        assert len(results[0]["job_ids"]) == 3, results
+        assert queued == [["doc-e", "doc-f"], ["doc-g", "doc-h"], ["doc-i"]], queued
+        results = await poll()
+        assert results[0] == {"documents": [], "job_ids": []}, results
+        print("✅ A change burst was queued as capped batches before the checkpoint advanced")
+        return True
+    finally:
+        await job_queue.stop()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(test_drive_watcher())
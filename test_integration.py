@@ -23,7 +23,7 @@ async def run_documentation_update():
         logger.info("\n📄 Step 1: Fetching Google Docs content...")
         docs_service = GoogleDocsService()
         doc_id = os.getenv('DOCUMENT_ID')  # Your test doc
-        doc_content = docs_service.get_document_content(doc_id)
+        doc_content = await docs_service.get_document_content(doc_id)
         logger.info(f"✅ Retrieved document: '{doc_content['title']}'")
 
         # 2. Convert to Markdown